@@ -3,6 +3,8 @@
 ========================== */
 // Global reference to chart
 let winChart = null;
+// Points of a replay_chart event received before Chart.js finished loading
+let pendingReplay = null;
 
 // Load Chart.js from CDN and initialize chart
 document.addEventListener('DOMContentLoaded', () => {
@@ -11,6 +13,10 @@ document.addEventListener('DOMContentLoaded', () => {
     scriptElement.onload = () => {
         if (initChart()){
             console.log("Chart.js loaded and initialized successfully.");
+            if (pendingReplay) {
+                replayChart(pendingReplay);
+                pendingReplay = null;
+            }
         }
         else {
             console.warn("Chart.js initialization failed.");
@@ -161,8 +167,27 @@ socket.on('update_chart', (win_probability) => {
   }
 });
 
+// Redraw the chart of the running match from the server's timeline (sent on page load)
+function replayChart(points) {
+  winChart.data.labels = points.probabilities.map((_, i) => `Event ${i + 1}`);
+  winChart.data.datasets[0].data = points.probabilities.map((p) => (p * 100).toFixed(1));
+  winChart.update();
+}
+
+socket.on('replay_chart', (points) => {
+  // points is {times: [...], probabilities: [...]} with probabilities between 0 and 1
+  console.log(`Received replay_chart event with ${points.probabilities.length} points`);
+  if (winChart) {
+    replayChart(points);
+  }
+  else {
+    pendingReplay = points;
+  }
+});
+
 socket.on('reset_chart', () => {
   console.log('Chart reset event received');
+  pendingReplay = null;
   if (winChart) {
     winChart.data.labels = [];
     winChart.data.datasets[0].data = [];
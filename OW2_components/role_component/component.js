@@ -63,6 +63,7 @@ function handleRulesTableResponse(json) {
     const fullRulesDiv = document.getElementById('full-rules-data');
     if (fullRulesDiv) {
         fullRulesDiv.textContent = JSON.stringify(json.rules);
+        loadedRulesVersion = null;
         // Then update role proportions
         updateRoleProportionsFromHiddenDiv();
     }
@@ -73,15 +74,83 @@ socket.on('team_rules', (data) => {
     handleRulesTableResponse(data);
 })
 
-socket.on('update_hidden_rules_div', (rules) => {
-    // put the rules in the hidden div
-    console.log('Received updated rules:', rules);
+// localStorage keys of the last compact rules payload received and its version
+const RULES_PAYLOAD_KEY = 'ow2_rules_payload';
+const RULES_VERSION_KEY = 'ow2_rules_version';
+// version of the rules currently in the hidden div
+let loadedRulesVersion = null;
+
+/**
+ * Rebuilds the rule records from the compact columnar rules payload:
+ * the items of the lhs of rule i are items[lhs[lhs_offsets[i]:lhs_offsets[i + 1]]], same for rhs.
+ */
+function decodeRulesPayload(payload) {
+    const side = (codes, offsets, i) => codes.slice(offsets[i], offsets[i + 1]).map((code) => payload.items[code]);
+
+    const rules = [];
+    for (let i = 0; i < payload.lift.length; i++) {
+        const lhs = side(payload.lhs, payload.lhs_offsets, i);
+        const rhs = side(payload.rhs, payload.rhs_offsets, i);
+        rules.push({
+            lhs: `{${lhs.join(',')}}`,
+            rhs: `{${rhs.join(',')}}`,
+            support: payload.support[i],
+            confidence: payload.confidence[i],
+            coverage: payload.coverage[i],
+            lift: payload.lift[i],
+            count: payload.count[i],
+            combined: `{${lhs.concat(rhs).sort().join(', ')}}`,
+        });
+    }
+    return rules;
+}
+
+function showRules(rules, version) {
     const fullRulesDiv = document.getElementById('full-rules-data');
     if (fullRulesDiv) {
         fullRulesDiv.textContent = JSON.stringify(rules);
+        loadedRulesVersion = version;
         // Then update role proportions
         updateRoleProportionsFromHiddenDiv();
     }
+}
+
+socket.on('rules_version', (data) => {
+    // skip the download when this tab or an earlier visit already has this version of the rules
+    if (data.version === loadedRulesVersion) return;
+
+    if (localStorage.getItem(RULES_VERSION_KEY) === data.version) {
+        const cached = localStorage.getItem(RULES_PAYLOAD_KEY);
+        if (cached) {
+            try {
+                showRules(decodeRulesPayload(JSON.parse(cached)), data.version);
+                return;
+            } catch (e) {
+                console.error('Error decoding cached rules:', e);
+            }
+        }
+    }
+    socket.emit('request_rules', {version: localStorage.getItem(RULES_VERSION_KEY)});
+});
+
+socket.on('update_hidden_rules_div', (rules) => {
+    // put the rules in the hidden div
+    console.log('Received updated rules');
+    if (typeof rules !== 'string') {
+        // list of rule records
+        showRules(rules, null);
+        return;
+    }
+
+    // compact versioned payload, kept in localStorage for the next page loads
+    const payload = JSON.parse(rules);
+    try {
+        localStorage.setItem(RULES_PAYLOAD_KEY, rules);
+        localStorage.setItem(RULES_VERSION_KEY, payload.version);
+    } catch (e) {
+        console.warn('Could not cache the rules:', e);
+    }
+    showRules(decodeRulesPayload(payload), payload.version);
 });
 
 
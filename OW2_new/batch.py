@@ -0,0 +1,247 @@
+"""Offline batch processing of archived scoreboard screenshots.
+
+Screenshots are sharded across a process pool. Every worker holds its own ImageParser (model and OCR
+engine) and UserPredictor, and results are streamed to CSV or Parquet in bounded chunks, so memory stays flat
+however many screenshots are processed. Re-running with --resume skips screenshots already processed without
+an error in the output; their error rows are dropped from it and written again. Screenshots are unrelated, so
+every screenshot gets its own session and nothing cached for one (portraits, stat cells, positions) is reused
+for another. The metrics endpoint (OW2_METRICS_PORT) is served by the parent process only.
+
+    python -m models.OW2_new.batch "archive/**/*.png" --output results.csv --workers 8 --resume
+
+A .parquet output (requires pyarrow) is written as a directory of part files, one per chunk.
+"""
+
+import argparse
+import csv
+import glob
+import os
+import time
+from multiprocessing import Pool
+
+from models.OW2_new import metrics
+
+STAT_NAMES = ['K', 'A', 'D', 'Damage', 'H', 'MIT']
+COLUMNS = (
+    ["path", "time_in_minutes"]
+    + [f"hero_{i}" for i in range(5)]
+    + [f"{stat}_player{i}" for i in range(10) for stat in STAT_NAMES]
+    + ["probability", "error"]
+)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# per process predictor, created by the pool initializer
+_predictor = None
+_reset_session = None
+
+
+def find_images(source):
+    """
+    List the screenshots of a directory or glob pattern.
+
+    :param source: A directory (searched recursively) or a glob pattern.
+    :return: Sorted list of image paths.
+    """
+    if os.path.isdir(source):
+        pattern = os.path.join(source, "**", "*")
+    else:
+        pattern = source
+    return sorted(
+        path for path in glob.glob(pattern, recursive=True)
+        if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def _init_worker(torch_threads):
+    global _predictor, _reset_session
+    # one intra-op thread per worker process avoids oversubscribing the cores
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    # the metrics endpoint is left to the parent process; the workers would all try to bind its port
+    from models.OW2_new.predictor import UserPredictor, reset_session
+    _predictor = UserPredictor(warm_up=False, start_metrics=False)
+    _reset_session = reset_session
+
+
+def process_image(path):
+    """
+    Extract the stats, composition, time and win probability of one screenshot.
+
+    :param path: Path to the screenshot.
+    :return: A dict with one value per column of COLUMNS.
+    """
+    row = dict.fromkeys(COLUMNS)
+    row["path"] = path
+    try:
+        result = _predictor.get_stats_and_details(path, session=path)
+        if result is None:
+            row["error"] = "unreadable image"
+            return row
+
+        stats, (time_in_minutes, team_composition) = result
+        row["time_in_minutes"] = time_in_minutes
+        for i, hero in enumerate((team_composition or [])[:5]):
+            row[f"hero_{i}"] = hero
+        for i, player_stats in enumerate(stats[:10]):
+            for stat, value in zip(STAT_NAMES, player_stats):
+                row[f"{stat}_player{i}"] = value
+
+        row["probability"] = _predictor.predict_probability(stats, (time_in_minutes, team_composition))
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        _reset_session(path)
+    return row
+
+
+class CsvResultWriter:
+    """Append result rows to a CSV file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def processed_paths(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline="") as f:
+            return {row["path"] for row in csv.DictReader(f) if not row["error"]}
+
+    def drop_errors(self):
+        """Rewrite the file without its error rows, which a resumed run processes again."""
+        if not os.path.exists(self.path):
+            return
+        temp_path = self.path + ".tmp"
+        with open(self.path, newline="") as f, open(temp_path, "w", newline="") as out:
+            writer = csv.DictWriter(out, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(row for row in csv.DictReader(f) if not row["error"])
+        os.replace(temp_path, self.path)
+
+    def write(self, rows):
+        write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+class ParquetResultWriter:
+    """Write result rows as a directory of Parquet part files (one per chunk)."""
+
+    def __init__(self, path):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def processed_paths(self):
+        paths = set()
+        for part in self._parts():
+            table = self.pq.read_table(part, columns=["path", "error"]).to_pydict()
+            paths.update(path for path, error in zip(table["path"], table["error"]) if not error)
+        return paths
+
+    def drop_errors(self):
+        """Rewrite the part files that have error rows without them (deleting parts left empty)."""
+        for part in self._parts():
+            table = self.pq.read_table(part)
+            errors = table.column("error").to_pylist()
+            if not any(errors):
+                continue
+            kept = table.filter(self.pa.array([not error for error in errors]))
+            if kept.num_rows:
+                self.pq.write_table(kept, part + ".tmp")
+                os.replace(part + ".tmp", part)
+            else:
+                os.remove(part)
+
+    def write(self, rows):
+        columns = {column: [row[column] for row in rows] for column in COLUMNS}
+        table = self.pa.table({
+            column: self.pa.array(values, type=self.pa.string()) if column.startswith(("path", "hero", "error"))
+            else self.pa.array(values, type=self.pa.float64())
+            for column, values in columns.items()
+        })
+        # parts may have been deleted by drop_errors, so number after the last one
+        parts = self._parts()
+        number = int(os.path.basename(parts[-1])[len("part-"):-len(".parquet")]) + 1 if parts else 0
+        part = os.path.join(self.path, f"part-{number:05d}.parquet")
+        self.pq.write_table(table, part)
+
+
+def create_writer(output):
+    if output.endswith(".parquet"):
+        return ParquetResultWriter(output)
+    return CsvResultWriter(output)
+
+
+def run_batch(source, output, workers=None, chunk_size=200, resume=False, torch_threads=1):
+    """
+    Process every screenshot in source and stream the results to output.
+
+    :param source: Directory or glob pattern of screenshots.
+    :param output: Output file (.csv) or directory (.parquet).
+    :param workers: Number of worker processes (defaults to the number of cores).
+    :param chunk_size: Number of results buffered before they are written.
+    :param resume: If True, skip screenshots already processed without an error in the output, and replace the
+        error rows of the others.
+    :param torch_threads: Torch intra-op threads per worker.
+    :return: Number of screenshots processed in this run.
+    """
+    writer = create_writer(output)
+    paths = find_images(source)
+    if resume:
+        done = writer.processed_paths()
+        paths = [path for path in paths if path not in done]
+        writer.drop_errors()
+    elif os.path.exists(output) and (not os.path.isdir(output) or os.listdir(output)):
+        raise FileExistsError(f"{output} already exists; use --resume to continue it or choose another output.")
+
+    # the parent serves the metrics endpoint (the batch progress); the workers do not start it
+    metrics.start_from_environment()
+    print(f"Processing {len(paths)} screenshots with {workers or os.cpu_count()} workers")
+    start = time.perf_counter()
+    processed = 0
+    buffer = []
+    with Pool(processes=workers, initializer=_init_worker, initargs=(torch_threads,)) as pool:
+        for row in pool.imap_unordered(process_image, paths, chunksize=4):
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                writer.write(buffer)
+                processed += len(buffer)
+                metrics.increment("batch_screenshots", len(buffer))
+                buffer = []
+                elapsed = time.perf_counter() - start
+                print(f"{processed}/{len(paths)} screenshots ({processed / elapsed:.1f}/s)")
+
+    if buffer:
+        writer.write(buffer)
+        processed += len(buffer)
+        metrics.increment("batch_screenshots", len(buffer))
+
+    print(f"Processed {processed} screenshots in {time.perf_counter() - start:.1f}s")
+    return processed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process a directory of scoreboard screenshots.")
+    parser.add_argument("source", help="Directory (searched recursively) or glob pattern of screenshots.")
+    parser.add_argument("--output", required=True, help="Output .csv file or .parquet directory.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Results buffered per write.")
+    parser.add_argument("--resume", action="store_true", help="Skip screenshots already in the output.")
+    parser.add_argument("--torch-threads", type=int, default=1, help="Torch threads per worker.")
+    args = parser.parse_args()
+
+    run_batch(args.source, args.output, args.workers, args.chunk_size, args.resume, args.torch_threads)
@@ -0,0 +1,370 @@
+"""Reproducible latency benchmark of the screenshot pipeline, with regression budgets.
+
+Every case runs over the sample screenshots and synthetic variants of them (noise, JPEG recompression, 720p and
+1440p), first as the full path (get_stats_and_details + predict_probability + get_rules_table, once with cold
+session caches and once in the steady state of a match) and then stage by stage in isolation. It reports
+latency percentiles and throughput per stage and variant plus the peak RSS, writes them as JSON and exits
+with status 1 when a stage exceeds its budget or regresses against a baseline result file, or when a variant
+of a screenshot yields other stats or composition than the original screenshot.
+
+    python -m models.OW2_new.benchmark --images "sample_images/*.png" --output bench.json \
+        --budgets models/OW2_new/benchmark_budgets.json --baseline previous_bench.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_BUDGETS_PATH = "models/OW2_new/benchmark_budgets.json"
+VARIANTS = ("original", "noise", "jpeg", "720p", "1440p")
+BASELINE_VARIANT = "original"
+FULL_PATH_STAGES = ("full_path_cold", "full_path_warm")
+STAGES = ("decode", "process_image", "prepare_sub_images", "classify_portraits", "stat_ocr", "timer_read",
+          "header_ocr", "pipeline_predict", "rules_table")
+
+
+def make_variant(image, variant, seed=0):
+    """
+    Create a synthetic variant of a 1080p screenshot.
+
+    :param image: BGR screenshot.
+    :param variant: One of VARIANTS.
+    :return: The BGR variant.
+    """
+    if variant == "original":
+        return image
+    if variant == "noise":
+        noise = np.random.default_rng(seed).normal(0, 8, image.shape)
+        return np.clip(image + noise, 0, 255).astype(np.uint8)
+    if variant == "jpeg":
+        _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    if variant in ("720p", "1440p"):
+        height = int(variant[:-1])
+        width = round(image.shape[1] * height / image.shape[0])
+        interpolation = cv2.INTER_AREA if height < image.shape[0] else cv2.INTER_CUBIC
+        return cv2.resize(image, (width, height), interpolation=interpolation)
+    raise ValueError(f"Unknown variant: {variant}. Expected one of {VARIANTS}.")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(durations):
+    """Latency percentiles (ms) and throughput (per second) of a list of durations in seconds."""
+    durations = np.asarray(durations)
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1000
+    return {
+        "count": len(durations),
+        "mean_ms": float(durations.mean() * 1000),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(durations.max() * 1000),
+        "throughput_per_s": float(len(durations) / durations.sum()) if durations.sum() > 0 else None,
+    }
+
+
+def measure(func, repeats, warmup=1, setup=None):
+    """
+    Time repeated calls of func.
+
+    :param func: Callable taking the value returned by setup (or nothing).
+    :param repeats: Number of timed calls.
+    :param warmup: Number of untimed calls first.
+    :param setup: Optional untimed callable run before every call.
+    :return: List of durations in seconds.
+    """
+    durations = []
+    for i in range(warmup + repeats):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            durations.append(elapsed)
+    return durations
+
+
+class Benchmark:
+    """Runs the full path and the isolated stages over a set of screenshots."""
+
+    def __init__(self, image_paths, variants=VARIANTS, repeats=10, stages=FULL_PATH_STAGES + STAGES):
+        from models.OW2_new.events_handler import UserEventsHandler
+        from models.OW2_new.predictor import UserPredictor, get_classifier
+
+        self.variants = variants
+        self.repeats = repeats
+        self.stages = stages
+        self.predictor = UserPredictor(warm_up=False)
+        self.classifier = get_classifier()
+        self.events_handler = UserEventsHandler()
+
+        # every variant of every sample, as the PNG bytes a client would upload
+        self.cases = []
+        for path in image_paths:
+            image = cv2.imread(path)
+            if image is None:
+                raise ValueError(f"Unable to load image at path: {path}")
+            for variant in variants:
+                _, encoded = cv2.imencode(".png", make_variant(image, variant))
+                self.cases.append((os.path.basename(path), variant, encoded))
+
+    def _decode(self, encoded, session=None):
+        from models.OW2_new.image_utils import Frame
+        return Frame(cv2.imdecode(encoded, cv2.IMREAD_COLOR), session=session)
+
+    def _reset(self, session):
+        self.classifier.reset_session(session)
+        self.events_handler.clear_rules_table_cache()
+
+    def full_path(self, encoded, session):
+        """One screenshot through the whole pipeline, as the app runs it."""
+        stats, game_details = self.predictor.get_stats_and_details(self._decode(encoded, session), session=session)
+        time_in_minutes, team_composition = game_details
+        probability = self.predictor.predict_probability(stats, game_details)
+        statuses = self.events_handler.calculate_team_statuses(stats)
+        return self.events_handler.get_rules_table(team_composition, statuses, probability or 0.5)
+
+    def output(self, encoded, session):
+        """The stats and team composition read from a screenshot with cold session caches."""
+        self._reset(session)
+        stats, (_, team_composition) = self.predictor.get_stats_and_details(self._decode(encoded, session),
+                                                                            session=session)
+        return {"stats": [list(row) for row in stats], "team_composition": list(team_composition or [])}
+
+    def check_outputs(self):
+        """
+        Compare the output of every variant of a screenshot against its BASELINE_VARIANT output.
+
+        :return: Dict of sample -> variant -> {"stats": ..., "team_composition": ...}, and the list of mismatch
+            messages.
+        """
+        outputs, mismatches = {}, []
+        for sample, variant, encoded in self.cases:
+            session = f"benchmark-output-{sample}-{variant}"
+            try:
+                outputs.setdefault(sample, {})[variant] = self.output(encoded, session)
+            except Exception as e:
+                mismatches.append(f"{sample} {variant}: failed ({type(e).__name__}: {e})")
+            finally:
+                self._reset(session)
+
+        for sample, by_variant in outputs.items():
+            expected = by_variant.get(BASELINE_VARIANT)
+            if expected is None:
+                continue
+            for variant, output in by_variant.items():
+                if output["team_composition"] != expected["team_composition"]:
+                    mismatches.append(f"{sample} {variant}: team composition {output['team_composition']} differs "
+                                      f"from {expected['team_composition']}")
+                if np.shape(output["stats"]) != np.shape(expected["stats"]):
+                    mismatches.append(f"{sample} {variant}: {len(output['stats'])} stat rows instead of "
+                                      f"{len(expected['stats'])}")
+                    continue
+                for row, column in np.argwhere(np.array(output["stats"]) != np.array(expected["stats"])):
+                    mismatches.append(f"{sample} {variant}: stat [{row}][{column}] is "
+                                      f"{output['stats'][row][column]} instead of {expected['stats'][row][column]}")
+        return outputs, mismatches
+
+    def stage_cases(self, encoded):
+        """Callables of every isolated stage, each with its untimed setup."""
+        from models.OW2_new.image_utils import prepare_sub_images, process_image
+        from models.OW2_new.predictor import convert_stats_to_int
+
+        frame = self._decode(encoded)
+        processed = frame.processed
+        stat_images = frame.stat_images
+        stats = convert_stats_to_int(self.classifier.extract_text_from_stats(stat_images))
+        details = (5.0, [f"label_{hero}" for hero in list(self.events_handler.rule_index.hero_ids)[:5]])
+        statuses = self.events_handler.calculate_team_statuses(stats)
+        heroes = ['_'.join(player.split('_')[1:]) for player in details[1]]
+
+        def stat_ocr_setup():
+            # no cached cells from the previous call
+            self.classifier.reset_session(None)
+
+        return {
+            "decode": (lambda: cv2.imdecode(encoded, cv2.IMREAD_COLOR), None),
+            "process_image": (lambda: process_image(frame.gray), None),
+            "prepare_sub_images": (lambda: prepare_sub_images(processed), None),
+            "classify_portraits": (lambda: self.classifier.predict(frame.portraits), None),
+            "stat_ocr": (lambda _: self.classifier.extract_text_from_stats(stat_images), stat_ocr_setup),
+            "timer_read": (lambda: self.classifier.timer_reader.read(frame.header), None),
+            "header_ocr": (lambda: self.classifier.ocr_engine.image_to_string(frame.header, config="--oem 3 --psm 6"),
+                           None),
+            "pipeline_predict": (lambda: self.predictor.predict_probability(stats, details), None),
+            "rules_table": (lambda: self.events_handler.build_rules_table(heroes, statuses, 1), None),
+        }
+
+    def run(self):
+        """
+        Run every stage over every case.
+
+        :return: Dict of stage -> variant ("all" for every variant together) -> summary, and the stage errors.
+        """
+        durations = {stage: {} for stage in self.stages}
+        errors = {}
+
+        for sample, variant, encoded in self.cases:
+            session = f"benchmark-{sample}-{variant}"
+            runs = {}
+            if "full_path_cold" in self.stages:
+                runs["full_path_cold"] = lambda: measure(lambda _: self.full_path(encoded, session), self.repeats,
+                                                         setup=lambda: self._reset(session))
+            if "full_path_warm" in self.stages:
+                runs["full_path_warm"] = lambda: measure(lambda: self.full_path(encoded, session), self.repeats)
+            try:
+                isolated = self.stage_cases(encoded)
+            except Exception as e:
+                isolated = {}
+                for stage in self.stages:
+                    if stage in STAGES:
+                        errors.setdefault(stage, f"{type(e).__name__}: {e}")
+            for stage, (func, setup) in isolated.items():
+                if stage in self.stages:
+                    runs[stage] = lambda func=func, setup=setup: measure(func, self.repeats, setup=setup)
+
+            for stage, run in runs.items():
+                try:
+                    values = run()
+                    durations[stage].setdefault(variant, []).extend(values)
+                except Exception as e:
+                    errors.setdefault(stage, f"{type(e).__name__}: {e}")
+            self._reset(session)
+
+        results = {}
+        for stage, by_variant in durations.items():
+            if not by_variant:
+                continue
+            results[stage] = {variant: summarize(values) for variant, values in by_variant.items()}
+            results[stage]["all"] = summarize([value for values in by_variant.values() for value in values])
+        return results, errors
+
+
+def environment():
+    info = {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "numpy": np.__version__, "opencv": cv2.__version__}
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def check_budgets(results, errors, peak_rss, budgets, baseline=None, max_regression=None):
+    """
+    Compare results against the budgets and an optional baseline result file.
+
+    :param budgets: Dict with "stages" (stage -> {"p50_ms"/"p95_ms"/"p99_ms": limit}) and optional "peak_rss_mb".
+    :param baseline: Results dict of an earlier run.
+    :param max_regression: Allowed relative p50 increase over the baseline per stage (e.g. 0.2).
+    :return: List of violation messages.
+    """
+    violations = []
+    for stage, limits in budgets.get("stages", {}).items():
+        if stage in errors:
+            violations.append(f"{stage}: failed ({errors[stage]})")
+            continue
+        if stage not in results:
+            continue
+        for metric, limit in limits.items():
+            value = results[stage]["all"][metric]
+            if value > limit:
+                violations.append(f"{stage}: {metric} {value:.2f} exceeds the budget of {limit:.2f}")
+
+    rss_budget = budgets.get("peak_rss_mb")
+    if rss_budget is not None and peak_rss > rss_budget:
+        violations.append(f"peak RSS {peak_rss:.0f} MB exceeds the budget of {rss_budget:.0f} MB")
+
+    if baseline is not None and max_regression is not None:
+        for stage, by_variant in baseline.get("stages", {}).items():
+            if stage not in results:
+                continue
+            before, after = by_variant["all"]["p50_ms"], results[stage]["all"]["p50_ms"]
+            if after > before * (1 + max_regression):
+                violations.append(f"{stage}: p50 {after:.2f} ms regressed from {before:.2f} ms "
+                                  f"(more than {max_regression:.0%})")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the screenshot pipeline.")
+    parser.add_argument("--images", default="sample_images/*.png", help="Glob of 1080p sample screenshots.")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="Comma separated variants.")
+    parser.add_argument("--stages", default=",".join(FULL_PATH_STAGES + STAGES), help="Comma separated stages.")
+    parser.add_argument("--repeats", type=int, default=10, help="Timed runs per stage and screenshot.")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file.")
+    parser.add_argument("--budgets", default=None, help=f"Budgets JSON (e.g. {DEFAULT_BUDGETS_PATH}).")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p50 increase over the baseline.")
+    parser.add_argument("--ocr-backend", default=None, help="ImageParser ocr_backend.")
+    parser.add_argument("--inference-backend", default=None, help="ImageParser inference_backend.")
+    parser.add_argument("--model", default=None, help="Classifier model file.")
+    args = parser.parse_args()
+
+    from models.OW2_new.predictor import configure_classifier
+
+    options = {"ocr_backend": args.ocr_backend, "inference_backend": args.inference_backend,
+               "model_path": args.model}
+    configure_classifier(**{key: value for key, value in options.items() if value is not None})
+
+    image_paths = sorted(glob.glob(args.images))
+    if not image_paths:
+        raise SystemExit(f"No screenshots match {args.images}")
+
+    benchmark = Benchmark(image_paths, variants=args.variants.split(","), repeats=args.repeats,
+                          stages=tuple(args.stages.split(",")))
+    results, errors = benchmark.run()
+    outputs, mismatches = benchmark.check_outputs()
+    peak_rss = peak_rss_mb()
+
+    budgets = {}
+    if args.budgets:
+        with open(args.budgets) as f:
+            budgets = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    violations = check_budgets(results, errors, peak_rss, budgets, baseline, args.max_regression)
+    violations += [f"output: {mismatch}" for mismatch in mismatches]
+
+    print(f"{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>10}")
+    for stage, by_variant in results.items():
+        summary = by_variant["all"]
+        print(f"{stage:<22}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}"
+              f"{summary['throughput_per_s'] or 0:>10.1f}")
+    for stage, error in errors.items():
+        print(f"{stage:<22}failed: {error}")
+    print(f"peak RSS: {peak_rss:.0f} MB")
+
+    if args.output:
+        report = {"environment": environment(), "images": image_paths, "variants": benchmark.variants,
+                  "repeats": args.repeats, "stages": results, "errors": errors, "outputs": outputs,
+                  "peak_rss_mb": peak_rss, "violations": violations}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if violations:
+        for violation in violations:
+            print(f"BUDGET VIOLATION: {violation}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
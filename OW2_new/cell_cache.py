@@ -0,0 +1,82 @@
+"""Per-session cache of OCR'd stat cells, used to only re-read cells that changed between screenshots."""
+
+import threading
+
+import numpy as np
+
+
+class CellCache:
+    """
+    Remember the stat cells of the previous screenshot of a session and their recognised text.
+
+    A cell is considered unchanged when at most max_changed_pixels of its pixels differ by more than
+    pixel_tolerance from the same cell in the previous screenshot; its cached text is then reused.
+
+    Callers hold ``lock`` from changed_cells until store, so two screenshots of a session are never compared
+    against the same previous screenshot or stored out of order:
+
+        with cache.lock:
+            changed = cache.changed_cells(batch)
+            ...
+            cache.store(batch, texts, changed)
+    """
+
+    def __init__(self, pixel_tolerance=32, max_changed_pixels=3):
+        """
+        :param pixel_tolerance: Per-pixel absolute difference ignored as noise.
+        :param max_changed_pixels: Number of differing pixels a cell may have and still count as unchanged.
+        """
+        self.pixel_tolerance = pixel_tolerance
+        self.max_changed_pixels = max_changed_pixels
+
+        self._cells = None
+        self._texts = None
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def changed_cells(self, batch):
+        """
+        Compare stacked cells against the previous screenshot.
+
+        :param batch: Cells stacked with image_utils.stack_cells, shape (N, H, W).
+        :return: Boolean array of shape (N,), True for cells that must be OCR'd again.
+        """
+        with self.lock:
+            previous = self._cells
+            if previous is None or previous.shape != batch.shape:
+                return np.ones(len(batch), dtype=bool)
+
+            # int16 so the uint8 difference does not wrap around; works for any cell width
+            diff = np.abs(batch.astype(np.int16) - previous.astype(np.int16)) > self.pixel_tolerance
+            return diff.reshape(len(batch), -1).sum(axis=1) > self.max_changed_pixels
+
+    def cached_text(self, index):
+        with self.lock:
+            return self._texts[index]
+
+    def store(self, batch, texts, changed):
+        """
+        Remember the cells and texts of the current screenshot.
+
+        :param batch: Stacked cells of shape (N, H, W).
+        :param texts: Recognised text of every cell.
+        :param changed: Boolean mask returned by changed_cells.
+        """
+        with self.lock:
+            self._cells = batch
+            self._texts = list(texts)
+            n_changed = int(np.count_nonzero(changed))
+            self.misses += n_changed
+            self.hits += len(changed) - n_changed
+
+    def clear(self):
+        with self.lock:
+            self._cells = None
+            self._texts = None
+
+    def stats(self):
+        """Return the number of reused (hits) and re-OCR'd (misses) cells."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -1,78 +1,200 @@
-"""This module contains custom transformers for the Overwatch 2 dataset."""
+"""This module contains custom transformers for the Overwatch 2 dataset.
+
+Every transformer accepts the DataFrames the pipeline was trained on, or plain float ndarrays whose column
+layout is given by the ``columns`` parameter (INPUT_COLUMNS for the per-player rows, pivot_columns() for the
+pivoted rows). With ``copy=False`` the per-player transformers (scaling, capping, resetting) modify their
+input in place instead of allocating a new frame per step; DataPivoter and FeatureEngineer never copy their
+input and build their output in a single step.
+"""
+
+import inspect
+from functools import lru_cache
 
 import numpy as np
+import pandas as pd
 from sklearn.base import BaseEstimator, TransformerMixin
 
-class FeatureScaler(BaseEstimator, TransformerMixin):
-    def __init__(self, features_to_scale=None):
+STAT_NAMES = ['K', 'A', 'D', 'Damage', 'H', 'MIT']
+# column layout of ndarray inputs: one row per player and snapshot, as built by predictor.stats_to_dataframe
+INPUT_COLUMNS = STAT_NAMES + ['Time', 'SnapID', 'PlayerID']
+N_PLAYERS = 10
+
+# Upper bound of every per-minute stat (columns, in STAT_NAMES order) for every PlayerID (rows)
+PLAYER_CAPS = np.full((N_PLAYERS, len(STAT_NAMES)), np.inf)
+PLAYER_CAPS[:, 0] = 5
+PLAYER_CAPS[:, 1] = 4
+PLAYER_CAPS[:, 2] = 3
+PLAYER_CAPS[:, 3] = 2500
+PLAYER_CAPS[0, 4] = 600
+PLAYER_CAPS[1:3, 4] = 400
+PLAYER_CAPS[3, 4] = 2500
+PLAYER_CAPS[:, 5] = 2500
+
+# pivoted columns removed by FeatureEngineer, either unused or combined into the role features
+ENGINEERED_DROPPED_COLUMNS = frozenset([
+    'Damage_player0', 'MIT_player0', 'MIT_player1', 'MIT_player2', 'MIT_player3', 'MIT_player4',
+    'A_player1', 'A_player2', 'A_player3', 'A_player4',
+    'Damage_player1', 'Damage_player2', 'Damage_player3', 'Damage_player4'
+])
+
+
+def pivot_columns(player_features=STAT_NAMES, n_players=N_PLAYERS):
+    """Names of the DataPivoter output columns, in the order pivot_table produces them."""
+    return [f"{feature}_player{player}" for feature in sorted(player_features) for player in range(n_players)]
+
+
+@lru_cache(maxsize=None)
+def _column_indices(columns, names):
+    return np.array([columns.index(name) for name in names])
+
+
+def column_indices(columns, names):
+    """Indices of names in the column layout of an ndarray input, computed once per layout."""
+    return _column_indices(tuple(columns), tuple(names))
+
+
+def player_caps(player_ids):
+    """Upper bounds of the stats of each row, shape (len(player_ids), 6). Unknown PlayerIDs are only capped
+    like the players without a healing cap."""
+    player_ids = np.asarray(player_ids)
+    known = (player_ids >= 0) & (player_ids < N_PLAYERS)
+    return PLAYER_CAPS[np.where(known, player_ids, N_PLAYERS - 1).astype(int)]
+
+
+def engineered_columns(X, input_columns):
+    """
+    Compute the FeatureEngineer output columns.
+
+    :param X: Mapping of pivoted column name to 1-D values (a DataFrame or a dict of arrays).
+    :param input_columns: Names of the pivoted columns, in order.
+    :return: Dict of output column name to values, in FeatureEngineer's column order.
+    """
+    columns = {name: X[name] for name in input_columns if name not in ENGINEERED_DROPPED_COLUMNS}
+
+    # Feature Engineering: tank_ratio and support_ratio
+    tank_ratio = X['K_player0'] / (X['K_player0'] + np.sqrt(X['MIT_player0'] + 1e-6))
+    support_damage = X['Damage_player3'] + X['Damage_player4']
+    support_ratio = support_damage / (support_damage + X['H_player3'] + X['H_player4'] + 1e-6)
+
+    columns['tank_status'] = np.select([tank_ratio <= 0.05, tank_ratio < 0.08], ['poor', 'average'],
+                                       default='good')
+    columns['support_status'] = np.select([support_ratio < 0.14, support_ratio <= 0.32], ['poor', 'average'],
+                                          default='good')
+
+    # Combine Damage, Assists, and Support Healing
+    columns['A_dps'] = X['A_player1'] + X['A_player2']
+    columns['A_support'] = X['A_player3'] + X['A_player4']
+    columns['Damage_support'] = support_damage
+    columns['Damage_dps'] = support_damage  # Note: Same as Damage_support?
+    return columns
+
+
+def _float_array(X, copy):
+    # in place arithmetic needs a float array; integer inputs are always converted (and so copied)
+    if copy:
+        return np.array(X, dtype=np.float64)
+    return np.asarray(X, dtype=np.float64)
+
+
+class ParameterDefaultsMixin:
+    """Give transformers unpickled from before a parameter existed that parameter's default value."""
+
+    def __setstate__(self, state):
+        for name, parameter in inspect.signature(type(self).__init__).parameters.items():
+            if name != "self" and name not in state:
+                state[name] = parameter.default
+        super().__setstate__(state)
+
+
+class FeatureScaler(ParameterDefaultsMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, features_to_scale=None, copy=True, columns=None):
         if features_to_scale is None:
             self.features_to_scale = ['K', 'A', 'D', 'Damage', 'H', 'MIT']
         else:
             self.features_to_scale = features_to_scale
+        self.copy = copy
+        self.columns = columns
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
-        for feature in self.features_to_scale:
-            X[feature] = X[feature] / X['Time']
+        if isinstance(X, np.ndarray):
+            X = _float_array(X, self.copy)
+            columns = self.columns or INPUT_COLUMNS
+            features = column_indices(columns, self.features_to_scale)
+            X[:, features] /= X[:, column_indices(columns, ['Time'])]
+            return X
+
+        if self.copy:
+            X = X.copy()
+        X[self.features_to_scale] = X[self.features_to_scale].div(X['Time'], axis=0)
         return X
 
-class CappingFeatureValues(BaseEstimator, TransformerMixin):
-    def __init__(self):
-        pass
+class CappingFeatureValues(ParameterDefaultsMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True, columns=None):
+        self.copy = copy
+        self.columns = columns
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
-
-        # Cap K, A, D, Damage, H, MIT based on PlayerID
-        X['K'] = X['K'].clip(upper=5)
-        X['A'] = X['A'].clip(upper=4)
-        X['D'] = X['D'].clip(upper=3)
-        X['Damage'] = X['Damage'].clip(upper=2500)
-
-        # Cap H based on PlayerID
-        X.loc[X['PlayerID'] == 0, 'H'] = X.loc[X['PlayerID'] == 0, 'H'].clip(upper=600)
-        X.loc[X['PlayerID'].isin([1, 2]), 'H'] = X.loc[X['PlayerID'].isin([1, 2]), 'H'].clip(upper=400)
-        X.loc[X['PlayerID'] == 3, 'H'] = X.loc[X['PlayerID'] == 3, 'H'].clip(upper=2500)
-        # If PlayerID >3, handle accordingly if needed
-
-        X['MIT'] = X['MIT'].clip(upper=2500)
+        # Cap K, A, D, Damage, H, MIT based on PlayerID, with one upper bound per row and stat
+        if isinstance(X, np.ndarray):
+            X = _float_array(X, self.copy)
+            columns = self.columns or INPUT_COLUMNS
+            stats = column_indices(columns, STAT_NAMES)
+            player_ids = X[:, column_indices(columns, ['PlayerID'])[0]]
+            X[:, stats] = np.minimum(X[:, stats], player_caps(player_ids))
+            return X
+
+        if self.copy:
+            X = X.copy()
+        X[STAT_NAMES] = np.minimum(X[STAT_NAMES].to_numpy(dtype=np.float64), player_caps(X['PlayerID']))
         return X
 
-class FeatureResetter(BaseEstimator, TransformerMixin):
-    def __init__(self, features_to_reset=None):
+class FeatureResetter(ParameterDefaultsMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, features_to_reset=None, copy=True, columns=None):
         if features_to_reset is None:
             self.features_to_reset = ['K', 'A', 'D', 'Damage', 'H', 'MIT']
         else:
             self.features_to_reset = features_to_reset
+        self.copy = copy
+        self.columns = columns
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
-        for feature in self.features_to_reset:
-            X[feature] = X[feature] * X['Time']
+        if isinstance(X, np.ndarray):
+            X = _float_array(X, self.copy)
+            columns = self.columns or INPUT_COLUMNS
+            features = column_indices(columns, self.features_to_reset)
+            X[:, features] *= X[:, column_indices(columns, ['Time'])]
+            return X
+
+        if self.copy:
+            X = X.copy()
+        X[self.features_to_reset] = X[self.features_to_reset].mul(X['Time'], axis=0)
         return X
 
-class DataPivoter(BaseEstimator, TransformerMixin):
-    def __init__(self, player_features=None):
+class DataPivoter(ParameterDefaultsMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, player_features=None, columns=None):
         if player_features is None:
             self.player_features = ['K', 'A', 'D', 'Damage', 'H', 'MIT']
         else:
             self.player_features = player_features
+        self.columns = columns
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        # Pivot the data
-        X = X.copy()
+        # Pivot the data (pivot_table never modifies its input, so no copy is needed)
+        if isinstance(X, np.ndarray):
+            return self._pivot_array(X)
+
         cleaned_data = X.pivot_table(
             index=['SnapID'],
             columns='PlayerID',
@@ -84,59 +206,39 @@ class DataPivoter(BaseEstimator, TransformerMixin):
         cleaned_data = cleaned_data.fillna(0)
         return cleaned_data
 
-class FeatureEngineer(BaseEstimator, TransformerMixin):
-    def __init__(self):
-        pass
+    def _pivot_array(self, X):
+        """
+        Pivot an ndarray into one row per SnapID (sorted) with the columns of pivot_columns(player_features).
+
+        Unlike pivot_table, every PlayerID 0-9 gets its columns, missing players are filled with 0 and a
+        repeated (SnapID, PlayerID) keeps its last row instead of the mean.
+        """
+        columns = self.columns or INPUT_COLUMNS
+        features = column_indices(columns, sorted(self.player_features))
+        snap_ids = X[:, column_indices(columns, ['SnapID'])[0]]
+        player_ids = X[:, column_indices(columns, ['PlayerID'])[0]].astype(int)
+
+        _, rows = np.unique(snap_ids, return_inverse=True)
+        pivoted = np.zeros((rows.max() + 1 if len(rows) else 0, len(features), N_PLAYERS))
+        pivoted[rows, :, player_ids] = X[:, features]
+        return np.nan_to_num(pivoted, nan=0.0).reshape(len(pivoted), -1)
+
+class FeatureEngineer(ParameterDefaultsMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, columns=None):
+        self.columns = columns
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        # The output mixes numeric and status columns, so it is always a new DataFrame built in one step;
+        # ndarray inputs use the column layout of DataPivoter
+        if isinstance(X, np.ndarray):
+            input_columns = self.columns or pivot_columns()
+            X = {name: X[:, i] for i, name in enumerate(input_columns)}
+            return pd.DataFrame(engineered_columns(X, input_columns))
 
-        # Feature Engineering: tank_ratio and support_ratio
-        X['tank_ratio'] = X['K_player0'] / (X['K_player0'] + np.sqrt(X['MIT_player0'] + 1e-6))
-        X['support_ratio'] = (X['Damage_player3'] + X['Damage_player4']) / (
-            X['Damage_player3'] + X['Damage_player4'] +
-            X['H_player3'] + X['H_player4'] + 1e-6
-        )
-
-        # Define tank_status
-        conditions_tank = [
-            (X['tank_ratio'] <= 0.05),
-            (X['tank_ratio'] < 0.08)
-        ]
-        choices_tank = ['poor', 'average']
-        X['tank_status'] = np.select(conditions_tank, choices_tank, default='good')
-
-        # Define support_status
-        conditions_support = [
-            (X['support_ratio'] < 0.14),
-            (X['support_ratio'] <= 0.32)
-        ]
-        choices_support = ['poor', 'average']
-        X['support_status'] = np.select(conditions_support, choices_support, default='good')
-
-        X = X.drop(columns=['tank_ratio', 'support_ratio'], errors='ignore')
-
-        # Remove specific columns
-        columns_to_drop = [
-            'Damage_player0', 'MIT_player0', 'MIT_player1', 'MIT_player2', 'MIT_player3', 'MIT_player4'
-        ]
-        X = X.drop(columns=columns_to_drop, errors='ignore')
-
-        # Combine Damage, Assists, and Support Healing
-        X['A_dps'] = X['A_player1'] + X['A_player2']
-        X['A_support'] = X['A_player3'] + X['A_player4']
-        X['Damage_support'] = X['Damage_player3'] + X['Damage_player4']
-        X['Damage_dps'] = X['Damage_player3'] + X['Damage_player4']  # Note: Same as Damage_support?
-        columns_to_drop_combined = [
-            'A_player1', 'A_player2', 'A_player3', 'A_player4',
-            'Damage_player1', 'Damage_player2', 'Damage_player3', 'Damage_player4'
-        ]
-        X = X.drop(columns=columns_to_drop_combined, errors='ignore')
-
-        return X
+        return pd.DataFrame(engineered_columns(X, X.columns), index=X.index)
 
 class FinalDataCleaner(BaseEstimator, TransformerMixin):
     def __init__(self):
@@ -148,4 +250,4 @@ class FinalDataCleaner(BaseEstimator, TransformerMixin):
     def transform(self, X):
         # Example: Drop any remaining unwanted columns
         # Modify as needed
-        return X
\ No newline at end of file
+        return X
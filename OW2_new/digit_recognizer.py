@@ -0,0 +1,249 @@
+"""Built-in recognizer for the numeric scoreboard stat cells.
+
+The stat cells only contain digits (and thousands separators) in one fixed in-game font, so instead of
+running general OCR the recognizer segments every cell into glyphs with column projections and classifies
+all glyphs of a screenshot at once by normalised correlation against one template per digit.
+
+Templates are stored in ``digit_templates.npz`` and can be rebuilt from labelled screenshots:
+
+    python -m models.OW2_new.digit_recognizer build labels.json
+
+where labels.json maps screenshot paths to their 10x6 stats (K, A, D, Damage, H, MIT).
+"""
+
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from models.OW2_new.image_utils import stack_cells
+from models.OW2_new.ocr_engine import OCREngine
+
+DIGIT_TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "digit_templates.npz")
+
+# Size every glyph is normalised to before classification
+GLYPH_HEIGHT = 14
+GLYPH_WIDTH = 12
+
+
+class DigitRecognizer(OCREngine):
+    """Recognise batches of digit-only cells with projection segmentation and template matching."""
+
+    name = "digits"
+
+    def __init__(self, templates=None, templates_path=DIGIT_TEMPLATES_PATH, ink_threshold=0,
+                 min_glyph_height=0.6, max_glyph_width=10, max_merge_gap=2, min_score=0.3):
+        """
+        :param templates: Optional array of shape (10, GLYPH_HEIGHT, GLYPH_WIDTH), one template per digit.
+            Loaded from templates_path if not given.
+        :param templates_path: Path to the .npz file holding the templates.
+        :param ink_threshold: Pixels brighter than this are considered ink (the processed scoreboard is
+            white on black).
+        :param min_glyph_height: Glyphs shorter than this fraction of the tallest glyph in the batch are
+            ignored (thousands separators and noise).
+        :param max_glyph_width: Width of the widest digit. Column runs separated by at most max_merge_gap
+            columns are merged into one glyph while the result is not wider than this (faint digits often
+            break up after thresholding).
+        :param max_merge_gap: Widest gap, in columns, bridged when merging broken glyphs.
+        :param min_score: Glyphs whose best correlation is below this score are dropped.
+        """
+        if templates is None:
+            if not os.path.exists(templates_path):
+                raise FileNotFoundError(
+                    f"Digit templates not found at {templates_path}. "
+                    f"Build them with: python -m models.OW2_new.digit_recognizer build labels.json"
+                )
+            templates = np.load(templates_path)["templates"]
+
+        self.templates = np.asarray(templates, dtype=np.float32)
+        self.ink_threshold = ink_threshold
+        self.min_glyph_height = min_glyph_height
+        self.max_glyph_width = max_glyph_width
+        self.max_merge_gap = max_merge_gap
+        self.min_score = min_score
+        self._template_matrix = self._normalise(self.templates.reshape(len(self.templates), -1))
+
+    @staticmethod
+    def _normalise(vectors):
+        vectors = vectors - vectors.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-6)
+
+    def segment(self, cells):
+        """
+        Split every cell into normalised glyph images.
+
+        :param cells: List of grayscale cell images (NumPy arrays).
+        :return: A tuple (glyphs, owners) where glyphs has shape (G, GLYPH_HEIGHT, GLYPH_WIDTH) and owners
+            holds the index of the cell each glyph belongs to, in reading order.
+        """
+        empty = np.zeros((0, GLYPH_HEIGHT, GLYPH_WIDTH), dtype=np.float32), np.zeros(0, dtype=np.intp)
+        if not cells:
+            return empty
+
+        batch = stack_cells(cells)
+        ink = batch > self.ink_threshold
+
+        # runs of inked columns are glyphs; padding with empty columns closes runs at the cell borders
+        columns = np.pad(ink.any(axis=1), ((0, 0), (1, 1))).astype(np.int8)
+        edges = np.diff(columns, axis=1)
+        starts = np.argwhere(edges == 1)
+        ends = np.argwhere(edges == -1)
+        if len(starts) == 0:
+            return empty
+
+        runs = []
+        for (owner, left), (_, right) in zip(starts, ends):
+            if runs:
+                prev_owner, prev_left, prev_right = runs[-1]
+                if (owner == prev_owner and left - prev_right <= self.max_merge_gap
+                        and right - prev_left <= self.max_glyph_width):
+                    runs[-1] = (owner, prev_left, right)
+                    continue
+            runs.append((owner, left, right))
+        owners, x0, x1 = (np.array(values) for values in zip(*runs))
+
+        boxes = []
+        for owner, left, right in runs:
+            rows = np.flatnonzero(ink[owner, :, left:right].any(axis=1))
+            boxes.append((rows[0], rows[-1] + 1))
+        boxes = np.array(boxes)
+        heights = boxes[:, 1] - boxes[:, 0]
+
+        keep = heights >= self.min_glyph_height * heights.max()
+        glyphs = np.zeros((int(keep.sum()), GLYPH_HEIGHT, GLYPH_WIDTH), dtype=np.float32)
+        for g, i in enumerate(np.flatnonzero(keep)):
+            crop = batch[owners[i], boxes[i, 0]:boxes[i, 1], x0[i]:x1[i]].astype(np.float32)
+            crop /= max(float(crop.max()), 1.0)
+
+            # scale to the glyph height, keep the aspect ratio and centre horizontally
+            width = min(GLYPH_WIDTH, max(1, round(crop.shape[1] * GLYPH_HEIGHT / crop.shape[0])))
+            resized = cv2.resize(crop, (width, GLYPH_HEIGHT), interpolation=cv2.INTER_AREA)
+            offset = (GLYPH_WIDTH - width) // 2
+            glyphs[g, :, offset:offset + width] = resized
+
+        return glyphs, owners[keep]
+
+    def classify(self, glyphs):
+        """
+        Classify glyph images against the templates.
+
+        :param glyphs: Array of shape (G, GLYPH_HEIGHT, GLYPH_WIDTH).
+        :return: A tuple (digits, scores) of arrays with shape (G,).
+        """
+        if len(glyphs) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+        scores = self._normalise(glyphs.reshape(len(glyphs), -1)) @ self._template_matrix.T
+        digits = scores.argmax(axis=1)
+        return digits, scores[np.arange(len(digits)), digits]
+
+    def recognize(self, cells):
+        """
+        Recognise the digits of every cell in one batch.
+
+        :param cells: List of grayscale cell images.
+        :return: List of digit strings ('' for empty cells).
+        """
+        glyphs, owners = self.segment(cells)
+        digits, scores = self.classify(glyphs)
+
+        texts = [[] for _ in cells]
+        for owner, digit, score in zip(owners, digits, scores):
+            if score >= self.min_score:
+                texts[owner].append(str(digit))
+        return ["".join(text) for text in texts]
+
+    def recognize_grid(self, cells, config=""):
+        flat = [self._to_gray(cell) for row in cells for cell in row]
+        texts = iter(self.recognize(flat))
+        return [[next(texts) for _ in row] for row in cells]
+
+    def image_to_string(self, image, config=""):
+        return self.recognize([self._to_gray(image)])[0]
+
+    @staticmethod
+    def _to_gray(image):
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    @classmethod
+    def fit(cls, cells, labels, **kwargs):
+        """
+        Build a recognizer from labelled cells by averaging the glyphs of each digit.
+
+        :param cells: List of grayscale cell images.
+        :param labels: List of the digit strings shown in each cell.
+        :param kwargs: Passed to the constructor.
+        :return: A DigitRecognizer.
+        """
+        segmenter = cls(templates=np.zeros((10, GLYPH_HEIGHT, GLYPH_WIDTH), dtype=np.float32), **kwargs)
+        glyphs, owners = segmenter.segment(cells)
+
+        sums = np.zeros((10, GLYPH_HEIGHT, GLYPH_WIDTH), dtype=np.float64)
+        counts = np.zeros(10, dtype=np.int64)
+        for i, label in enumerate(labels):
+            cell_glyphs = glyphs[owners == i]
+            # cells where segmentation disagrees with the label are skipped rather than guessed
+            if len(cell_glyphs) != len(label):
+                continue
+            for glyph, digit in zip(cell_glyphs, label):
+                sums[int(digit)] += glyph
+                counts[int(digit)] += 1
+
+        missing = [str(d) for d in range(10) if counts[d] == 0]
+        if missing:
+            raise ValueError(f"No samples for digits: {', '.join(missing)}")
+
+        templates = (sums / counts[:, None, None]).astype(np.float32)
+        return cls(templates=templates, **kwargs)
+
+    def save(self, path=DIGIT_TEMPLATES_PATH):
+        """Save the templates to an .npz file."""
+        np.savez_compressed(path, templates=self.templates)
+
+
+def build_templates(labels_path, output_path=DIGIT_TEMPLATES_PATH):
+    """
+    Build digit templates from labelled screenshots.
+
+    :param labels_path: JSON file mapping screenshot paths to their 10x6 stats.
+    :param output_path: Where to write the templates.
+    :return: The fitted DigitRecognizer.
+    """
+    # imported here so the recognizer itself does not depend on torch through image_parser
+    from models.OW2_new.image_parser import ImageParser
+    from models.OW2_new.image_utils import Frame
+
+    with open(labels_path) as f:
+        labelled = json.load(f)
+
+    cells, labels = [], []
+    for image_path, stats in labelled.items():
+        frame = Frame.load(image_path)
+        for stat_image, row in zip(frame.stat_images, stats):
+            for section, value in zip(ImageParser.split_sections(stat_image), row):
+                cells.append(section)
+                labels.append(str(value))
+
+    recognizer = DigitRecognizer.fit(cells, labels)
+    recognizer.save(output_path)
+
+    predicted = recognizer.recognize(cells)
+    accuracy = np.mean([p == l for p, l in zip(predicted, labels)])
+    print(f"Built templates from {len(cells)} cells; cell accuracy on the training set: {accuracy:.2%}")
+    return recognizer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Digit recognizer utilities.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build digit templates from labelled screenshots.")
+    build_parser.add_argument("labels", help="JSON file mapping screenshot paths to 10x6 stats.")
+    build_parser.add_argument("--output", default=DIGIT_TEMPLATES_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_templates(args.labels, args.output)
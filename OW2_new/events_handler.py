@@ -1,28 +1,133 @@
+import logging
 import os
+from collections import OrderedDict
+from time import perf_counter
 
-import pandas as pd
+import numpy as np
 from flask import jsonify
 
 from models import EventsHandlerInterface, HandlerEvent
 from app.core.state import app_state
+from models.OW2_new import metrics
+from models.OW2_new.match_timeline import MatchTimelineStore
+from models.OW2_new.predictor import reset_session
+from models.OW2_new.rules_artifact import load_rules, normalise_rule_items, preprocess_rules
+from models.OW2_new.rules_payload import encode_rules_payload
+from models.OW2_new.threading_utils import native_threading
 
-class UserEventsHandler(EventsHandlerInterface):
-    def __init__(self):
-        print("Initializing Custom Events Handler")
+RULES_PATH = "models/OW2_new/team_rules.csv"
+TIMELINE_DIR = "models/OW2_new/match_history"
+
+logger = logging.getLogger(__name__)
 
-        # Preprocess and unify symmetrical rules
-        rules_df = pd.read_csv("models/OW2_new/team_rules.csv")
-        self.preprocessed_rules_df = self.preprocess_rules_at_startup(rules_df)
+class UserEventsHandler(EventsHandlerInterface):
+    def __init__(self, rules_path=RULES_PATH, rules_table_cache_size=128, timeline_dir=TIMELINE_DIR):
+        """
+        :param rules_path: CSV file of the team rules.
+        :param rules_table_cache_size: Number of rules table payloads kept, one per statuses, outcome and
+            composition; 0 disables the cache.
+        :param timeline_dir: Directory the snapshots of every finished match are stored in.
+        """
+        logger.info("Initializing Custom Events Handler")
+
+        self.rules_path = rules_path
+        self.rules_table_cache_size = rules_table_cache_size
+        self._rules_table_cache = OrderedDict()
+        self._rules_lock = native_threading().Lock()
+        self.rules_table_hits = 0
+        self.rules_table_misses = 0
+        self._rules_request_registered = False
+
+        self.load_rules()
+        metrics.register_gauge("rules_table_cache", self.rules_table_cache_stats)
+
+        # snapshots of the running match, kept to replay the chart on page reload and for trend features
+        self.timelines = MatchTimelineStore(timeline_dir)
+        metrics.register_gauge("match_timeline", self.timelines.stats)
+
+    def load_rules(self):
+        """Load and preprocess the rules file and drop the cached rules tables built from the previous one."""
+        rules_mtime = os.path.getmtime(self.rules_path)
+
+        # Preprocess and unify symmetrical rules, and compile them into item bitsets so rule lookups never parse
+        # the rule strings; both come from the binary artifact next to the CSV unless the CSV changed
+        preprocessed_rules_df, rule_index = load_rules(self.rules_path)
+
+        with self._rules_lock:
+            self.preprocessed_rules_df = preprocessed_rules_df
+            self.rule_index = rule_index
+            self.rules_mtime = rules_mtime
+            self._rules_table_cache.clear()
+            self._rules_payload = None
+
+    def rules_payload(self):
+        """The version and JSON string of the compact rules payload, serialised once per rules file."""
+        with self._rules_lock:
+            if self._rules_payload is None:
+                self._rules_payload = encode_rules_payload(self.preprocessed_rules_df, self.rule_index)
+            return self._rules_payload
+
+    def register_rules_request(self, socket_object):
+        """Answer the 'request_rules' event browsers send when they do not hold the current rules version."""
+        if self._rules_request_registered or not hasattr(socket_object, "on_event"):
+            return
+
+        def send_rules(message=None):
+            from flask_socketio import emit
+
+            # emit inside the event handler replies to the requesting browser only
+            emit("update_hidden_rules_div", self.rules_payload()[1])
+
+        socket_object.on_event("request_rules", send_rules)
+        self._rules_request_registered = True
+
+    def reload_rules_if_changed(self):
+        """Reload the rules if the rules file was modified since it was loaded. Return True if reloaded."""
+        try:
+            rules_mtime = os.path.getmtime(self.rules_path)
+        except OSError:
+            return False
+        if rules_mtime == self.rules_mtime:
+            return False
+        logger.info("Rules file %s changed, reloading the rules", self.rules_path)
+        self.load_rules()
+        return True
+
+    def clear_rules_table_cache(self):
+        """Drop every cached rules table payload; the rules themselves stay loaded."""
+        with self._rules_lock:
+            self._rules_table_cache.clear()
+
+    def rules_table_cache_stats(self):
+        """Return the hits, misses, hit rate and size of the rules table cache."""
+        lookups = self.rules_table_hits + self.rules_table_misses
+        return {
+            "hits": self.rules_table_hits,
+            "misses": self.rules_table_misses,
+            "hit_rate": self.rules_table_hits / lookups if lookups else 0.0,
+            "size": len(self._rules_table_cache),
+        }
 
     def handle_event(self, socket_object, event_name, payload):
         """Handle the given event with the given payload."""
-        print(f"Handling event {event_name} with payload: {payload}")
+        logger.debug("Handling event %s with payload: %s", event_name, payload)
+        start = perf_counter()
 
         # 'page_load' event is called when the current HTML page is loaded
         if event_name == HandlerEvent.PAGE_LOAD:
-            # use the preprocessed rules to send the rules to the client
-            payload = self.preprocessed_rules_df.to_dict(orient='records')
-            socket_object.emit("update_hidden_rules_div", payload)
+            # announce the version of the rules; browsers that have not cached it ask for the compact payload
+            self.reload_rules_if_changed()
+            self.register_rules_request(socket_object)
+            version, rules_json = self.rules_payload()
+            if self._rules_request_registered:
+                socket_object.emit("rules_version", {"version": version})
+            else:
+                socket_object.emit("update_hidden_rules_div", rules_json)
+
+            # redraw the win probability chart of the running match after a reload
+            times, probabilities = self.timelines.timeline().chart_points()
+            if probabilities:
+                socket_object.emit('replay_chart', {'times': times, 'probabilities': probabilities})
 
         #  This event is called after 'get_stats_and_details' and 'predict_probability' methods return the output
         #  The call source is the 'process_screenshot' method in 'game_manager.py'
@@ -32,6 +137,8 @@ class UserEventsHandler(EventsHandlerInterface):
                 stats, game_details = payload
                 time, team_composition, win_probability = game_details
 
+                self.timelines.append(stats, time, win_probability, team_composition)
+
                 team_status = self.calculate_team_statuses(stats)
                 self.update_player_status(socket_object, team_status, team_composition)
 
@@ -40,7 +147,9 @@ class UserEventsHandler(EventsHandlerInterface):
         # This event is called when the game outcome is set by the user in the browser
         # The call source is the 'set_game_outcome' method in 'routes.py'
         if event_name == HandlerEvent.GAME_OUTCOME_SET:
-            # reset the chart
+            # store the finished match, forget the state cached for it and reset the chart
+            self.timelines.end_match(outcome=None if payload is None else str(payload))
+            reset_session()
             socket_object.emit('reset_chart')
 
         # This event is called directly after the implemented 'predict_probability' method. It returns the output
@@ -51,13 +160,14 @@ class UserEventsHandler(EventsHandlerInterface):
             # update the chart with the new probability
             socket_object.emit('update_chart', payload)
 
-        print("Event handled.")
+        metrics.observe(f"handle_event.{getattr(event_name, 'name', event_name)}", perf_counter() - start)
+        logger.debug("Event handled.")
 
     def update_player_status(self, socket_object, team_status, team_composition):
         """Update the player status based on the given team status and composition."""
         # remove the label_ prefix from each person in the team
         team_players = ['_'.join(player.split('_')[1:]) for player in team_composition]
-        print(team_players)
+        logger.debug("Team players: %s", team_players)
 
         tank_status, dps_status, support_status = team_status
 
@@ -106,69 +216,52 @@ class UserEventsHandler(EventsHandlerInterface):
             else:
                 damage_ratio = 0.0
 
-            print(f"Damage Ratio: {damage_ratio:.2f}. Feedback: ", end="")
-
             if damage_ratio < 0.14:
-                print("SHOOT!")
+                feedback = "SHOOT!"
                 support_status = 'poor'
             elif 0.185 <= damage_ratio <= 0.32:
-                print("You're doing good.")
+                feedback = "You're doing good."
                 support_status = 'average'
             else:
+                feedback = ""
                 support_status = 'good'
+            logger.debug("Damage Ratio: %.2f. Feedback: %s", damage_ratio, feedback)
 
-        print("Custom Team Status:", (tank_status, dps_status, support_status))
+        logger.debug("Custom Team Status: %s", (tank_status, dps_status, support_status))
 
         return tank_status, dps_status, support_status
 
     # preprocess the rules
     def create_rule_str(self, left_str, right_str):
-        left_str = left_str.strip("{}")
-        right_str = right_str.strip("{}")
-        items = [x.strip() for x in left_str.split(",") if x.strip()]
-        items += [x.strip() for x in right_str.split(",") if x.strip()]
-        items.sort()
-        return items
+        return normalise_rule_items(left_str, right_str)
 
     def preprocess_rules_at_startup(self, df):
         """
         Combine the rules into single list and remove duplicates
         """
-        # Create new columns for normalized LHS / RHS
-        df["combined"] = df.apply(lambda x: self.create_rule_str(x["lhs"], x["rhs"]), axis=1)
-
-        # remove duplicate combined
-        df.drop_duplicates(subset=["combined"], inplace=True)
+        return preprocess_rules(df)
 
-        def tuple_to_str(ls_):
-            # Rebuild as { item1, item2, ... }
-            if len(ls_) == 0:
-                return "{}"
-            return "{" + ", ".join(ls_) + "}"
-
-        df["combined"] = df["combined"].apply(lambda x: tuple_to_str(x))
-        return df
+    @staticmethod
+    def required_items(tank_status, dps_status, support_status, outcome):
+        """ The rule items every filtered rule must contain for the given statuses and outcome prediction """
+        if tank_status == 'not enough data' or dps_status == 'not enough data' or support_status == 'not enough data':
+            return {f"RESULT=1"}
+        return {f"TANK={tank_status}", f"DPS={dps_status}", f"SUP={support_status}", f"RESULT={outcome}"}
 
     def get_filtered_rules(self, tank_status, dps_status, support_status, outcome):
         """ Filters the preprocessed df rules based on the given statuses and outcome prediction """
-        if tank_status == 'not enough data' or dps_status == 'not enough data' or support_status == 'not enough data':
-            required = {f"RESULT=1"}
-        else:
-            required = {f"TANK={tank_status}", f"DPS={dps_status}", f"SUP={support_status}", f"RESULT={outcome}"}
-
-        def lhs_contains_all_items(lhs_str):
-            # e.g. LHS = "{TANK=good, CHAR_1_DPS=Ashe, YOU=Moira}"
-            lhs_clean = lhs_str.strip("{}")
-            items = [x.strip() for x in lhs_clean.split(",") if x.strip()]
-            return required.issubset(items)
+        mask = self.rule_index.matching(self.required_items(tank_status, dps_status, support_status, outcome))
+        return self.preprocessed_rules_df[mask].copy()
 
-        filtered = self.preprocessed_rules_df[
-            self.preprocessed_rules_df["combined"].apply(lhs_contains_all_items)
-        ].copy()
+    def get_rules_table(self, team_composition, team_statuses, win_probability):
+        """
+        Build the rules table payload for the given composition, statuses and win probability.
 
-        return filtered
+        Payloads are cached by (tank, dps, support, outcome, sorted composition) until the rules file changes;
+        the returned dict is shared between calls and must not be modified.
+        """
+        self.reload_rules_if_changed()
 
-    def get_rules_table(self, team_composition, team_statuses, win_probability):
         tank_status, dps_status, support_status = team_statuses
         if tank_status == 'not enough data' or dps_status == 'not enough data' or support_status == 'not enough data':
             win_probability = 1
@@ -178,54 +271,71 @@ class UserEventsHandler(EventsHandlerInterface):
         # remove the prefix from members in team composition
         team_composition = ['_'.join(player.split('_')[1:]) for player in team_composition] #TODO could be an issue in the future
 
-        # get filtered rules and sort by lift desc
-        filtered = self.get_filtered_rules(tank_status=tank_status,
-                                      dps_status=dps_status,
-                                      support_status=support_status,
-                                      outcome=win_probability)
+        key = (tank_status, dps_status, support_status, win_probability, tuple(sorted(team_composition)))
+        with self._rules_lock:
+            table = self._rules_table_cache.get(key)
+            if table is not None:
+                self._rules_table_cache.move_to_end(key)
+                self.rules_table_hits += 1
+                return table
+            rules_mtime = self.rules_mtime
+
+        table = self.build_rules_table(team_composition, team_statuses, win_probability)
+
+        with self._rules_lock:
+            self.rules_table_misses += 1
+            # a table built from rules that were reloaded meanwhile is not cached
+            if self.rules_table_cache_size > 0 and rules_mtime == self.rules_mtime:
+                self._rules_table_cache[key] = table
+                while len(self._rules_table_cache) > self.rules_table_cache_size:
+                    self._rules_table_cache.popitem(last=False)
+        return table
+
+    def build_rules_table(self, team_composition, team_statuses, win_probability):
+        """
+        Build the rules table payload.
 
-        if filtered.empty:
-            # return jsonify({"table_html": "<p>No rules found for these statuses</p>"})
-            return {"table_html": "<p>No rules found for these statuses</p>"}
+        :param team_composition: Hero names without the label prefix.
+        :param team_statuses: Tuple of the tank, dps and support statuses.
+        :param win_probability: The predicted outcome, 0 or 1.
+        :return: Dict with the table_html and the matching rules.
+        """
+        tank_status, dps_status, support_status = team_statuses
+        with self._rules_lock:
+            preprocessed_rules_df, rule_index = self.preprocessed_rules_df, self.rule_index
 
-        # Hide TANK=, DPS=, SUP=, and RESULT= from display
-        def remove_statuses(_str):
-            items = _str.strip("{}").split(",")
-            cleaned = []
-            for it in items:
-                it = it.strip()
-                if it.startswith("TANK=") or it.startswith("DPS=") or it.startswith("SUP=") or it.startswith("RESULT="):
-                    continue
-                else:
-                    it = it.split("=")[1]
-                cleaned.append(it)
-            if len(cleaned) == 0:
-                return "{}"
-            return ", ".join(cleaned)
-
-        # iter, remove status and save to new column
-        filtered.loc[:, "combined"] = filtered["combined"].apply(remove_statuses)
-
-        # # create a new column that counts the number of members in current_comp that exist in team_composition
-        filtered.loc[:, "num_exist"] = filtered["combined"].apply(
-            lambda x: len([member for member in x.split(", ") if member in team_composition]))
-
-        # sort by num_exist descending
-        sorted_filtered = filtered.sort_values(by=["num_exist", "lift"], ascending=False)
-
-        # remove rows that have 0 for num_exist
-        sorted_filtered = sorted_filtered[sorted_filtered["num_exist"] > 0]
-
-        max_exist = sorted_filtered["num_exist"].max()
+        with metrics.timer("rules_filter"):
+            # get filtered rules with a bitset intersection of the required statuses
+            mask = rule_index.matching(self.required_items(tank_status, dps_status, support_status, win_probability))
+
+            if not mask.any():
+                # return jsonify({"table_html": "<p>No rules found for these statuses</p>"})
+                return {"table_html": "<p>No rules found for these statuses</p>"}
+
+            # count the number of members of each rule that exist in team_composition, and remove rules with none
+            num_exist = rule_index.hero_overlap(team_composition)
+            selected = np.flatnonzero(mask & (num_exist > 0))
+
+            # sort by num_exist and lift descending (stable, like sort_values)
+            lift = preprocessed_rules_df["lift"].to_numpy()
+            selected = selected[np.lexsort((-lift[selected], -num_exist[selected]))]
+
+        with metrics.timer("rules_render"):
+            return self.render_rules_table(preprocessed_rules_df, rule_index, selected, num_exist, win_probability)
+
+    @staticmethod
+    def render_rules_table(preprocessed_rules_df, rule_index, selected, num_exist, win_probability):
+        """Build the HTML table and rule records of the selected rules, in order."""
+        max_exist = num_exist[selected].max() if len(selected) else float("nan")
         rows = []
-        for _, row in sorted_filtered.iterrows():
+        for combined, exist in zip(rule_index.display[selected], num_exist[selected]):
             class_option = ""
             if max_exist > 1:
-                class_option = "table-primary" if row['num_exist'] == max_exist else ""
+                class_option = "table-primary" if exist == max_exist else ""
 
             rows.append(f"""
                     <tr class="{class_option}">
-                        <td class="text-start">{row['combined']}</td>
+                        <td class="text-start">{combined}</td>
                     </tr>
                     """)
 
@@ -245,5 +355,10 @@ class UserEventsHandler(EventsHandlerInterface):
         </table>
         """
 
+        # Hide TANK=, DPS=, SUP=, and RESULT= from display
+        sorted_filtered = preprocessed_rules_df.iloc[selected].copy()
+        sorted_filtered["combined"] = rule_index.display[selected]
+        sorted_filtered["num_exist"] = num_exist[selected]
+
         # return jsonify({"table_html": table_html, "rules": sorted_filtered.to_dict(orient='records')})
         return {"table_html": table_html, "rules": sorted_filtered.to_dict(orient="records")}
@@ -0,0 +1,117 @@
+"""NumPy implementation of the custom feature transformers of the prediction pipeline.
+
+The pickled pipeline scores a snapshot by pushing a 10-row DataFrame through FeatureScaler,
+CappingFeatureValues, FeatureResetter, DataPivoter (a pivot_table) and FeatureEngineer before the fitted
+estimator steps. FastFeaturePipeline computes the same engineered features directly from an (N, 10, 6) stats
+array, builds the feature frame once for the whole batch and hands it to the remaining fitted steps.
+"""
+
+import numpy as np
+import pandas as pd
+
+from models.OW2_new.custom_transformers import (
+    N_PLAYERS, PLAYER_CAPS, STAT_NAMES, CappingFeatureValues, DataPivoter, FeatureEngineer, FeatureResetter,
+    FeatureScaler, engineered_columns, pivot_columns
+)
+
+FEATURE_STEPS = (FeatureScaler, CappingFeatureValues, FeatureResetter, DataPivoter, FeatureEngineer)
+
+
+def capped_stats(stats, times):
+    """
+    Apply FeatureScaler, CappingFeatureValues and FeatureResetter to a batch of snapshots.
+
+    :param stats: Array of shape (N, 10, 6).
+    :param times: Array of shape (N,) with the match time of each snapshot in minutes.
+    :return: Array of shape (N, 10, 6).
+    """
+    per_minute = stats / times[:, None, None]
+    return np.minimum(per_minute, PLAYER_CAPS) * times[:, None, None]
+
+
+def engineered_features(stats, times):
+    """
+    Compute the FeatureEngineer output columns for a batch of snapshots.
+
+    :param stats: Array of shape (N, 10, 6).
+    :param times: Array of shape (N,).
+    :return: Dict of column name to array of shape (N,), in FeatureEngineer's column order.
+    """
+    stats = capped_stats(np.asarray(stats, dtype=np.float64), np.asarray(times, dtype=np.float64))
+    # the pivoted layout of DataPivoter: (N, feature, player), features sorted by name
+    pivoted = stats[:, :, np.argsort(STAT_NAMES)].transpose(0, 2, 1).reshape(len(stats), -1)
+    input_columns = pivot_columns()
+    return engineered_columns({name: pivoted[:, i] for i, name in enumerate(input_columns)}, input_columns)
+
+
+class FastFeaturePipeline:
+    """Score batches of snapshots with a pickled pipeline, computing its custom feature steps in NumPy."""
+
+    def __init__(self, pipeline):
+        """
+        :param pipeline: The fitted sklearn Pipeline (prediction_pipeline.pkl).
+        :raises ValueError: If the pipeline does not start with the known custom feature steps.
+        """
+        steps = [step for _, step in pipeline.steps]
+        n_feature_steps = len(FEATURE_STEPS)
+        if len(steps) <= n_feature_steps or not all(
+                type(step) is step_type for step, step_type in zip(steps, FEATURE_STEPS)):
+            raise ValueError("Pipeline does not start with the custom feature steps; use it directly.")
+
+        for step in steps[:n_feature_steps]:
+            for attribute in ("features_to_scale", "features_to_reset", "player_features"):
+                if getattr(step, attribute, STAT_NAMES) != STAT_NAMES:
+                    raise ValueError(f"Unsupported {attribute} in {type(step).__name__}; use the pipeline directly.")
+
+        self.pipeline = pipeline
+        self.estimator = pipeline[n_feature_steps:]
+        self.feature_names = getattr(self.estimator[0], "feature_names_in_", None)
+
+    def transform(self, stats, times):
+        """
+        Compute the feature frame fed to the fitted estimator steps.
+
+        :param stats: Array-like of shape (N, 10, 6).
+        :param times: Array-like of shape (N,) in minutes.
+        :return: DataFrame with one row per snapshot.
+        """
+        features = pd.DataFrame(engineered_features(stats, times))
+        if self.feature_names is not None:
+            features = features[list(self.feature_names)]
+        return features
+
+    def predict_proba(self, stats, times):
+        """Class probabilities of every snapshot, shape (N, n_classes)."""
+        return self.estimator.predict_proba(self.transform(stats, times))
+
+
+def stats_batch_to_dataframe(stats, times):
+    """Build the long DataFrame the pickled pipeline expects for a batch of snapshots (one SnapID each)."""
+    stats = np.asarray(stats)
+    n_snapshots = len(stats)
+    df = pd.DataFrame(stats.reshape(-1, len(STAT_NAMES)), columns=STAT_NAMES)
+    df["Time"] = np.repeat(np.asarray(times), N_PLAYERS)
+    df["SnapID"] = np.repeat(np.arange(n_snapshots), N_PLAYERS)
+    df["PlayerID"] = np.tile(np.arange(N_PLAYERS), n_snapshots)
+    return df
+
+
+def check_parity(pipeline, stats, times, fast_pipeline=None):
+    """
+    Compare the NumPy features path against the pickled pipeline.
+
+    :return: The maximum absolute difference between the predicted probabilities.
+    """
+    fast_pipeline = fast_pipeline or FastFeaturePipeline(pipeline)
+    expected = pipeline.predict_proba(stats_batch_to_dataframe(stats, times))
+    actual = fast_pipeline.predict_proba(stats, times)
+    return float(np.max(np.abs(expected - actual)))
+
+
+def random_snapshots(n_snapshots, seed=0):
+    """Random but plausible stats and times, used for parity checks."""
+    rng = np.random.default_rng(seed)
+    times = rng.uniform(1, 20, n_snapshots)
+    scale = np.array([30, 25, 15, 20000, 15000, 15000])
+    stats = np.floor(rng.random((n_snapshots, N_PLAYERS, len(STAT_NAMES))) * scale * (times[:, None, None] / 20))
+    return stats.astype(np.int64), times
@@ -1,17 +1,22 @@
-import os
-import uuid
-from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import logging
+import threading
+from collections import OrderedDict
 
 import cv2
+import numpy as np
 import pytesseract
 import torch
-import torch.nn as nn
-from PIL import Image
-from torchvision import models
-from torchvision import transforms
-from tqdm import tqdm
 
-from models.OW2_new.image_utils import generate_sub_images
+from models.OW2_new import metrics
+from models.OW2_new.cell_cache import CellCache
+from models.OW2_new.image_utils import Frame, as_frame, describe_image, dim_cells, ink_presence, stack_cells
+from models.OW2_new.inference_backends import load_model
+from models.OW2_new.ocr_engine import create_ocr_engine
+from models.OW2_new.portrait_cache import PortraitCache
+from models.OW2_new.portrait_writer import get_portrait_writer
+from models.OW2_new.template_locator import default_locator
+from models.OW2_new.timer_reader import TimerReader
 
 SECTION_BOUNDS = [
     (275, 339),
@@ -24,13 +29,48 @@ SECTION_BOUNDS = [
 
 TESSERACT_NUMERIC_CONFIG = "--psm 6 -c tessedit_char_whitelist=0123456789"
 
+INPUT_SIZE = (224, 224)
+CONFIDENCE_THRESHOLD = 0.9
+
+logger = logging.getLogger(__name__)
+
 class ImageParser:
-    def __init__(self, model_path=None, class_names=None, batch_size=32):
+    def __init__(self, model_path=None, class_names=None, batch_size=32, ocr_backend="auto",
+                 stats_ocr_backend=None, portrait_cache_size=256, portrait_cache_distance=4,
+                 inference_backend="eager", backbone="resnet50", incremental_ocr=True, presence_gate=True,
+                 min_ink_pixels=12, zero_ink_level=160, timer_reader=True, max_sessions=16):
         """
         :param model_path: Path to a pre-trained PyTorch model (.pth file).
         :param class_names: Optional list of strings for model output classification.
         :param batch_size: Number of images to process in a single batch during inference.
+        :param ocr_backend: OCR engine name (see ocr_engine.create_ocr_engine) or an OCREngine instance.
+            The engine is created once and reused for every screenshot.
+        :param stats_ocr_backend: Optional separate engine for the numeric stat cells, e.g. "digits" for the
+            built-in digit recognizer. Defaults to the ocr_backend engine.
+        :param portrait_cache_size: Number of portrait classifications cached per session (0 disables the cache).
+        :param portrait_cache_distance: Maximum Hamming distance between the face dHashes of a row for a portrait
+            cache hit.
+        :param inference_backend: How the classifier runs (see inference_backends.INFERENCE_BACKENDS); model_path
+            must point at the matching artifact (state dict, TorchScript or ONNX file).
+        :param backbone: Backbone of a state dict model, e.g. "resnet18" for a distilled model.
+        :param incremental_ocr: If True, stat cells that did not change since the previous screenshot of the same
+            session reuse their previous text instead of being OCR'd again.
+        :param presence_gate: If True, stat cells without ink (see image_utils.ink_presence) resolve to '' without
+            being OCR'd, e.g. the empty rows of an early-match or backfill screenshot.
+        :param min_ink_pixels: Minimum number of ink pixels of a stat cell that is not empty.
+        :param zero_ink_level: Stat cells with ink but no pixel brighter than this are the dimmed zeros of the
+            scoreboard (see image_utils.dim_cells) and resolve to '0' without being OCR'd. None disables this.
+        :param timer_reader: If True, the match time is read from the header with a TimerReader, and header OCR is
+            only the fallback. A TimerReader instance may be passed instead.
+        :param max_sessions: Number of sessions whose portrait and cell caches are kept; the least recently used
+            session is forgotten beyond that.
         """
+        self.ocr_engine = create_ocr_engine(ocr_backend)
+        if stats_ocr_backend is None:
+            self.stats_ocr_engine = self.ocr_engine
+        else:
+            self.stats_ocr_engine = create_ocr_engine(stats_ocr_backend)
+
         # Default hero labels if none are provided
         if class_names is None:
             self.class_names = [
@@ -50,83 +90,185 @@ class ImageParser:
         self.model = None
         self.batch_size = batch_size
 
+        self.portrait_cache_size = portrait_cache_size
+        self.portrait_cache_distance = portrait_cache_distance
+        self.max_sessions = max_sessions
+        self.portrait_caches = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+        self.incremental_ocr = incremental_ocr
+        self.presence_gate = presence_gate
+        self.min_ink_pixels = min_ink_pixels
+        self.zero_ink_level = zero_ink_level
+
+        if timer_reader is True:
+            try:
+                timer_reader = TimerReader()
+            except FileNotFoundError as e:
+                logger.warning("Timer reader disabled: %s", e)
+                timer_reader = None
+        self.timer_reader = timer_reader or None
+        self.cell_caches = OrderedDict()
+
         # Load the model if a path is specified
         if model_path is not None:
-            # Device configuration
-            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            print(f'Using device: {self.device}')
-
-            # Initialize the model architecture (ResNet50)
-            self.model = models.resnet50(weights=None)
-
-            # Modify the final layer to match the number of classes
-            self.model.fc = nn.Sequential(
-                nn.Linear(self.model.fc.in_features, 256),
-                nn.ReLU(),
-                nn.Dropout(0.5),
-                nn.Linear(256, len(self.class_names))
-            )
-
-            # Load the saved model weights
+            # Device configuration (quantized backends only run on the CPU)
+            if torch.cuda.is_available() and inference_backend not in ("dynamic_int8", "static_int8"):
+                self.device = torch.device('cuda')
+            else:
+                self.device = torch.device('cpu')
+            logger.info("Using device: %s", self.device)
+
+            # Load the model for the selected backend (ResNet50 state dict by default)
             try:
-                self.model.load_state_dict(torch.load(model_path, map_location=self.device, weights_only=True))
-                self.model = self.model.to(self.device)
-                self.model.eval()  # Set to evaluation mode
-                print("Model loaded and set to evaluation mode.")
+                self.model = load_model(model_path, len(self.class_names), backend=inference_backend,
+                                        backbone=backbone, device=self.device)
+                logger.info("Model loaded (%s, %s) and set to evaluation mode.", inference_backend, backbone)
             except Exception as e:
-                print(f"Error loading the model: {e}")
+                logger.error("Error loading the model: %s", e)
                 self.model = None
         else:
             self.model = None
 
-        # Define the preprocessing transforms (must match training transforms)
-        self.preprocess = transforms.Compose([
-            transforms.Resize((224, 224)),  # Resize to match model input
-            transforms.ToTensor()  # Convert PIL Image to tensor
-        ])
+    def preprocess_batch(self, images):
+        """
+        Turn a list of uint8 images into one model input tensor, matching the Resize((224, 224)) + ToTensor
+        transforms the model was trained with.
+
+        Crops of equal shape are stacked and resized with a single interpolate call. Grayscale crops are
+        resized as one channel and then expanded to the 3 channels the model expects without copying.
 
-    def classify_images(self, images, skip_enemy=False):
+        :param images: List of NumPy arrays (grayscale, or BGR with 3 channels).
+        :return: Float tensor of shape (N, 3, 224, 224) with values in [0, 1].
         """
-        Given a list of images (NumPy arrays), run inference using the loaded model and return two lists
-        (my_team, enemy_team) each with classification labels.
+        if len({img.shape for img in images}) == 1:
+            groups = [np.stack(images)]
+        else:
+            groups = [img[None] for img in images]
+
+        resized = []
+        for group in groups:
+            batch = torch.from_numpy(np.ascontiguousarray(group))
+            if batch.ndim == 3:
+                batch = batch.unsqueeze(1)  # grayscale: (N, 1, H, W)
+            else:
+                batch = batch.flip(-1).permute(0, 3, 1, 2)  # BGR (N, H, W, 3) -> RGB (N, 3, H, W)
+            batch = torch.nn.functional.interpolate(batch.float(), size=INPUT_SIZE, mode="bilinear",
+                                                    align_corners=False, antialias=True)
+            # round like the uint8 PIL resize did before ToTensor
+            resized.append(batch.round_().clamp_(0, 255))
+
+        input_batch = torch.cat(resized) if len(resized) > 1 else resized[0]
+        input_batch = input_batch.div_(255)
+        if input_batch.shape[1] == 1:
+            input_batch = input_batch.expand(-1, 3, -1, -1)
+        return input_batch
+
+    @metrics.timed("classifier_inference")
+    def predict(self, images):
+        """
+        Run the model on a list of images.
 
         :param images: List of NumPy arrays representing the profile images.
-        :param skip_enemy: If True, only return the first 5 labels (my_team).
-        :return: A list with two sub-lists of predicted labels [team1, team2].
+        :return: A tuple (labels, confidences). Labels below CONFIDENCE_THRESHOLD are 'label_Hidden'.
         """
-        if not self.model:
-            tqdm.write("No model loaded; skipping classification.")
-            return [[], []]
+        labels, confidences = [], []
+        for start in range(0, len(images), self.batch_size):
+            input_batch = self.preprocess_batch(images[start:start + self.batch_size]).to(self.device)
 
-        # Convert list of images to PIL Images
-        pil_images = [self._convert_cv2_to_pil(img) for img in images]
+            # Perform inference
+            with torch.no_grad():
+                outputs = self.model(input_batch)  # Shape: [batch_size, num_classes]
+                probabilities = torch.nn.functional.softmax(outputs, dim=1)
+                batch_confidences, predicted_class_idxs = torch.max(probabilities, dim=1)
 
-        # Apply preprocessing transforms
-        input_tensors = [self.preprocess(img) for img in pil_images]
+            for idx, confidence in zip(predicted_class_idxs.cpu().numpy(), batch_confidences.cpu().numpy()):
+                labels.append(self.class_names[idx] if confidence >= CONFIDENCE_THRESHOLD else 'label_Hidden')
+                confidences.append(float(confidence))
 
-        # Create a batch tensor
-        input_batch = torch.stack(input_tensors).to(self.device)
+        return labels, confidences
 
-        # Perform inference
-        with torch.no_grad():
-            outputs = self.model(input_batch)  # Shape: [batch_size, num_classes]
-            probabilities = torch.nn.functional.softmax(outputs, dim=1)
-            predicted_class_idxs = torch.argmax(probabilities, dim=1).cpu().numpy()
-            confidences = torch.max(probabilities, dim=1).values.cpu().numpy()
+    def get_portrait_cache(self, session=None):
+        """Return the portrait cache of the given session, or None if caching is disabled."""
+        if not self.portrait_cache_size:
+            return None
+        return self._session_cache(self.portrait_caches, session, lambda: PortraitCache(
+            max_size=self.portrait_cache_size, max_distance=self.portrait_cache_distance))
+
+    def _session_cache(self, caches, session, create):
+        """Return the cache of a session from one of the per-session LRUs, creating it if needed."""
+        with self._sessions_lock:
+            cache = caches.get(session)
+            if cache is None:
+                cache = caches[session] = create()
+                while len(caches) > self.max_sessions:
+                    caches.popitem(last=False)
+            caches.move_to_end(session)
+            return cache
+
+    def portrait_cache_stats(self):
+        """Return the hit/miss counters of every session's portrait cache."""
+        with self._sessions_lock:
+            caches = list(self.portrait_caches.items())
+        return {session: cache.stats() for session, cache in caches}
+
+    def predict_cached(self, images, session=None, rows=None):
+        """
+        Like predict, but portraits that match a cached one of the same session and row skip the model.
 
-        predicted_classes = [
-            self.class_names[idx] if confidence >= 0.9 else 'label_Hidden'
-            for idx, confidence in zip(predicted_class_idxs, confidences)
-        ]
+        :param images: List of NumPy arrays representing the profile images.
+        :param session: Session key selecting the portrait cache.
+        :param rows: Scoreboard row of every image. Defaults to the image indices.
+        :return: A tuple (labels, confidences).
+        """
+        cache = self.get_portrait_cache(session)
+        if cache is None:
+            return self.predict(images)
+
+        rows = list(range(len(images)) if rows is None else rows)
+        hashes = [cache.hash(img) for img in images]
+        results = [cache.get(h, row) for h, row in zip(hashes, rows)]
+
+        # only new portraits (or hero swaps) go through the model
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            labels, confidences = self.predict([images[i] for i in missing])
+            for i, label, confidence in zip(missing, labels, confidences):
+                cache.put(hashes[i], label, confidence, rows[i])
+                results[i] = (label, confidence)
+
+        return [label for label, _ in results], [confidence for _, confidence in results]
+
+    @metrics.timed("classify_portraits")
+    def classify_images(self, images, skip_enemy=False, rows=None, session=None):
+        """
+        Given a list of images (NumPy arrays), run inference using the loaded model and return two lists
+        (my_team, enemy_team) each with classification labels. Inference only runs on the requested rows.
 
-        # TODO Debugging: Print the probabilities and predicted class names
-        # for idx, (prob, predicted_class, confidence) in enumerate(
-        #         zip(probabilities.cpu().numpy(), predicted_classes, confidences)):
-        #     print(f"Image {idx + 1}:")
-        #     print(f"  Predicted class: {predicted_class}")
-        #     print(f"  Confidence: {confidence * 100:.2f}%")
-        #     print(f"  Probabilities: {prob}")
-        #     print("-" * 50)
+        :param images: List of NumPy arrays representing the profile images, or a Frame.
+        :param skip_enemy: If True, only classify and return the first 5 labels (my_team).
+        :param rows: Optional indices of the images to classify; labels of other rows are None.
+        :param session: Session key for the portrait cache. Defaults to the Frame's session.
+        :return: A list with two sub-lists of predicted labels [team1, team2].
+        """
+        if not self.model:
+            logger.debug("No model loaded; skipping classification.")
+            return [[], []]
+
+        if isinstance(images, Frame):
+            if session is None:
+                session = images.session
+            images = images.portraits
+
+        if rows is None:
+            rows = range(min(5, len(images))) if skip_enemy else range(len(images))
+        rows = list(rows)
+
+        predicted_classes = [None] * len(images)
+        if rows:
+            labels, _ = self.predict_cached([images[i] for i in rows], session=session, rows=rows)
+            for i, label in zip(rows, labels):
+                predicted_classes[i] = label
 
         # Split into two teams (5 players each)
         team_1 = predicted_classes[:5]
@@ -137,18 +279,6 @@ class ImageParser:
             team_2 = predicted_classes[5:]
             return [team_1, team_2]
 
-    @staticmethod
-    def _convert_cv2_to_pil(cv2_image):
-        """
-        Convert a CV2 image (BGR) to PIL Image (RGB).
-
-        :param cv2_image: NumPy array representing the image in BGR format.
-        :return: PIL Image in RGB format.
-        """
-        rgb_image = cv2.cvtColor(cv2_image, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image)
-        return pil_image
-
     @staticmethod
     def convert_to_gray(image):
         """
@@ -176,42 +306,105 @@ class ImageParser:
         )
         return text.replace(' ', '').replace('\n', '')
 
-    def extract_text_from_stats(self, stat_images, return_empty=True):
+    @staticmethod
+    def split_sections(image):
+        """
+        Slice a stat image into its SECTION_BOUNDS columns (K, A, D, Damage, H, MIT).
+
+        :param image: Stat image as NumPy array.
+        :return: List of section views.
+        """
+        return [image[:, start:end] if end else image[:, start:] for (start, end) in SECTION_BOUNDS]
+
+    def get_cell_cache(self, session=None):
+        """Return the stat cell cache of the given session, or None if incremental OCR is disabled."""
+        if not self.incremental_ocr:
+            return None
+        return self._session_cache(self.cell_caches, session, CellCache)
+
+    def reset_session(self, session=None):
+        """Forget everything cached for a session (e.g. when its match ends)."""
+        with self._sessions_lock:
+            self.portrait_caches.pop(session, None)
+            self.cell_caches.pop(session, None)
+        # remembered stats table and timer positions
+        default_locator.reset((session, "top"))
+        default_locator.reset((session, "bottom"))
+        if self.timer_reader is not None:
+            self.timer_reader.reset(session)
+
+    @metrics.timed("stat_ocr")
+    def extract_text_from_stats(self, stat_images, return_empty=True, session=None):
         """
         Extract text from a list of stat_images. Each stat_image is sliced according
-        to SECTION_BOUNDS, and extracted in parallel.
+        to SECTION_BOUNDS, and all sections are recognised in one call to the OCR engine.
+        With incremental OCR, only sections that changed since the session's previous screenshot are recognised,
+        and with the presence gate, sections without ink resolve to '' without being recognised. Sections whose ink
+        is dim (zero_ink_level) are zeros and resolve to '0'.
 
-        :param stat_images: List of images (NumPy arrays) to be processed.
+        :param stat_images: List of images (NumPy arrays) to be processed, or a Frame.
         :param return_empty: If False, skip images where all sections are empty.
+        :param session: Session key for incremental OCR. Defaults to the Frame's session.
         :return: A list of lists. Each sub-list corresponds to one stat_image.
         """
-        extracted_texts = []
-
-        with ThreadPoolExecutor() as executor:
-            for image in stat_images:
-                # Slice into sections
-                sections = [
-                    image[:, start:end] if end else image[:, start:]
-                    for (start, end) in SECTION_BOUNDS
-                ]
-
-                # Schedule tasks to convert to grayscale + OCR
-                futures = [
-                    executor.submit(
-                        self.ocr_extract_numeric_text,
-                        self.convert_to_gray(section)
-                    )
-                    for section in sections
+        if isinstance(stat_images, Frame):
+            if session is None:
+                session = stat_images.session
+            stat_images = stat_images.stat_images
+
+        # Slice into sections and convert to grayscale
+        cells = [
+            [self.convert_to_gray(section) for section in self.split_sections(image)]
+            for image in stat_images
+        ]
+        if not cells:
+            return []
+
+        n_sections = len(SECTION_BOUNDS)
+        flat_cells = [cell for row in cells for cell in row]
+        cache = self.get_cell_cache(session)
+        batch = stack_cells(flat_cells) if cache is not None or self.presence_gate or self.zero_ink_level else None
+        inked = (ink_presence(batch, min_ink_pixels=self.min_ink_pixels)
+                 if self.presence_gate or self.zero_ink_level else None)
+
+        # the session's cache stays locked from the comparison until the texts are stored
+        with cache.lock if cache is not None else contextlib.nullcontext():
+            # cells to send to the OCR engine: those with ink, and with incremental OCR those that changed
+            if self.presence_gate:
+                present = inked
+                metrics.increment("stat_cells_empty", int(len(present) - present.sum()))
+            else:
+                present = np.ones(len(flat_cells), dtype=bool)
+            if self.zero_ink_level:
+                zeros = inked & dim_cells(batch, self.zero_ink_level)
+                metrics.increment("stat_cells_dim_zero", int(zeros.sum()))
+            else:
+                zeros = np.zeros(len(flat_cells), dtype=bool)
+            changed = cache.changed_cells(batch) if cache is not None else np.ones(len(flat_cells), dtype=bool)
+
+            texts = [('0' if zeros[i] else None if present[i] else '') if changed[i] else cache.cached_text(i)
+                     for i in range(len(flat_cells))]
+            recognize = changed & present & ~zeros
+            if recognize.any():
+                recognize_grid = [
+                    [cell for j, cell in enumerate(row) if recognize[i * n_sections + j]]
+                    for i, row in enumerate(cells)
                 ]
+                recognized = iter(text for row in self.stats_ocr_engine.recognize_grid(
+                    recognize_grid, config=TESSERACT_NUMERIC_CONFIG) for text in row)
+                texts = [next(recognized) if text is None else text for text in texts]
+            if cache is not None:
+                cache.store(batch, texts, changed)
 
-                # Gather results
-                section_texts = [f.result() for f in futures]
+        extracted_texts = []
+        for start in range(0, len(texts), n_sections):
+            section_texts = [text.replace(' ', '').replace('\n', '') for text in texts[start:start + n_sections]]
 
-                # Optionally skip if all sections are empty
-                if not return_empty and all(text == '' for text in section_texts):
-                    continue
+            # Optionally skip if all sections are empty
+            if not return_empty and all(text == '' for text in section_texts):
+                continue
 
-                extracted_texts.append(section_texts)
+            extracted_texts.append(section_texts)
 
         return extracted_texts
 
@@ -220,19 +413,21 @@ class ImageParser:
         """
         Extract text from the top region of the image (e.g., scoreboard header).
 
-        :param image_path: Path to the image file.
+        :param image_path: Path to the image file, or anything else as_frame accepts (Frame, BGR array, encoded
+            bytes, raw frame file).
         :return: Extracted header text as string or None if extraction fails.
         """
-        image = cv2.imread(image_path)
-        if image is None:
-            tqdm.write(f"Error reading image: {image_path}")
+        try:
+            frame = as_frame(image_path)
+        except ValueError:
+            logger.warning("Error reading image: %s", describe_image(image_path))
             return None
-        header_image = image[:100, 120:750]
+        header_image = frame.header
         try:
             header_text = pytesseract.image_to_string(header_image)
             return header_text.strip()
         except pytesseract.TesseractError as e:
-            tqdm.write(f"Error processing header image in {image_path}: {e}")
+            logger.warning("Error processing header image in %s: %s", describe_image(image_path), e)
             return None
 
     @staticmethod
@@ -250,13 +445,17 @@ class ImageParser:
         return False
 
     @staticmethod
-    def save_image(img, _dir="hidden"):
+    def save_image(img, _dir="hidden", label=None, confidence=None):
         """
         Save an image for future reference or training data if the label is 'Hidden'.
 
+        The image is queued to the directory's background PortraitWriter, which skips near-duplicates and keeps
+        the directory within its size limits, so this returns without touching the disk.
+
         :param img: Image as NumPy array.
         :param _dir: Directory to save the image.
+        :param label: Optional predicted label, stored in the directory's index.
+        :param confidence: Optional confidence of the predicted label.
+        :return: False if the image was dropped because the writer's queue is full, True otherwise.
         """
-        os.makedirs(_dir, exist_ok=True)
-        hidden_image_path = os.path.join(_dir, f"{uuid.uuid4().hex[:8]}.png")
-        cv2.imwrite(hidden_image_path, img)
\ No newline at end of file
+        return get_portrait_writer(_dir).submit(img, label=label, confidence=confidence)
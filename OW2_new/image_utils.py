@@ -3,6 +3,223 @@ import os
 import cv2
 import numpy as np
 
+from models.OW2_new import metrics
+from models.OW2_new.template_locator import REFERENCE_HEIGHT, default_locator
+
+# Regions of a 1920x1080 scoreboard screenshot
+HEADER_ROWS = slice(0, 100)
+HEADER_COLS = slice(120, 750)
+PORTRAIT_WIDTH = 91
+STATS_WIDTH = 850
+
+# Extension of raw frame files: the BGR pixels of one 16:9 screenshot, row by row, without a header
+RAW_FRAME_EXTENSION = ".bgr"
+
+
+class Frame:
+    """A screenshot decoded once, carrying its BGR, grayscale and processed views.
+
+    The grayscale and processed images are computed on first access and cached. Every crop handed
+    out by the frame (header, sub-images, portraits and stat rows) is a NumPy view into one of those
+    arrays, so no pixel data is copied after the initial decode.
+
+    The regions of the scoreboard are defined for 1080p, so frames of other resolutions are resized
+    to a height of 1080 once, when the frame is created.
+    """
+
+    def __init__(self, image, source=None, session=None):
+        """
+        :param image: Decoded BGR image as a NumPy array of shape (height, width, 3).
+        :param source: Optional description of where the image came from (e.g. its path).
+        :param session: Optional session key; the stats table position is remembered per session.
+        """
+        if image is None or image.ndim != 3:
+            raise ValueError(f"Expected a BGR image, got: {None if image is None else image.shape}")
+        self.original_shape = image.shape
+        self.image = normalize_resolution(image)
+        self.source = source
+        self.session = session
+        self._gray = None
+        self._processed = None
+        self._sub_images = None
+
+    @classmethod
+    def load(cls, image_path, session=None):
+        """Decode the image at the given path."""
+        with metrics.timer("decode"):
+            image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Unable to load image at path: {image_path}")
+        return cls(image, source=image_path, session=session)
+
+    @classmethod
+    def decode(cls, buffer, session=None):
+        """Decode an encoded image (PNG, JPEG, ...) held in memory, e.g. bytes received from a capture pipe."""
+        with metrics.timer("decode"):
+            # frombuffer wraps the buffer without copying it
+            image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Unable to decode image from {len(memoryview(buffer).cast('B'))} bytes")
+        return cls(image, source="<buffer>", session=session)
+
+    @classmethod
+    def map_raw(cls, raw_path, shape=None, session=None):
+        """
+        Memory-map a raw frame file; pixels are read from the page cache as the frame is cropped, not decoded.
+
+        :param raw_path: Path to a file holding the BGR pixels of one frame.
+        :param shape: (height, width, 3) of the frame. Inferred from the file size for 16:9 frames if not given.
+        """
+        if shape is None:
+            shape = raw_frame_shape(os.path.getsize(raw_path))
+        try:
+            image = np.memmap(raw_path, dtype=np.uint8, mode="r", shape=tuple(shape))
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Unable to map raw frame at path: {raw_path}: {e}")
+        return cls(image, source=raw_path, session=session)
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    @property
+    def gray(self):
+        """The grayscale conversion of the frame."""
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def processed(self):
+        """The gamma adjusted and thresholded grayscale frame used for OCR and classification."""
+        if self._processed is None:
+            with metrics.timer("process_image"):
+                self._processed = process_image(self.gray)
+        return self._processed
+
+    @property
+    def header(self):
+        """The scoreboard header (map, mode and match time) of the BGR frame."""
+        return self.image[HEADER_ROWS, HEADER_COLS]
+
+    def prepare(self):
+        """Process the frame and locate its player rows now instead of on first use. Returns the frame."""
+        if self._sub_images is None:
+            self._sub_images = prepare_sub_images(self.processed, session=self.session)
+        return self
+
+    @property
+    def sub_images(self):
+        """The 10 player rows of the processed frame (5 for each team)."""
+        return list(self.prepare()._sub_images)
+
+    @property
+    def portraits(self):
+        """The hero portrait at the start of each player row."""
+        return [si[:, :PORTRAIT_WIDTH] for si in self.sub_images]
+
+    @property
+    def stat_images(self):
+        """The stat columns (K, A, D, Damage, H, MIT) of each player row."""
+        return [si[:, PORTRAIT_WIDTH:] for si in self.sub_images]
+
+
+def normalize_resolution(image, height=REFERENCE_HEIGHT):
+    """
+    Resize a screenshot to the given height, keeping its aspect ratio.
+
+    :param image: Image as a NumPy array.
+    :return: The image itself if it already has that height, otherwise a resized copy.
+    """
+    if image.shape[0] == height:
+        return image
+    scale = height / image.shape[0]
+    size = (round(image.shape[1] * scale), height)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    with metrics.timer("normalize_resolution"):
+        return cv2.resize(image, size, interpolation=interpolation)
+
+
+def raw_frame_shape(n_bytes):
+    """The (height, width, 3) of a 16:9 BGR frame of n_bytes bytes."""
+    height = round((n_bytes / 3 * 9 / 16) ** 0.5)
+    width = height * 16 // 9
+    if height == 0 or height * width * 3 != n_bytes:
+        raise ValueError(f"{n_bytes} bytes is not a 16:9 BGR frame; pass its shape explicitly")
+    return height, width, 3
+
+
+def as_frame(image, session=None):
+    """Return the given image as a Frame, without copying in-memory images.
+
+    :param image: A Frame; a decoded BGR image as a NumPy array (including a np.memmap of a raw frame);
+        encoded image bytes (bytes, bytearray or memoryview); or a path to an image file or to a raw frame
+        file (RAW_FRAME_EXTENSION), which is memory-mapped instead of read.
+    :param session: Optional session key for newly created frames.
+    :return: A Frame. Frames are returned unchanged so callers can share one decode.
+    """
+    if isinstance(image, Frame):
+        return image
+    if isinstance(image, np.ndarray):
+        return Frame(image, session=session)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Frame.decode(image, session=session)
+    if os.fspath(image).lower().endswith(RAW_FRAME_EXTENSION):
+        return Frame.map_raw(image, session=session)
+    return Frame.load(image, session=session)
+
+
+def describe_image(image):
+    """A short description of anything as_frame accepts, for log messages."""
+    if isinstance(image, Frame):
+        return str(image.source) if image.source is not None else f"<frame {image.shape}>"
+    if isinstance(image, np.ndarray):
+        return f"<array {image.shape}>"
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return f"<{len(memoryview(image).cast('B'))} bytes>"
+    return str(image)
+
+
+def stack_cells(cells):
+    """Pad a list of 2D cells (e.g. stat sections) into one (N, H, W) uint8 array."""
+    height = max(cell.shape[0] for cell in cells)
+    width = max(cell.shape[1] for cell in cells)
+    batch = np.zeros((len(cells), height, width), dtype=np.uint8)
+    for i, cell in enumerate(cells):
+        batch[i, :cell.shape[0], :cell.shape[1]] = cell
+    return batch
+
+
+def ink_presence(batch, ink_threshold=0, min_ink_pixels=12, min_ink_columns=3):
+    """Decide for every cell of a batch whether it holds any glyph, without OCR.
+
+    The processed scoreboard is white on black, so a cell holds a glyph if enough of its pixels are brighter
+    than ink_threshold and they span enough columns (the faintest digit, an outlined 0, has about 30 pixels over
+    4 columns; stray separator pixels have a few).
+
+    :param batch: (N, H, W) uint8 array of processed cells, e.g. from stack_cells (the padding is background).
+    :param ink_threshold: Pixels brighter than this are ink.
+    :param min_ink_pixels: Minimum number of ink pixels of a non-empty cell.
+    :param min_ink_columns: Minimum number of columns with ink of a non-empty cell.
+    :return: Boolean array of length N, True for cells with a glyph.
+    """
+    ink = batch > ink_threshold
+    return (ink.sum(axis=(1, 2)) >= min_ink_pixels) & (ink.any(axis=1).sum(axis=1) >= min_ink_columns)
+
+
+def dim_cells(batch, max_ink_level=160):
+    """Find the cells of a batch whose ink is never bright.
+
+    The scoreboard draws zero values dimmed: after process_image their brightest pixels stay around 120-145 at
+    1080p, while every other value has pixels above 240. Resizing other resolutions to 1080p blurs the dim
+    strokes around the processing threshold, so only part of a zero may survive (and read as a 3 or a 5), but
+    its pixels stay dim.
+
+    :param batch: (N, H, W) uint8 array of processed cells, e.g. from stack_cells.
+    :param max_ink_level: Cells without a pixel brighter than this are dim.
+    :return: Boolean array of length N, True for dim cells (including cells without any ink).
+    """
+    return batch.reshape(len(batch), -1).max(axis=1, initial=0) <= max_ink_level
 
 def split_image(image):
     """Split the image into two halves (top and bottom)"""
@@ -11,33 +228,46 @@ def split_image(image):
     bottom_half = image[height // 2:, :]
     return top_half, bottom_half
 
-def crop_image(image):
-    """Crop the image using template matching."""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    template_path = os.path.join(script_dir, "search_stats.png")
-
-    template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-    result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
-    _, _, _, max_loc = cv2.minMaxLoc(result)
-    template_height, template_width = template.shape[:2]
-    top_left = max_loc
-    bottom_right = (top_left[0] + template_width, top_left[1] + template_height)
-    output_image = image[top_left[1]:bottom_right[1], top_left[0]:]
-    output_image = output_image[:, :850]
+def crop_image(image, locator=None, key=None):
+    """Crop the image using template matching.
+
+    :param image: One half of the processed scoreboard image.
+    :param locator: TemplateLocator to use; defaults to the shared locator with a cached template.
+    :param key: Optional key under which the match position is remembered for the next screenshot.
+    :return: The stats table region, at 1080p scale.
+    """
+    locator = locator or default_locator
+    scale_hint = image.shape[0] / (REFERENCE_HEIGHT // 2)
+    with metrics.timer("crop_image"):
+        match = locator.locate(image, key=key, scale_hint=scale_hint)
+
+    left, top = match.top_left
+    template_height = match.size[1]
+    output_image = image[top:top + template_height, left:]
+    output_image = output_image[:, :round(STATS_WIDTH * match.scale)]
+
+    # bring other resolutions back to the 1080p layout the section bounds are defined for
+    if match.scale != 1.0:
+        size = (round(output_image.shape[1] / match.scale), round(output_image.shape[0] / match.scale))
+        output_image = cv2.resize(output_image, size, interpolation=cv2.INTER_AREA)
     return output_image
 
-def prepare_sub_images(image):
+def prepare_sub_images(image, session=None):
     """Split the image into 10 sub-images.
 
-    :param image: The input image (grayscale or color) as a NumPy array.
+    :param image: The processed input image as a NumPy array, or a Frame.
+    :param session: Optional session key; the template match position is remembered per session.
     :return: A list of 10 sub-images.
     """
+    if isinstance(image, Frame):
+        return image.sub_images
+
     # Split the image into top and bottom halves
     top, bottom = split_image(image)
 
     # Crop the halves if necessary
-    top = crop_image(top)
-    bottom = crop_image(bottom)
+    top = crop_image(top, key=(session, "top"))
+    bottom = crop_image(bottom, key=(session, "bottom"))
 
     # Further split the top and bottom halves into 5 sub-images each
     sub_images = []
@@ -62,8 +292,15 @@ def adjust_gamma(image, gamma=1.0):
     return cv2.LUT(image, table)
 
 def process_image(image):
-    """Process the image by adjusting gamma and modifying specific regions."""
-    new_img = adjust_gamma(image.copy(), gamma=0.45)
+    """Process the image by adjusting gamma and modifying specific regions.
+
+    :param image: Grayscale 1080p image as a NumPy array (see normalize_resolution), or a Frame (its cached
+        processed view is returned).
+    """
+    if isinstance(image, Frame):
+        return image.processed
+
+    new_img = adjust_gamma(image, gamma=0.45)
     new_img[0:100, :] = image[0:100, :]
     new_img[0:100, :] = np.where(new_img[0:100, :] <= 100, 0, 255)
     new_img[100:, :][new_img[100:, :] <= 110] = 0
@@ -74,22 +311,10 @@ def process_image(image):
     return new_img
 
 def generate_sub_images(image_path):
-    """Load an image from the given path and generate 10 sub-images.
+    """Generate 10 sub-images from the given screenshot.
 
-    :param image_path: Path to the input image.
+    :param image_path: Path to the input image, or anything else as_frame accepts (Frame, BGR array, encoded
+        bytes, raw frame file).
     :return: List of 10 sub-images as NumPy arrays.
     """
-    # Load the image
-    image = cv2.imread(image_path)
-    if image is None:
-        raise ValueError(f"Unable to load image at path: {image_path}")
-
-    # Convert to grayscale
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    # Process the image
-    processed_image = process_image(gray_image)
-
-    # Generate sub-images
-    sub_images = prepare_sub_images(processed_image)
-    return sub_images
\ No newline at end of file
+    return as_frame(image_path).sub_images
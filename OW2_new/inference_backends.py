@@ -0,0 +1,267 @@
+"""CPU oriented inference backends for the hero portrait classifier.
+
+Backends (``ImageParser(inference_backend=...)``):
+
+- ``eager``: the float32 PyTorch model loaded from a state dict (.pth), as trained.
+- ``dynamic_int8``: the eager model with its Linear layers dynamically quantized to int8.
+- ``static_int8``: a statically quantized model (convolutions included), exported as TorchScript.
+- ``torchscript``: a traced TorchScript model exported from any of the above.
+- ``onnx``: an ONNX model run with ONNX Runtime (optional dependency).
+
+Besides ResNet50, the same classification head can sit on a smaller backbone (``resnet18``,
+``mobilenet_v3_small``, ``mobilenet_v3_large``), e.g. for a model distilled from ``latest_model.pth``.
+
+Export and check against the reference model with:
+
+    python -m models.OW2_new.inference_backends export --backend static_int8 --output hero_int8.pt \
+        --calibration "screenshots/*.png"
+    python -m models.OW2_new.inference_backends parity --backend static_int8 --model hero_int8.pt \
+        --images "screenshots/*.png"
+"""
+
+import argparse
+import glob
+import time
+
+import torch
+import torch.nn as nn
+from torchvision import models
+
+try:
+    import onnxruntime
+except ImportError:  # optional dependency
+    onnxruntime = None
+
+DEFAULT_MODEL_PATH = "models/OW2_new/latest_model.pth"
+INFERENCE_BACKENDS = ("eager", "dynamic_int8", "static_int8", "torchscript", "onnx")
+BACKBONES = ("resnet50", "resnet18", "mobilenet_v3_small", "mobilenet_v3_large")
+
+
+def classification_head(in_features, num_classes):
+    """The classification head used on top of every backbone."""
+    return nn.Sequential(
+        nn.Linear(in_features, 256),
+        nn.ReLU(),
+        nn.Dropout(0.5),
+        nn.Linear(256, num_classes)
+    )
+
+
+def build_model(num_classes, backbone="resnet50"):
+    """
+    Build an untrained classifier.
+
+    :param num_classes: Number of output classes (len(class_names)).
+    :param backbone: One of BACKBONES.
+    :return: The nn.Module.
+    """
+    if backbone in ("resnet50", "resnet18"):
+        model = getattr(models, backbone)(weights=None)
+        model.fc = classification_head(model.fc.in_features, num_classes)
+    elif backbone in ("mobilenet_v3_small", "mobilenet_v3_large"):
+        model = getattr(models, backbone)(weights=None)
+        model.classifier[-1] = classification_head(model.classifier[-1].in_features, num_classes)
+    else:
+        raise ValueError(f"Unknown backbone: {backbone}. Expected one of {BACKBONES}.")
+    return model
+
+
+def load_eager_model(model_path, num_classes, backbone="resnet50", device="cpu"):
+    """Load a float32 model from a state dict and set it to evaluation mode."""
+    model = build_model(num_classes, backbone)
+    model.load_state_dict(torch.load(model_path, map_location=device, weights_only=True))
+    return model.to(device).eval()
+
+
+def quantize_dynamic(model):
+    """Quantize the Linear layers of a float model to int8 (weights ahead of time, activations at runtime)."""
+    return torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration_batches, engine="x86"):
+    """
+    Statically quantize a float model to int8 with FX graph mode quantization.
+
+    :param model: Float model in evaluation mode.
+    :param calibration_batches: Iterable of input tensors (N, 3, 224, 224) used to calibrate activation ranges.
+    :param engine: Quantization engine ("x86", "fbgemm" or "qnnpack").
+    :return: The quantized model.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    calibration_batches = list(calibration_batches)
+    if not calibration_batches:
+        raise ValueError("Static quantization needs at least one calibration batch.")
+
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(model.cpu().eval(), get_default_qconfig_mapping(engine),
+                          example_inputs=(calibration_batches[0],))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+class OnnxRuntimeModel:
+    """Callable wrapper giving an ONNX Runtime session the same interface as a torch model."""
+
+    def __init__(self, model_path, num_threads=None):
+        if onnxruntime is None:
+            raise ImportError("onnxruntime is not installed; install it to use the 'onnx' inference backend.")
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_batch):
+        outputs = self.session.run(None, {self.input_name: input_batch.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+
+def load_model(model_path, num_classes, backend="eager", backbone="resnet50", device="cpu"):
+    """
+    Load the classifier for the given inference backend.
+
+    :param model_path: State dict (.pth) for eager/dynamic_int8, TorchScript file for static_int8/torchscript,
+        ONNX file for onnx.
+    :param num_classes: Number of output classes.
+    :param backend: One of INFERENCE_BACKENDS.
+    :param backbone: Backbone of the state dict (eager/dynamic_int8 only).
+    :param device: Torch device; quantized backends always run on the CPU.
+    :return: A callable model taking a (N, 3, 224, 224) tensor and returning logits.
+    """
+    if backend == "eager":
+        return load_eager_model(model_path, num_classes, backbone, device)
+    if backend == "dynamic_int8":
+        return quantize_dynamic(load_eager_model(model_path, num_classes, backbone, "cpu"))
+    if backend in ("static_int8", "torchscript"):
+        map_location = "cpu" if backend == "static_int8" else device
+        return torch.jit.optimize_for_inference(torch.jit.load(model_path, map_location=map_location).eval())
+    if backend == "onnx":
+        return OnnxRuntimeModel(model_path)
+    raise ValueError(f"Unknown inference backend: {backend}. Expected one of {INFERENCE_BACKENDS}.")
+
+
+def load_portraits(image_paths):
+    """Crop the portraits of every screenshot in image_paths."""
+    from models.OW2_new.image_utils import Frame
+
+    portraits = []
+    for image_path in image_paths:
+        portraits.extend(Frame.load(image_path).portraits)
+    return portraits
+
+
+def portrait_batches(image_paths, batch_size=10):
+    """Preprocessed input batches of the portraits in the given screenshots."""
+    from models.OW2_new.image_parser import ImageParser
+
+    parser = ImageParser(portrait_cache_size=0, ocr_backend="tesseract")
+    portraits = load_portraits(image_paths)
+    return [parser.preprocess_batch(portraits[i:i + batch_size]) for i in range(0, len(portraits), batch_size)]
+
+
+def export_model(model_path, output_path, backend, num_classes, backbone="resnet50", calibration_images=()):
+    """
+    Convert a state dict into the artifact loaded by the given backend.
+
+    :param model_path: Float state dict (.pth).
+    :param output_path: Output file (TorchScript .pt, or .onnx for the onnx backend).
+    :param backend: "static_int8", "torchscript" or "onnx".
+    :param num_classes: Number of output classes.
+    :param backbone: Backbone of the state dict.
+    :param calibration_images: Screenshots whose portraits calibrate static quantization.
+    """
+    model = load_eager_model(model_path, num_classes, backbone, "cpu")
+    example = torch.rand(1, 3, 224, 224)
+
+    if backend == "static_int8":
+        model = quantize_static(model, portrait_batches(calibration_images))
+        backend = "torchscript"
+
+    with torch.no_grad():
+        if backend == "torchscript":
+            torch.jit.save(torch.jit.trace(model, example), output_path)
+        elif backend == "onnx":
+            torch.onnx.export(model, example, output_path, input_names=["input"], output_names=["logits"],
+                              dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}}, opset_version=17,
+                              dynamo=False)
+        else:
+            raise ValueError(f"Backend {backend} has no export step.")
+    print(f"Exported {backbone} model to {output_path}")
+
+
+def check_parity(reference, candidate, batches, repeats=5):
+    """
+    Compare a candidate model against the reference model on the same inputs.
+
+    :return: Dict with top-1 agreement, maximum absolute probability difference and latency per image (ms).
+    """
+    def run(model):
+        probabilities, start = [], time.perf_counter()
+        with torch.no_grad():
+            for _ in range(repeats):
+                probabilities = [torch.softmax(model(batch), dim=1) for batch in batches]
+        elapsed = (time.perf_counter() - start) / repeats
+        return torch.cat(probabilities), elapsed
+
+    reference_probs, reference_time = run(reference)
+    candidate_probs, candidate_time = run(candidate)
+    n_images = len(reference_probs)
+    return {
+        "images": n_images,
+        "top1_agreement": float((reference_probs.argmax(1) == candidate_probs.argmax(1)).float().mean()),
+        "max_probability_diff": float((reference_probs - candidate_probs).abs().max()),
+        "reference_ms_per_image": 1000 * reference_time / n_images,
+        "candidate_ms_per_image": 1000 * candidate_time / n_images,
+    }
+
+
+def main():
+    from models.OW2_new.image_parser import ImageParser
+
+    parser = argparse.ArgumentParser(description="Export and verify hero classifier inference backends.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Convert latest_model.pth for a faster backend.")
+    export_parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Float state dict (.pth).")
+    export_parser.add_argument("--backbone", default="resnet50", choices=BACKBONES)
+    export_parser.add_argument("--backend", required=True, choices=("static_int8", "torchscript", "onnx"))
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--calibration", default="",
+                               help="Glob of screenshots used to calibrate static quantization.")
+
+    parity_parser = subparsers.add_parser("parity", help="Compare a backend against the reference model.")
+    parity_parser.add_argument("--reference", default=DEFAULT_MODEL_PATH, help="Reference ResNet50 state dict.")
+    parity_parser.add_argument("--model", required=True, help="Model file for the candidate backend.")
+    parity_parser.add_argument("--backend", required=True, choices=INFERENCE_BACKENDS)
+    parity_parser.add_argument("--backbone", default="resnet50", choices=BACKBONES)
+    parity_parser.add_argument("--images", required=True, help="Glob of screenshots to compare on.")
+    parity_parser.add_argument("--min-agreement", type=float, default=0.99)
+
+    args = parser.parse_args()
+    num_classes = len(ImageParser(portrait_cache_size=0, ocr_backend="tesseract").class_names)
+
+    if args.command == "export":
+        export_model(args.model, args.output, args.backend, num_classes, args.backbone,
+                     sorted(glob.glob(args.calibration)))
+    elif args.command == "parity":
+        reference = load_eager_model(args.reference, num_classes, "resnet50", "cpu")
+        candidate = load_model(args.model, num_classes, args.backend, args.backbone, "cpu")
+        result = check_parity(reference, candidate, portrait_batches(sorted(glob.glob(args.images))))
+        for key, value in result.items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+        if result["top1_agreement"] < args.min_agreement:
+            raise SystemExit(f"Top-1 agreement {result['top1_agreement']:.4f} is below {args.min_agreement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Per-match history of the processed snapshots: stats, composition, time and win probability.
+
+A ``MatchTimeline`` keeps the snapshots of the running match in one preallocated NumPy record array
+(TIMELINE_DTYPE) that doubles when full, so appending is amortised O(1) and the stats of the whole match are a
+single (snapshots, 10, 6) view. Snapshots are kept in match time order (a snapshot older than the latest one,
+e.g. one that was processed late, is inserted at its place), so time ranges are found by binary search.
+
+When a match ends, ``MatchTimelineStore`` appends its records to one binary file of TIMELINE_DTYPE records
+(``timeline.bin``) and a line to ``matches.jsonl`` with the offset, length, hero names and outcome of the
+match. Earlier matches are read back as memory-mapped slices of that file, without loading the others.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from models.OW2_new.custom_transformers import N_PLAYERS, STAT_NAMES
+from models.OW2_new.threading_utils import native_threading
+
+TEAM_SIZE = 5
+NO_HERO = -1
+
+TIMELINE_DTYPE = np.dtype([
+    ("time", np.float64),          # match time in minutes
+    ("probability", np.float64),   # predicted win probability, NaN if there was no prediction
+    ("stats", np.int32, (N_PLAYERS, len(STAT_NAMES))),
+    ("heroes", np.int16, (TEAM_SIZE,)),   # indices into the timeline's hero names, NO_HERO if unknown
+])
+TIMELINE_FILENAME = "timeline.bin"
+MATCHES_FILENAME = "matches.jsonl"
+
+
+class MatchTimeline:
+    """The snapshots of one match in a growable record array."""
+
+    def __init__(self, capacity=64, records=None, hero_names=None):
+        """
+        :param capacity: Number of snapshots preallocated; the array doubles whenever it is full.
+        :param records: Optional TIMELINE_DTYPE records to start from (e.g. a memory-mapped match), used as is.
+        :param hero_names: Hero names the heroes column of records refers to.
+        """
+        if records is None:
+            self._records = np.zeros(capacity, dtype=TIMELINE_DTYPE)
+            self._length = 0
+        else:
+            self._records = records
+            self._length = len(records)
+        self.hero_names = list(hero_names or [])
+        self._hero_ids = {name: i for i, name in enumerate(self.hero_names)}
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def records(self):
+        """View of the records of the snapshots so far."""
+        return self._records[:self._length]
+
+    @property
+    def stats(self):
+        """(snapshots, 10, 6) view of the stats."""
+        return self.records["stats"]
+
+    @property
+    def times(self):
+        return self.records["time"]
+
+    @property
+    def probabilities(self):
+        return self.records["probability"]
+
+    def append(self, stats, time_in_minutes, probability=None, team_composition=None):
+        """
+        Append a snapshot, inserted before the snapshots with a later match time if there are any.
+
+        :param stats: Rows of K, A, D, Damage, H, MIT as returned by get_stats_and_details; missing rows are 0.
+        :param time_in_minutes: Match time of the snapshot.
+        :param probability: Predicted win probability, or None.
+        :param team_composition: Hero labels of the own team, as returned by get_stats_and_details.
+        """
+        if self._length == len(self._records):
+            grown = np.zeros(max(2 * len(self._records), 1), dtype=TIMELINE_DTYPE)
+            grown[:self._length] = self._records[:self._length]
+            self._records = grown
+
+        position = self._length
+        if self._length and time_in_minutes < self._records[self._length - 1]["time"]:
+            position = int(np.searchsorted(self.times, time_in_minutes, side="right"))
+            self._records[position + 1:self._length + 1] = self._records[position:self._length]
+
+        record = self._records[position]
+        rows = np.asarray(stats, dtype=np.int32).reshape(-1, len(STAT_NAMES))[:N_PLAYERS]
+        record["stats"] = 0
+        record["stats"][:len(rows)] = rows
+        record["time"] = time_in_minutes
+        record["probability"] = np.nan if probability is None else probability
+        record["heroes"] = NO_HERO
+        for i, hero in enumerate(list(team_composition or [])[:TEAM_SIZE]):
+            if hero is not None:
+                record["heroes"][i] = self._hero_id(hero)
+        self._length += 1
+
+    def _hero_id(self, hero):
+        hero_id = self._hero_ids.get(hero)
+        if hero_id is None:
+            hero_id = self._hero_ids[hero] = len(self.hero_names)
+            self.hero_names.append(hero)
+        return hero_id
+
+    def between(self, start_minutes=None, end_minutes=None):
+        """Records of the snapshots with start_minutes <= time <= end_minutes (a view)."""
+        times = self.times
+        start = 0 if start_minutes is None else np.searchsorted(times, start_minutes, side="left")
+        end = len(times) if end_minutes is None else np.searchsorted(times, end_minutes, side="right")
+        return self.records[start:end]
+
+    def composition(self, index=-1):
+        """Hero labels of the own team at a snapshot (None for unknown heroes)."""
+        return [self.hero_names[i] if i != NO_HERO else None for i in self.records[index]["heroes"]]
+
+    def chart_points(self):
+        """(times, probabilities) of the snapshots that had a prediction, to replay the win probability chart."""
+        records = self.records[~np.isnan(self.probabilities)]
+        return records["time"].tolist(), records["probability"].astype(float).tolist()
+
+    def trend(self, window_minutes=2.0):
+        """
+        Per player rates of every stat over the last window_minutes of the match.
+
+        :return: (10, 6) array of stat increase per minute between the first snapshot of the window and the
+            latest one, or None with fewer than two snapshots in the window.
+        """
+        if self._length < 2:
+            return None
+        window = self.between(self.times[-1] - window_minutes)
+        elapsed = window["time"][-1] - window["time"][0]
+        if len(window) < 2 or elapsed <= 0:
+            return None
+        return (window["stats"][-1] - window["stats"][0]) / elapsed
+
+    def probability_trend(self, window_minutes=2.0):
+        """Least squares slope of the win probability per minute over the last window_minutes, or None."""
+        if self._length < 2:
+            return None
+        window = self.between(self.times[-1] - window_minutes)
+        window = window[~np.isnan(window["probability"])]
+        if len(window) < 2 or np.ptp(window["time"]) <= 0:
+            return None
+        return float(np.polyfit(window["time"], window["probability"], 1)[0])
+
+
+class MatchTimelineStore:
+    """Timelines of the running match per session, spilled to an append-only file when the match ends."""
+
+    def __init__(self, directory="match_history", capacity=64):
+        """
+        :param directory: Directory of the timeline file and the match index.
+        :param capacity: Initial capacity of every match timeline.
+        """
+        self.directory = directory
+        self.capacity = capacity
+        self._timelines = {}
+        self._match_count = None   # number of stored matches, read from the index once
+        self._lock = native_threading().Lock()
+
+    @property
+    def timeline_path(self):
+        return os.path.join(self.directory, TIMELINE_FILENAME)
+
+    @property
+    def matches_path(self):
+        return os.path.join(self.directory, MATCHES_FILENAME)
+
+    def timeline(self, session=None):
+        """The timeline of the running match of a session, created empty on first use."""
+        with self._lock:
+            return self._timeline(session)
+
+    def _timeline(self, session):
+        timeline = self._timelines.get(session)
+        if timeline is None:
+            timeline = self._timelines[session] = MatchTimeline(self.capacity)
+        return timeline
+
+    def append(self, stats, time_in_minutes, probability=None, team_composition=None, session=None):
+        """Append a snapshot to the running match of a session."""
+        # one lock for lookup and append, so a match ending in between cannot lose the snapshot
+        with self._lock:
+            self._timeline(session).append(stats, time_in_minutes, probability, team_composition)
+
+    def end_match(self, session=None, outcome=None):
+        """
+        Spill the running match of a session to disk and start a new one.
+
+        :param outcome: Optional outcome recorded in the match index.
+        :return: The index record of the match, or None if it had no snapshots.
+        """
+        with self._lock:
+            timeline = self._timelines.pop(session, None)
+        if timeline is None or len(timeline) == 0:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            with open(self.timeline_path, "ab") as f:
+                offset = f.tell() // TIMELINE_DTYPE.itemsize
+                f.write(timeline.records.tobytes())
+            if self._match_count is None:
+                self._match_count = len(self.matches())
+            match = {
+                "match": self._match_count,
+                "offset": offset,
+                "length": len(timeline),
+                "hero_names": timeline.hero_names,
+                "outcome": outcome,
+                "ended_at": time.time(),
+            }
+            with open(self.matches_path, "a") as f:
+                f.write(json.dumps(match) + "\n")
+            self._match_count += 1
+        return match
+
+    def matches(self):
+        """Index records of the stored matches, oldest first."""
+        if not os.path.exists(self.matches_path):
+            return []
+        with open(self.matches_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def load_match(self, match):
+        """
+        A stored match as a MatchTimeline over a read-only memory map of its records.
+
+        :param match: Index record from matches(), or its number.
+        """
+        if not isinstance(match, dict):
+            match = self.matches()[match]
+        records = np.memmap(self.timeline_path, dtype=TIMELINE_DTYPE, mode="r",
+                            offset=match["offset"] * TIMELINE_DTYPE.itemsize, shape=(match["length"],))
+        return MatchTimeline(records=records, hero_names=match["hero_names"])
+
+    def stats(self):
+        """Return the number of running matches and their snapshots."""
+        with self._lock:
+            return {
+                "running_matches": len(self._timelines),
+                "snapshots": sum(len(timeline) for timeline in self._timelines.values()),
+            }
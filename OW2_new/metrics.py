@@ -0,0 +1,191 @@
+"""Per-stage latency histograms and counters of the screenshot pipeline.
+
+Stages are timed with ``timer`` (or the ``timed`` decorator); every stage keeps its count, total and a window
+of its most recent durations, from which p50/p95/p99 are computed when a snapshot is taken. Recording costs a
+perf_counter call and an append under a lock, so it stays on in production.
+
+A snapshot is served as JSON on a localhost HTTP endpoint and/or logged periodically, both started from the
+environment by UserPredictor (``start_from_environment``):
+
+- ``OW2_METRICS_PORT``: serve ``GET /metrics`` on 127.0.0.1 at this port.
+- ``OW2_METRICS_DUMP_SECONDS``: log a snapshot at INFO level every this many seconds.
+"""
+
+import functools
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from models.OW2_new.threading_utils import native_threading, start_daemon_thread
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsRegistry:
+    """Thread-safe registry of stage durations, counters and gauges."""
+
+    def __init__(self, window=2048):
+        """
+        :param window: Number of most recent durations per stage the percentiles are computed from.
+        """
+        self.window = window
+        self._lock = native_threading().Lock()
+        self._durations = {}
+        self._counts = {}
+        self._totals = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, stage, seconds):
+        """Record one duration of a stage."""
+        with self._lock:
+            durations = self._durations.get(stage)
+            if durations is None:
+                durations = self._durations[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+                self._totals[stage] = 0.0
+            durations.append(seconds)
+            self._counts[stage] += 1
+            self._totals[stage] += seconds
+
+    @contextmanager
+    def timer(self, stage):
+        """Time the body of a with statement as one duration of stage (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator timing every call of the function as stage."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def increment(self, name, value=1):
+        """Add value to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_gauge(self, name, callback):
+        """Include the value returned by callback() (e.g. a stats() dict) in every snapshot."""
+        with self._lock:
+            self._gauges[name] = callback
+
+    def snapshot(self):
+        """Return the stage latencies (ms), counters and gauges as a JSON serialisable dict."""
+        with self._lock:
+            durations = {stage: np.array(values) for stage, values in self._durations.items()}
+            counts, totals = dict(self._counts), dict(self._totals)
+            counters, gauges = dict(self._counters), dict(self._gauges)
+
+        stages = {}
+        for stage, values in sorted(durations.items()):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            stages[stage] = {
+                "count": counts[stage],
+                "mean_ms": 1000 * totals[stage] / counts[stage],
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(values.max() * 1000),
+            }
+
+        gauge_values = {}
+        for name, callback in gauges.items():
+            try:
+                gauge_values[name] = callback()
+            except Exception as e:
+                gauge_values[name] = f"error: {e}"
+        return {"stages": stages, "counters": counters, "gauges": gauge_values}
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+
+# the registry shared by the whole pipeline
+registry = MetricsRegistry()
+timer = registry.timer
+timed = registry.timed
+observe = registry.observe
+increment = registry.increment
+register_gauge = registry.register_gauge
+snapshot = registry.snapshot
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.registry.snapshot(), indent=2, default=str).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics endpoint: " + format, *args)
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=registry):
+    """Serve the registry's snapshot as JSON on http://host:port/metrics from a native daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    start_daemon_thread(server.serve_forever, name="metrics-server")
+    logger.info("Serving pipeline metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def start_periodic_dump(interval, registry=registry):
+    """Log the registry's snapshot at INFO level every interval seconds from a native daemon thread."""
+    stop = native_threading().Event()
+
+    def dump():
+        while not stop.wait(interval):
+            logger.info("Pipeline metrics: %s", json.dumps(registry.snapshot(), default=str))
+
+    start_daemon_thread(dump, name="metrics-dump")
+    return stop
+
+
+_started = False
+
+
+def start_from_environment():
+    """Start the endpoint and/or periodic dump configured by OW2_METRICS_PORT and OW2_METRICS_DUMP_SECONDS, once."""
+    global _started
+    if _started:
+        return
+    _started = True
+
+    port = os.environ.get("OW2_METRICS_PORT")
+    if port:
+        try:
+            start_metrics_server(int(port))
+        except (OSError, ValueError) as e:
+            logger.warning("Could not start the metrics endpoint on port %s: %s", port, e)
+
+    interval = os.environ.get("OW2_METRICS_DUMP_SECONDS")
+    if interval:
+        start_periodic_dump(float(interval))
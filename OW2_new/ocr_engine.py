@@ -0,0 +1,318 @@
+"""OCR backends used to read the scoreboard.
+
+Every engine is long-lived: create it once (ImageParser does) and reuse it for every screenshot.
+
+- ``TesseractEngine`` runs one pytesseract call (one tesseract process) per image on a persistent thread pool.
+- ``TiledTesseractEngine`` stitches a grid of cells into one tiled image, runs tesseract once and maps the
+  recognised words back to their cells by bounding box.
+- ``TesserocrEngine`` keeps a pool of initialised Tesseract APIs in-process (the ``tesserocr`` package, with the
+  language data of ``tessdata.eng``), so no process is spawned at all. It is the default ("auto") engine.
+- ``ProcessOCREngine`` (process_ocr) OCRs numeric cells on a pool of worker processes fed through shared memory.
+"""
+
+import os
+import queue
+import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # optional dependency
+    tesserocr = None
+
+try:
+    import tessdata
+except ImportError:  # optional dependency, the language data installed by the tessdata.eng package
+    tessdata = None
+
+
+def tessdata_path(lang="eng"):
+    """
+    Find the directory of the Tesseract language data used by tesserocr.
+
+    :param lang: Language whose traineddata file must be present.
+    :return: TESSDATA_PREFIX if set, else the directory of the pip installed tessdata packages if it holds the
+        language, else None (tesserocr then uses the path it was built with).
+    """
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    if tessdata is not None and os.path.exists(os.path.join(tessdata.data_path(), f"{lang}.traineddata")):
+        return tessdata.data_path()
+    return None
+
+
+def tesserocr_available(lang="eng"):
+    """True if tesserocr is installed and finds the language data."""
+    if tesserocr is None:
+        return False
+    path = tessdata_path(lang)
+    _, languages = tesserocr.get_languages(path) if path else tesserocr.get_languages()
+    return lang in languages
+
+
+def parse_tesseract_config(config):
+    """
+    Split a tesseract command line config into its page segmentation mode, engine mode and variables.
+
+    :param config: Config string, e.g. "--psm 6 -c tessedit_char_whitelist=0123456789".
+    :return: A tuple (psm, oem, variables) where psm/oem are ints or None and variables is a dict.
+    """
+    psm, oem, variables = None, None, {}
+    tokens = shlex.split(config or "")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "--psm" and i + 1 < len(tokens):
+            psm = int(tokens[i + 1])
+            i += 1
+        elif token == "--oem" and i + 1 < len(tokens):
+            oem = int(tokens[i + 1])
+            i += 1
+        elif token == "-c" and i + 1 < len(tokens):
+            key, _, value = tokens[i + 1].partition("=")
+            variables[key] = value
+            i += 1
+        i += 1
+    return psm, oem, variables
+
+
+class OCREngine:
+    """Base class for OCR engines."""
+
+    name = "base"
+
+    def image_to_string(self, image, config=""):
+        """
+        Recognise the text in a single image.
+
+        :param image: Grayscale or BGR image as NumPy array.
+        :param config: Tesseract style config string.
+        :return: The recognised text.
+        """
+        raise NotImplementedError
+
+    def recognize_grid(self, cells, config=""):
+        """
+        Recognise the text of a grid of cells (e.g. the sections of every stat row).
+
+        :param cells: List of rows, each a list of images.
+        :param config: Tesseract style config string.
+        :return: List of rows, each a list of recognised strings.
+        """
+        return [[self.image_to_string(cell, config) for cell in row] for row in cells]
+
+    def close(self):
+        """Release the resources held by the engine."""
+
+
+class TesseractEngine(OCREngine):
+    """One pytesseract call per image, run on a thread pool that lives as long as the engine."""
+
+    name = "tesseract"
+
+    def __init__(self, max_workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr")
+
+    def image_to_string(self, image, config=""):
+        return pytesseract.image_to_string(image, config=config)
+
+    def recognize_grid(self, cells, config=""):
+        futures = [[self.executor.submit(self.image_to_string, cell, config) for cell in row] for row in cells]
+        return [[f.result() for f in row] for row in futures]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class TiledTesseractEngine(TesseractEngine):
+    """
+    Recognise a grid of cells with a single tesseract call.
+
+    Cells are pasted into fixed size slots of one tiled image, separated by background padding wide enough
+    that tesseract never joins words across cells. The words found by ``image_to_data`` are assigned to the
+    slot that contains the centre of their bounding box.
+    """
+
+    name = "tiled"
+
+    def __init__(self, padding=32, background=0, tiled_psm=11, max_workers=None):
+        """
+        :param padding: Pixels of background around every cell.
+        :param background: Background value of the tiled image (the processed scoreboard is white on black).
+        :param tiled_psm: Page segmentation mode used for the tiled image (11 = sparse text).
+        :param max_workers: Threads used for single image calls.
+        """
+        super().__init__(max_workers=max_workers)
+        self.padding = padding
+        self.background = background
+        self.tiled_psm = tiled_psm
+
+    def build_tiled_image(self, cells):
+        """
+        Paste the cells into one image.
+
+        :param cells: List of rows, each a list of grayscale images.
+        :return: A tuple (tiled_image, slot_width_edges, slot_height) where slot_width_edges holds the x
+            coordinate where each column slot starts (plus the end of the last one).
+        """
+        n_cols = max(len(row) for row in cells)
+        col_widths = [0] * n_cols
+        slot_height = 0
+        for row in cells:
+            for j, cell in enumerate(row):
+                col_widths[j] = max(col_widths[j], cell.shape[1])
+                slot_height = max(slot_height, cell.shape[0])
+
+        col_edges = np.concatenate([[0], np.cumsum(np.array(col_widths) + 2 * self.padding)])
+        slot_height += 2 * self.padding
+
+        tiled = np.full((slot_height * len(cells), int(col_edges[-1])), self.background, dtype=np.uint8)
+        for i, row in enumerate(cells):
+            for j, cell in enumerate(row):
+                y = i * slot_height + self.padding
+                x = int(col_edges[j]) + self.padding
+                tiled[y:y + cell.shape[0], x:x + cell.shape[1]] = cell
+        return tiled, col_edges, slot_height
+
+    def recognize_grid(self, cells, config=""):
+        if not cells:
+            return []
+
+        gray_cells = [[self._to_gray(cell) for cell in row] for row in cells]
+        tiled, col_edges, slot_height = self.build_tiled_image(gray_cells)
+
+        _, oem, variables = parse_tesseract_config(config)
+        tiled_config = f"--psm {self.tiled_psm}"
+        if oem is not None:
+            tiled_config += f" --oem {oem}"
+        tiled_config += "".join(f" -c {key}={value}" for key, value in variables.items())
+
+        data = pytesseract.image_to_data(tiled, config=tiled_config, output_type=pytesseract.Output.DICT)
+
+        words = [[[] for _ in row] for row in cells]
+        for text, left, top, width, height in zip(data["text"], data["left"], data["top"],
+                                                  data["width"], data["height"]):
+            text = text.strip()
+            if not text:
+                continue
+            i = int((top + height / 2) // slot_height)
+            j = int(np.searchsorted(col_edges, left + width / 2, side="right")) - 1
+            if 0 <= i < len(cells) and 0 <= j < len(cells[i]):
+                words[i][j].append((left, text))
+
+        return [[" ".join(text for _, text in sorted(cell_words)) for cell_words in row] for row in words]
+
+    @staticmethod
+    def _to_gray(image):
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+class TesserocrEngine(OCREngine):
+    """In-process Tesseract through tesserocr, with a pool of APIs that stay initialised between calls."""
+
+    name = "tesserocr"
+
+    def __init__(self, max_workers=4, lang="eng", path=None):
+        """
+        :param max_workers: Number of warm Tesseract APIs (and worker threads).
+        :param lang: Tesseract language.
+        :param path: Directory of the language data. Defaults to tessdata_path(lang).
+        """
+        if tesserocr is None:
+            raise ImportError("tesserocr is not installed; use the 'tesseract' or 'tiled' OCR backend instead.")
+        self.lang = lang
+        self.path = path or tessdata_path(lang)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tesserocr")
+        self._apis_by_oem = {}
+        self._lock = threading.Lock()
+        self.max_workers = max_workers
+
+    def _acquire(self, oem):
+        with self._lock:
+            pool = self._apis_by_oem.get(oem)
+            if pool is None:
+                pool = queue.Queue()
+                kwargs = {"lang": self.lang}
+                if self.path:
+                    kwargs["path"] = self.path
+                if oem is not None:
+                    kwargs["oem"] = oem
+                for _ in range(self.max_workers):
+                    pool.put(tesserocr.PyTessBaseAPI(**kwargs))
+                self._apis_by_oem[oem] = pool
+        return pool, pool.get()
+
+    def image_to_string(self, image, config=""):
+        psm, oem, variables = parse_tesseract_config(config)
+        pool, api = self._acquire(oem)
+        try:
+            api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+            for key, value in variables.items():
+                api.SetVariable(key, value)
+
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            image = np.ascontiguousarray(image)
+            bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+            api.SetImageBytes(image.tobytes(), image.shape[1], image.shape[0], bytes_per_pixel,
+                              image.shape[1] * bytes_per_pixel)
+            text = api.GetUTF8Text()
+
+            # variables persist on the API, so undo them before it goes back to the pool
+            for key in variables:
+                api.SetVariable(key, "")
+            api.Clear()
+            return text
+        finally:
+            pool.put(api)
+
+    def recognize_grid(self, cells, config=""):
+        futures = [[self.executor.submit(self.image_to_string, cell, config) for cell in row] for row in cells]
+        return [[f.result() for f in row] for row in futures]
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for pool in self._apis_by_oem.values():
+            while not pool.empty():
+                pool.get().End()
+        self._apis_by_oem.clear()
+
+
+OCR_ENGINES = {
+    TesseractEngine.name: TesseractEngine,
+    TiledTesseractEngine.name: TiledTesseractEngine,
+    TesserocrEngine.name: TesserocrEngine,
+}
+
+
+def create_ocr_engine(backend="auto", **kwargs):
+    """
+    Create an OCR engine by name.
+
+    :param backend: One of "tesseract", "tiled", "tesserocr", "digits" (the built-in digit recognizer, for
+        numeric cells only), "process" (numeric cells OCR'd by worker processes, see process_ocr), or "auto"
+        (tesserocr if it is installed and finds its language data, else tesseract). "tiled" changes the page
+        segmentation of the stat cells and is only used when asked for.
+    :param kwargs: Passed to the engine constructor.
+    :return: An OCREngine instance.
+    """
+    if isinstance(backend, OCREngine):
+        return backend
+    if backend == "digits":
+        from models.OW2_new.digit_recognizer import DigitRecognizer
+        return DigitRecognizer(**kwargs)
+    if backend == "process":
+        from models.OW2_new.process_ocr import ProcessOCREngine
+        return ProcessOCREngine(**kwargs)
+    if backend == "auto":
+        backend = TesserocrEngine.name if tesserocr_available() else TesseractEngine.name
+    if backend not in OCR_ENGINES:
+        raise ValueError(f"Unknown OCR backend: {backend}. Expected one of {sorted(OCR_ENGINES)} or 'auto'.")
+    return OCR_ENGINES[backend](**kwargs)
@@ -0,0 +1,138 @@
+"""Perceptual-hash cache of hero portrait classifications."""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# The left part of a portrait crop is the role icon on black, which portraits of the same role share; only the
+# hero face to its right is hashed.
+FACE_LEFT = 0.55
+
+
+def dhash(image, hash_size=8):
+    """
+    Compute the difference hash of an image.
+
+    :param image: Grayscale or BGR image as NumPy array.
+    :param hash_size: The hash has hash_size * hash_size bits (at most 64).
+    :return: The hash as a Python int.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (resized[:, 1:] > resized[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+
+def portrait_hash(image, hash_size=8):
+    """
+    Compute the dHash of the hero face of a portrait crop (the part right of the role icon).
+
+    :param image: Portrait crop as NumPy array (Frame.portraits).
+    :param hash_size: The hash has hash_size * hash_size bits (at most 64).
+    :return: The hash as a Python int.
+    """
+    return dhash(image[:, int(image.shape[1] * FACE_LEFT):], hash_size)
+
+
+def hamming_distances(hashes, value):
+    """
+    Hamming distance between every hash in an array and a value.
+
+    :param hashes: Array of uint64 hashes.
+    :param value: Hash to compare against.
+    :return: Array of distances.
+    """
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class PortraitCache:
+    """
+    LRU cache mapping (row, portrait hash) to (label, confidence).
+
+    A lookup hits when a cached hash of the same scoreboard row lies within max_distance bits of the portrait's
+    hash, so small changes between screenshots (ultimate charge, compression noise) still hit while a hero swap
+    misses. Only the hero face is hashed (see portrait_hash), and rows are never matched against each other.
+    """
+
+    def __init__(self, max_size=256, max_distance=4, hash_size=8):
+        """
+        :param max_size: Maximum number of cached portraits; the least recently used one is evicted.
+        :param max_distance: Maximum Hamming distance between hashes for a hit.
+        :param hash_size: dHash size (hash_size * hash_size bits).
+        """
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+
+        self._entries = OrderedDict()   # (row, hash) -> (label, confidence), least recently used first
+        self._keys = {}  # row -> uint64 array of the row's entry hashes, rebuilt lazily after inserts and evictions
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def hash(self, image):
+        return portrait_hash(image, self.hash_size)
+
+    def _row_keys(self, row):
+        keys = self._keys.get(row)
+        if keys is None:
+            keys = self._keys[row] = np.array([h for r, h in self._entries if r == row], dtype=np.uint64)
+        return keys
+
+    def get(self, portrait_hash, row=None):
+        """
+        Look up a portrait hash.
+
+        :param portrait_hash: Hash from PortraitCache.hash.
+        :param row: Scoreboard row of the portrait; only entries of the same row can hit.
+        :return: The cached (label, confidence), or None on a miss.
+        """
+        with self._lock:
+            keys = self._row_keys(row)
+            if len(keys):
+                distances = hamming_distances(keys, portrait_hash)
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    key = (row, int(keys[best]))
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, portrait_hash, label, confidence, row=None):
+        """Store the classification of a portrait hash, evicting the least recently used entry if needed."""
+        key = (row, portrait_hash)
+        with self._lock:
+            self._entries[key] = (label, confidence)
+            self._entries.move_to_end(key)
+            self._keys.pop(row, None)
+            while len(self._entries) > self.max_size:
+                (evicted_row, _), _ = self._entries.popitem(last=False)
+                self._keys.pop(evicted_row, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def stats(self):
+        """Return the hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
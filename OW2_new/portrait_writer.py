@@ -0,0 +1,234 @@
+"""Background writer of portrait captures (hidden or unknown heroes) collected as training data.
+
+Portraits are handed over with ``submit``, which only copies the crop into a bounded queue; a native daemon
+thread hashes, encodes and writes them. Portraits whose face dHash (portrait_hash) lies within max_distance bits
+of one already on disk are skipped, so the same hero seen on every screenshot of a match is stored once. Every
+stored portrait gets a line in the sidecar index (``index.jsonl``) with its hash, predicted label and confidence.
+Once the directory holds more than max_files portraits or max_bytes bytes, the oldest ones are deleted.
+
+    writer = get_portrait_writer("hidden")
+    writer.submit(portrait, label="label_Hidden", confidence=0.42)
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+import cv2
+import numpy as np
+
+from models.OW2_new import metrics
+from models.OW2_new.portrait_cache import hamming_distances, portrait_hash
+from models.OW2_new.threading_utils import native_threading, start_daemon_thread
+
+INDEX_FILENAME = "index.jsonl"
+
+logger = logging.getLogger(__name__)
+
+
+class PortraitWriter:
+    """Deduplicating, size limited writer of portraits that runs off the request path."""
+
+    def __init__(self, directory="hidden", max_queue=64, max_distance=4, hash_size=8, max_files=5000,
+                 max_bytes=256 * 1024 * 1024, low_water=0.9):
+        """
+        :param directory: Directory the portraits and their index are written to.
+        :param max_queue: Portraits waiting to be written; further submissions are dropped until it drains.
+        :param max_distance: Portraits within this dHash Hamming distance of a stored one are duplicates.
+        :param hash_size: dHash size (hash_size * hash_size bits).
+        :param max_files: Maximum number of stored portraits.
+        :param max_bytes: Maximum total size of the stored portraits.
+        :param low_water: When a limit is exceeded, the oldest portraits are deleted until the directory is at
+            this fraction of both limits, so the index is not rewritten for every new portrait.
+        """
+        self.directory = directory
+        self.max_queue = max_queue
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+
+        threading = native_threading()
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._queue = deque()
+        self._busy = False
+        self._closed = False
+
+        self._entries = OrderedDict()   # filename -> index record, oldest first
+        self._hashes = None             # uint64 array of the stored hashes, rebuilt lazily
+        self._total_bytes = 0
+        self._load_index()
+
+        self.submitted = 0
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.deleted = 0
+        self.failed = 0
+
+        self._thread = start_daemon_thread(self._run, name="portrait-writer")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def _load_index(self):
+        """Restore the stored portraits from the index, skipping records whose file is gone."""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                path = os.path.join(self.directory, record.get("file", ""))
+                if os.path.isfile(path):
+                    self._entries[record["file"]] = record
+                    self._total_bytes += record["bytes"]
+
+    def submit(self, image, label=None, confidence=None):
+        """
+        Queue a portrait to be written. Returns immediately.
+
+        :param image: Portrait as NumPy array; copied, so it may be a view into a frame.
+        :param label: Predicted label stored in the index.
+        :param confidence: Confidence of the predicted label.
+        :return: False if the portrait was dropped because the queue is full, True otherwise.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The portrait writer is closed.")
+            self.submitted += 1
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return False
+            self._queue.append((np.array(image), label, None if confidence is None else float(confidence),
+                                time.time()))
+            self._work_available.notify()
+            return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._work_available.wait()
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                self._busy = True
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.warning("Writing a portrait to %s failed: %s", self.directory, e)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self._busy = False
+                    self._work_available.notify_all()
+
+    def _write(self, image, label, confidence, submitted_at):
+        face_hash = portrait_hash(image, self.hash_size)
+        if self._entries:
+            if self._hashes is None:
+                self._hashes = np.array([int(record["hash"], 16) for record in self._entries.values()],
+                                        dtype=np.uint64)
+            if hamming_distances(self._hashes, face_hash).min() <= self.max_distance:
+                with self._lock:
+                    self.duplicates += 1
+                return
+
+        with metrics.timer("portrait_write"):
+            os.makedirs(self.directory, exist_ok=True)
+            filename = f"{face_hash:0{self.hash_size * self.hash_size // 4}x}.png"
+            path = os.path.join(self.directory, filename)
+            if not cv2.imwrite(path, image):
+                raise OSError(f"cv2.imwrite could not write {path}")
+
+            record = {"file": filename, "hash": f"{face_hash:x}", "label": label, "confidence": confidence,
+                      "time": submitted_at, "bytes": os.path.getsize(path)}
+            self._entries[filename] = record
+            self._total_bytes += record["bytes"]
+            self._hashes = None
+
+            if len(self._entries) > self.max_files or self._total_bytes > self.max_bytes:
+                self._rotate()
+            else:
+                with open(self.index_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        with self._lock:
+            self.written += 1
+
+    def _rotate(self):
+        """Delete the oldest portraits down to the low water mark and rewrite the index."""
+        max_files = int(self.max_files * self.low_water)
+        max_bytes = self.max_bytes * self.low_water
+        while self._entries and (len(self._entries) > max_files or self._total_bytes > max_bytes):
+            filename, record = self._entries.popitem(last=False)
+            self._total_bytes -= record["bytes"]
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self.deleted += 1
+
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            for record in self._entries.values():
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_path, self.index_path)
+
+    def flush(self, timeout=None):
+        """Wait until every queued portrait has been written (or skipped). Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._work_available.wait(remaining)
+        return True
+
+    def stats(self):
+        """Return the queue depth, stored portraits and counters of the writer."""
+        with self._lock:
+            return {
+                "queue_depth": len(self._queue),
+                "stored": len(self._entries),
+                "stored_bytes": self._total_bytes,
+                "submitted": self.submitted,
+                "written": self.written,
+                "duplicates": self.duplicates,
+                "dropped": self.dropped,
+                "deleted": self.deleted,
+                "failed": self.failed,
+            }
+
+    def close(self, wait=True, timeout=None):
+        """Stop accepting portraits; the queued ones are still written."""
+        with self._lock:
+            self._closed = True
+            self._work_available.notify_all()
+        if wait:
+            self._thread.join(timeout)
+
+
+_writers = {}
+_writers_lock = native_threading().Lock()
+
+
+def get_portrait_writer(directory="hidden", **kwargs):
+    """Return the shared writer of a directory, creating it (with kwargs) on first use."""
+    directory = os.path.abspath(directory)
+    with _writers_lock:
+        writer = _writers.get(directory)
+        if writer is None:
+            writer = _writers[directory] = PortraitWriter(directory, **kwargs)
+            metrics.register_gauge(f"portrait_writer:{os.path.basename(directory)}", writer.stats)
+        return writer
@@ -1,116 +1,331 @@
 # The best OW2_new model created
-import pickle
+import logging
 import re
 
-import cv2
-import joblib
 import numpy as np
-import pytesseract
-from torch.ao.nn.quantized.functional import threshold
 
 from models import PredictorInterface
-from models.OW2_new.image_parser import ImageParser
-from models.OW2_new.image_utils import generate_sub_images
+from models.OW2_new import metrics
+from models.OW2_new.image_utils import PORTRAIT_WIDTH, as_frame, describe_image
+from models.OW2_new.scheduler import ScreenshotScheduler
+from models.OW2_new.threading_utils import native_threading, start_daemon_thread
+from models.OW2_new.timer_reader import reading_minutes
 
-from models.OW2_new.custom_transformers import *
+MODEL_PATH = "models/OW2_new/latest_model.pth"
+PIPELINE_PATH = "models/OW2_new/prediction_pipeline.pkl"
 
-import pandas as pd
+logger = logging.getLogger(__name__)
+
+# the custom image parser is created on first use (torch, torchvision and the model are only loaded then)
+_classifier = None
+_classifier_options = {}
+_classifier_lock = native_threading().Lock()
+
+
+def configure_classifier(**options):
+    """
+    Set the ImageParser keyword arguments (ocr_backend, inference_backend, ...) of the shared classifier.
+    A classifier already loaded is dropped and rebuilt with them on next use.
+    """
+    global _classifier
+    with _classifier_lock:
+        _classifier_options.clear()
+        _classifier_options.update(options)
+        _classifier = None
+
+
+def get_classifier():
+    """Return the shared ImageParser, loading it on first use. Thread-safe."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                from models.OW2_new.image_parser import ImageParser
+                _classifier = ImageParser(**{"model_path": MODEL_PATH, **_classifier_options})
+                metrics.register_gauge("portrait_cache", _classifier.portrait_cache_stats)
+    return _classifier
+
+
+def reset_session(session=None):
+    """
+    Forget the portrait, stat cell, stats table and timer state cached for a session, e.g. when its match ends.
+    Does nothing if the classifier has not been loaded yet.
+    """
+    classifier = _classifier
+    if classifier is not None:
+        classifier.reset_session(session)
+
+
+def __getattr__(name):
+    # keep `predictor.classifier` working without building the model at import time
+    if name == "classifier":
+        return get_classifier()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_pipeline(pipeline_path=PIPELINE_PATH):
+    """Load the pickled sklearn prediction pipeline."""
+    import joblib
+
+    # the pickle references the custom transformers, import them before loading
+    import models.OW2_new.custom_transformers  # noqa: F401
+    return joblib.load(pipeline_path)
+
+
+def stats_to_dataframe(stats, time_in_minutes):
+    """Convert the 10 rows of stats into the DataFrame layout the pipeline was trained on."""
+    import pandas as pd
+
+    # each row represents a playerID and a new column with SnapID = 0 for entire column
+    df = pd.DataFrame(stats, columns=['K', 'A', 'D', 'Damage', 'H', 'MIT'])
+    df["Time"] = time_in_minutes
+    df["SnapID"] = 0
+    df["PlayerID"] = np.arange(0, 10)
+    return df
+
+
+def posterior_probability(winning_chances):
+    """
+    Adjust the pipeline's winning chances with the likelihood ratios of its measured sensitivity and specificity.
+
+    :param winning_chances: Array of winning chances (class 1 probabilities).
+    :return: Array of posterior probabilities.
+    """
+    threshold = 0.5
+    sensitivity = 0.6925
+    specificity = 0.6923
+
+    lr_positive = sensitivity / (1 - specificity)
+    lr_negative = (1 - sensitivity) / specificity
+
+    winning_chances = np.asarray(winning_chances, dtype=np.float64)
+    odds_prior = winning_chances / (1 - np.minimum(winning_chances, 0.9999))
+    odds_posterior = odds_prior * np.where(winning_chances > threshold, lr_positive, lr_negative)
+    return odds_posterior / (1 + odds_posterior)
+
+
+def build_fast_pipeline(pipeline, n_snapshots=64, tolerance=1e-9):
+    """
+    Build the NumPy features path of the pipeline and check it against the pickled pipeline.
+
+    :return: The FastFeaturePipeline, or False if it is not supported or not at parity.
+    """
+    from models.OW2_new.fast_pipeline import FastFeaturePipeline, check_parity, random_snapshots
+
+    try:
+        fast_pipeline = FastFeaturePipeline(pipeline)
+        difference = check_parity(pipeline, *random_snapshots(n_snapshots), fast_pipeline=fast_pipeline)
+    except Exception as e:
+        logger.warning("NumPy feature pipeline unavailable, using the pickled pipeline: %s", e)
+        return False
+
+    if difference > tolerance:
+        logger.warning("NumPy feature pipeline differs from the pickled pipeline by %s, not using it.", difference)
+        return False
+    return fast_pipeline
 
-# create global variable for custom image parser
-classifier = ImageParser(model_path="models/OW2_new/latest_model.pth")
 
 class UserPredictor(PredictorInterface):
-    def __init__(self):
-        self.loaded_pipeline = joblib.load('models/OW2_new/prediction_pipeline.pkl')
+    def __init__(self, warm_up=True, start_metrics=True):
+        """
+        :param warm_up: If True, load the classifier and pipeline and run a dummy batch through both on a
+            background thread, so the first screenshot does not pay the cold-start cost.
+        :param start_metrics: If True, start the metrics endpoint and/or periodic dump configured in the
+            environment. Worker processes pass False so only their parent binds OW2_METRICS_PORT.
+        """
+        self._loaded_pipeline = None
+        self._fast_pipeline = None
+        self._pipeline_lock = native_threading().Lock()
+        self._scheduler = None
+        self._scheduler_lock = native_threading().Lock()
+        self.ready = native_threading().Event()
+        if start_metrics:
+            metrics.start_from_environment()
+
+        if warm_up:
+            start_daemon_thread(self.warm_up, name="predictor-warm-up")
+
+    @property
+    def loaded_pipeline(self):
+        """The prediction pipeline, loaded on first use. Thread-safe."""
+        if self._loaded_pipeline is None:
+            with self._pipeline_lock:
+                if self._loaded_pipeline is None:
+                    self._loaded_pipeline = load_pipeline()
+        return self._loaded_pipeline
+
+    @property
+    def fast_pipeline(self):
+        """
+        The NumPy features path of the pipeline, or False if the pickled pipeline is not supported by it or
+        its predictions differ from the pickled pipeline on random snapshots.
+        """
+        if self._fast_pipeline is None:
+            pipeline = self.loaded_pipeline
+            with self._pipeline_lock:
+                if self._fast_pipeline is None:
+                    self._fast_pipeline = build_fast_pipeline(pipeline)
+        return self._fast_pipeline
+
+    @property
+    def is_ready(self):
+        """True once the models are loaded and warmed up."""
+        return self.ready.is_set()
+
+    def warm_up(self):
+        """Load the classifier and pipeline and run a dummy batch through each."""
+        try:
+            classifier = get_classifier()
+            if classifier.model is not None:
+                classifier.predict([np.zeros((62, PORTRAIT_WIDTH), dtype=np.uint8)] * 5)
+
+            self.predict_probability_batch(np.zeros((1, 10, 6)), [1.0])
+            self.ready.set()
+            logger.info("Predictor warm-up finished.")
+        except Exception as e:
+            logger.error("Predictor warm-up failed: %s", e)
+
+    def screenshot_scheduler(self, events_handler=None, socket_object=None, **options):
+        """
+        The ScreenshotScheduler processing screenshots with this predictor, created on first call. Thread-safe.
+
+        :param events_handler: Handler the results are emitted to (GAME_PREDICTION and GAME_DETAILS).
+        :param socket_object: Socket passed to the events handler.
+        :param options: Further ScreenshotScheduler arguments (workers, max_pending_sessions, on_result).
+        """
+        if self._scheduler is None:
+            with self._scheduler_lock:
+                if self._scheduler is None:
+                    self._scheduler = ScreenshotScheduler(self, events_handler, socket_object, **options)
+        return self._scheduler
+
+    def submit_screenshot(self, session, screenshot, events_handler=None, socket_object=None):
+        """
+        Queue a screenshot to be processed off the event loop, latest wins per session, and its results emitted
+        to the events handler. Call instead of get_stats_and_details and predict_probability on the event loop.
+
+        :param session: Session key of the player's browser or capture client.
+        :param screenshot: Anything get_stats_and_details accepts.
+        :param events_handler: Handler the results are emitted to; only used by the first call.
+        :param socket_object: Socket passed to the events handler; only used by the first call.
+        :return: False if the screenshot was rejected because too many sessions are waiting, True otherwise.
+        """
+        return self.screenshot_scheduler(events_handler, socket_object).submit(session, screenshot)
 
     def predict_probability(self, stats, game_details):
         time_in_minutes, team_composition = game_details
 
         # return nothing if the there are 5 or more players missing
         if not stats or len(stats) < 5 or time_in_minutes is None:
-            print(len(stats), stats)
+            logger.debug("Not enough data to predict: %d stat rows, time %s", len(stats or []), time_in_minutes)
             return None
 
-        if time_in_minutes < 1.0:
-            time_in_minutes = 1
+        return float(self.predict_probability_batch([stats], [time_in_minutes])[0])
 
-        # convert the stats into a dataframe with each row representing a playerID and a new column with SnapID = 0 for entire column
-        df = pd.DataFrame(stats, columns=['K', 'A', 'D', 'Damage', 'H', 'MIT'])
-        df["Time"] = time_in_minutes
-        df["SnapID"] = 0
-        df["PlayerID"] = np.arange(0, 10)
-
-        print(df)
-
-        winning_chances = self.loaded_pipeline.predict_proba(df)[0][1]
-        threshold = 0.5
-        sensitivity = 0.6925
-        specificity = 0.6923
-
-        lr_positive = sensitivity / (1 - specificity)
-        lr_negative = (1 - sensitivity) / specificity
-
-        odds_prior = winning_chances / (1 - min(winning_chances, 0.9999))
-        if winning_chances > threshold:
-            odds_posterior = odds_prior * lr_positive
-        else:
-            odds_posterior = odds_prior * lr_negative
-
-        posterior_prob = odds_posterior / (1 + odds_posterior)
+    def predict_probability_batch(self, stats_batch, times):
+        """
+        Score many snapshots in one vectorized call.
 
-        return posterior_prob
+        :param stats_batch: Array-like of shape (N, 10, 6) with the K, A, D, Damage, H and MIT of every player.
+        :param times: Array-like of shape (N,) with the match time of each snapshot in minutes.
+        :return: Array of shape (N,) with the posterior winning probability of each snapshot.
+        """
+        stats_batch = np.asarray(stats_batch, dtype=np.float64)
+        if stats_batch.ndim != 3 or stats_batch.shape[1:] != (10, 6):
+            raise ValueError(f"Expected stats of shape (N, 10, 6), got {stats_batch.shape}")
+        times = np.maximum(np.asarray(times, dtype=np.float64), 1.0)
+
+        with metrics.timer("pipeline_predict"):
+            if self.fast_pipeline:
+                winning_chances = self.fast_pipeline.predict_proba(stats_batch, times)[:, 1]
+            else:
+                from models.OW2_new.fast_pipeline import stats_batch_to_dataframe
+                winning_chances = self.loaded_pipeline.predict_proba(
+                    stats_batch_to_dataframe(stats_batch, times))[:, 1]
+        return posterior_probability(winning_chances)
 
-    def get_stats_and_details(self, filename):
+    @metrics.timed("get_stats_and_details")
+    def get_stats_and_details(self, filename, session=None):
         """
         Extract the stats and details from the given image.
-        :param filename: The filename of the image.
+        :param filename: The filename of the image, or the screenshot in memory: a Frame, a BGR array (e.g. a
+            np.memmap of a raw frame) or the encoded image bytes. Raw frame files (.bgr) are memory-mapped.
+        :param session: Optional session key; consecutive screenshots of a session share cached results.
         :return: A tuple of stats and game details. None if the image could not be read or the dimensions are too small.
         """
-        image = cv2.imread(filename)
-        if image is None:
-            print(f"Error reading image: {filename}")
+        # decode the screenshot once; every crop below is a view into this frame
+        try:
+            frame = as_frame(filename, session=session)
+        except ValueError:
+            logger.warning("Error reading image: %s", describe_image(filename))
             return None
 
-        if image.shape[0] < 100 or image.shape[1] < 750:
-            print(f"Image dimensions are too small: {image.shape}")
+        if frame.shape[0] < 100 or frame.shape[1] < 750:
+            logger.warning("Image dimensions are too small: %s", frame.shape)
             return None
 
-        header_image = image[:100, 120:750]
-        custom_config = r'--oem 3 --psm 6'
-        header_text = pytesseract.image_to_string(header_image, config=custom_config)
-        details = [line.strip() for line in header_text.split('\n') if line.strip()]
-
-        time_in_minutes = None
-        for detail in details:
-            if 'TIME:' in detail:
-                time_str = detail.split('TIME:')[-1].strip()
-                match = re.match(r"(?:(\d+):)?(\d+)(?:\.(\d+))?", time_str)
-                if match:
-                    minutes = int(match.group(1)) if match.group(1) else 0
-                    seconds = int(match.group(2))
-                    time_in_minutes = minutes + seconds / 60.0
-                else:
-                    try:
-                        time_in_minutes = float(time_str)
-                    except ValueError:
-                        print(f"Could not parse time: {time_str}")
-                        time_in_minutes = None
-                break
-
-        sub_images = generate_sub_images(filename)
+        classifier = get_classifier()
+
+        header_image = frame.header
+
+        # read the timer with the dedicated reader; OCR of the whole header is only the fallback
+        reading = None
+        if classifier.timer_reader is not None:
+            with metrics.timer("timer_read"):
+                reading = classifier.timer_reader.read(header_image, key=session)
+
+        if reading is not None:
+            time_in_minutes = reading_minutes(reading)
+        else:
+            metrics.increment("timer_fallbacks")
+            custom_config = r'--oem 3 --psm 6'
+            with metrics.timer("header_ocr"):
+                header_text = classifier.ocr_engine.image_to_string(header_image, config=custom_config)
+            time_in_minutes = header_time_minutes(header_text)
+
+        # process the frame and locate the player rows (timed apart from the classification and OCR below)
+        with metrics.timer("prepare_sub_images"):
+            frame.prepare()
 
         # crop and parse character images
-        character_images = [si[:, :91] for si in sub_images]
-        team_composition, _ = classifier.classify_images(character_images,
-                                                         skip_enemy=True)  # TODO process images in batch
+        team_composition, _ = classifier.classify_images(frame, skip_enemy=True)
 
         # crop and parse stat images
-        stat_images = [si[:, 91:] for si in sub_images]
-        stats = classifier.extract_text_from_stats(stat_images)
-        stats = convert_stats_to_int(stats)  # convert stats to integers
+        stats = classifier.extract_text_from_stats(frame)
+        with metrics.timer("convert_stats_to_int"):
+            stats = convert_stats_to_int(stats)  # convert stats to integers
 
         return stats, (time_in_minutes, team_composition)
 
+
+def header_time_minutes(header_text):
+    """
+    Parse the match time from the OCR'd text of the scoreboard header.
+
+    :param header_text: The header text, with a line like "TIME: 6:17".
+    :return: The match time in minutes, or None if there is no parsable time.
+    """
+    details = [line.strip() for line in header_text.split('\n') if line.strip()]
+
+    time_in_minutes = None
+    for detail in details:
+        if 'TIME:' in detail:
+            time_str = detail.split('TIME:')[-1].strip()
+            match = re.match(r"(?:(\d+):)?(\d+)(?:\.(\d+))?", time_str)
+            if match:
+                minutes = int(match.group(1)) if match.group(1) else 0
+                seconds = int(match.group(2))
+                time_in_minutes = minutes + seconds / 60.0
+            else:
+                try:
+                    time_in_minutes = float(time_str)
+                except ValueError:
+                    logger.warning("Could not parse time: %s", time_str)
+                    time_in_minutes = None
+            break
+    return time_in_minutes
+
+
 def calculate_team_statuses(stats):
     """Calculate the status of the tank, dps, and support roles based on the given stats.
 
@@ -150,18 +365,18 @@ def calculate_team_statuses(stats):
         else:
             damage_ratio = 0.0
 
-        print(f"Damage Ratio: {damage_ratio:.2f}. Feedback: ", end="")
-
         if damage_ratio < 0.14:
-            print("SHOOT!")
+            feedback = "SHOOT!"
             support_status = 'poor'
         elif 0.185 <= damage_ratio <= 0.32:
-            print("You're doing good.")
+            feedback = "You're doing good."
             support_status = 'average'
         else:
+            feedback = ""
             support_status = 'good'
+        logger.debug("Damage Ratio: %.2f. Feedback: %s", damage_ratio, feedback)
 
-    print("Custom Team Status:", (tank_status, dps_status, support_status))
+    logger.debug("Custom Team Status: %s", (tank_status, dps_status, support_status))
 
     return tank_status, dps_status, support_status
 
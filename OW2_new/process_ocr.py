@@ -0,0 +1,229 @@
+"""OCR of the numeric stat cells on a pool of worker processes, fed through shared memory.
+
+OCR and its Python side preprocessing hold the GIL, so threads do not scale them across cores. The
+``ProcessOCREngine`` keeps a pool of worker processes (each with its own OCR engine) for its whole lifetime.
+Instead of pickling every cell, the bytes of the frame region the cells are views of are copied once into a
+reusable ``multiprocessing.shared_memory`` block; the workers only receive (block name, offset, shape,
+strides) descriptors, rebuild the cells as views into the block and send back one integer per cell.
+
+    parser = ImageParser(model_path, stats_ocr_backend="process")
+"""
+
+import multiprocessing
+import queue
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models.OW2_new.ocr_engine import OCREngine, create_ocr_engine
+
+# state of a worker process, set by _init_worker
+_worker_engine = None
+_worker_blocks = OrderedDict()
+_MAX_ATTACHED_BLOCKS = 8
+
+
+def _attach(name):
+    """Attach a worker to a shared memory block of the engine, reusing earlier attachments."""
+    block = _worker_blocks.get(name)
+    if block is not None:
+        _worker_blocks.move_to_end(name)
+        return block
+
+    if sys.version_info >= (3, 13):
+        # the engine owns (and unlinks) the block
+        block = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        # workers share the engine's resource tracker, which already tracks the block
+        block = shared_memory.SharedMemory(name=name)
+    _worker_blocks[name] = block
+    while len(_worker_blocks) > _MAX_ATTACHED_BLOCKS:
+        _worker_blocks.popitem(last=False)[1].close()
+    return block
+
+
+def _init_worker(backend, backend_kwargs):
+    global _worker_engine
+    _worker_engine = create_ocr_engine(backend, **backend_kwargs)
+
+
+def parse_int(text):
+    """Return the digits of an OCR result as an int, or None if it has none."""
+    digits = "".join(c for c in text if c.isdigit())
+    return int(digits) if digits else None
+
+
+def _recognize_cells(name, descriptors, config):
+    """Worker task: OCR the cells described by (offset, shape, strides) in a shared memory block."""
+    buffer = _attach(name).buf
+    cells = [np.ndarray(shape, dtype=np.uint8, buffer=buffer, offset=offset, strides=strides)
+             for offset, shape, strides in descriptors]
+    texts = _worker_engine.recognize_grid([cells], config)[0]
+    return [parse_int(text) for text in texts]
+
+
+def _recognize_text(image, config):
+    """Worker task: OCR a single image."""
+    return _worker_engine.image_to_string(image, config)
+
+
+def _byte_bounds(array):
+    """The first and one past the last byte address of an array (np.byte_bounds, which NumPy 2 moved)."""
+    low = array.__array_interface__["data"][0]
+    high = low + array.itemsize
+    for size, stride in zip(array.shape, array.strides):
+        if size == 0:
+            return low, low
+        if stride < 0:
+            low += stride * (size - 1)
+        else:
+            high += stride * (size - 1)
+    return low, high
+
+
+def _shared_root(cell):
+    """The C-contiguous uint8 array owning the memory of a uint8 cell, or None if the cell has to be copied."""
+    root = cell
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if cell.dtype != np.uint8 or root.dtype != np.uint8 or not root.flags.c_contiguous:
+        return None
+    return root
+
+
+class SharedCellBuffer:
+    """A shared memory block the cells of one recognize_grid call are placed in; grown when too small."""
+
+    def __init__(self, size):
+        self.block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    @property
+    def name(self):
+        return self.block.name
+
+    def place(self, cells):
+        """
+        Copy the memory of the given cells into the block.
+
+        Cells that are uint8 views of the same C-contiguous array are placed by copying the byte span of that
+        array covering all of them, once, and keep their strides; other cells are copied one by one.
+
+        :param cells: List of 2D uint8 images.
+        :return: List of (offset, shape, strides) descriptors, one per cell.
+        """
+        spans = {}   # id(root) -> (root, first byte, end byte), relative to the root's start
+        roots = [_shared_root(cell) for cell in cells]
+        for cell, root in zip(cells, roots):
+            if root is None:
+                continue
+            root_start = _byte_bounds(root)[0]
+            low, high = (bound - root_start for bound in _byte_bounds(cell))
+            _, span_low, span_high = spans.get(id(root), (root, low, high))
+            spans[id(root)] = (root, min(low, span_low), max(high, span_high))
+
+        size = sum(high - low for _, low, high in spans.values())
+        size += sum(cell.size for cell, root in zip(cells, roots) if root is None)
+        if size > self.block.size:
+            self.close()
+            self.block = shared_memory.SharedMemory(create=True, size=2 * size)
+
+        buffer = np.ndarray((self.block.size,), dtype=np.uint8, buffer=self.block.buf)
+        position = 0
+        span_offsets = {}
+        for key, (root, low, high) in spans.items():
+            buffer[position:position + high - low] = root.reshape(-1)[low:high]
+            span_offsets[key] = position - low
+            position += high - low
+
+        descriptors = []
+        for cell, root in zip(cells, roots):
+            if root is not None:
+                offset = span_offsets[id(root)] + _byte_bounds(cell)[0] - _byte_bounds(root)[0]
+                descriptors.append((int(offset), cell.shape, cell.strides))
+            else:
+                cell = np.ascontiguousarray(cell, dtype=np.uint8)
+                buffer[position:position + cell.size] = cell.reshape(-1)
+                descriptors.append((position, cell.shape, cell.strides))
+                position += cell.size
+        return descriptors
+
+    def close(self):
+        self.block.close()
+        self.block.unlink()
+
+
+class ProcessOCREngine(OCREngine):
+    """
+    Recognise numeric cells on a pool of worker processes that read them from shared memory.
+
+    recognize_grid returns the digits of every cell (like the "digits" engine, it is meant for the numeric stat
+    cells only); image_to_string sends the image itself to a worker and returns its text.
+    """
+
+    name = "process"
+
+    def __init__(self, max_workers=None, worker_backend="auto", min_cells_per_task=8, buffer_size=1 << 20,
+                 start_method="spawn", **backend_kwargs):
+        """
+        :param max_workers: Number of worker processes. Defaults to the number of CPUs.
+        :param worker_backend: OCR engine every worker creates (see ocr_engine.create_ocr_engine).
+        :param min_cells_per_task: The cells of a grid are split into one task per worker, but no task gets
+            fewer cells than this.
+        :param buffer_size: Initial size in bytes of every shared memory block.
+        :param start_method: multiprocessing start method of the workers ("spawn" does not inherit the model
+            or the event loop of the app).
+        :param backend_kwargs: Passed to the workers' engine constructor.
+        """
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.min_cells_per_task = min_cells_per_task
+        self.buffer_size = buffer_size
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context(start_method),
+                                            initializer=_init_worker, initargs=(worker_backend, backend_kwargs))
+        # one block per concurrent call; a block is reused once its call returns
+        self._buffers = queue.SimpleQueue()
+        self._all_buffers = []
+        self._lock = threading.Lock()
+
+    def _acquire_buffer(self):
+        try:
+            return self._buffers.get_nowait()
+        except queue.Empty:
+            buffer = SharedCellBuffer(self.buffer_size)
+            with self._lock:
+                self._all_buffers.append(buffer)
+            return buffer
+
+    def image_to_string(self, image, config=""):
+        return self.executor.submit(_recognize_text, image, config).result()
+
+    def recognize_grid(self, cells, config=""):
+        flat = [cell for row in cells for cell in row]
+        if not flat:
+            return [[] for _ in cells]
+
+        buffer = self._acquire_buffer()
+        futures = []
+        try:
+            descriptors = buffer.place(flat)
+            chunk = max(self.min_cells_per_task, -(-len(flat) // self.max_workers))
+            futures = [self.executor.submit(_recognize_cells, buffer.name, descriptors[start:start + chunk], config)
+                       for start in range(0, len(flat), chunk)]
+            values = iter([value for future in futures for value in future.result()])
+        finally:
+            # the block is reused once no task reads from it anymore
+            wait(futures)
+            self._buffers.put(buffer)
+
+        return [["" if value is None else str(value) for _, value in zip(row, values)] for row in cells]
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self._lock:
+            for buffer in self._all_buffers:
+                buffer.close()
+            self._all_buffers.clear()
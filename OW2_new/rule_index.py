@@ -0,0 +1,133 @@
+"""Inverted index over the team rules, compiled once at startup.
+
+Every item of a rule ("TANK=good", "CHAR_1=Ashe", ...) gets an integer ID and a bitset over the rules that
+contain it, so finding the rules with all the required statuses is an AND of a few bitsets. The heroes of
+every rule are a bitset over the hero names as well, and the overlap with the current team composition is the
+popcount of their intersection.
+"""
+
+import numpy as np
+
+STATUS_PREFIXES = ("TANK=", "DPS=", "SUP=", "RESULT=")
+
+
+def parse_items(rule_str):
+    """Split a rule string such as "{TANK=good, CHAR_1=Ashe}" into its items."""
+    return [item.strip() for item in rule_str.strip("{}").split(",") if item.strip()]
+
+
+def display_items(items):
+    """The hero names of a rule as shown in the rules table, without the status items."""
+    heroes = [item.split("=")[1] for item in items if not item.startswith(STATUS_PREFIXES)]
+    if len(heroes) == 0:
+        return "{}"
+    return ", ".join(heroes)
+
+
+def pack_bits(mask):
+    """Pack a boolean array along its last axis into uint64 words."""
+    mask = np.asarray(mask, dtype=bool)
+    n_words = max(1, -(-mask.shape[-1] // 64))
+    padded = np.zeros(mask.shape[:-1] + (n_words * 64,), dtype=bool)
+    padded[..., :mask.shape[-1]] = mask
+    return np.packbits(padded, axis=-1, bitorder="little").view(np.uint64)
+
+
+def unpack_bits(words, count):
+    """Inverse of pack_bits for a 1-D array of words."""
+    return np.unpackbits(words.view(np.uint8), count=count, bitorder="little").astype(bool)
+
+
+def popcount(words):
+    """Number of set bits of every uint64 word."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    return np.unpackbits(words.view(np.uint8).reshape(words.shape + (8,)), axis=-1).sum(axis=-1)
+
+
+class RuleIndex:
+    """Item and hero bitsets of a list of rules, in the order of the rules DataFrame."""
+
+    def __init__(self, rules_items):
+        """
+        :param rules_items: List with the items of every rule.
+        """
+        self.n_rules = len(rules_items)
+
+        self.item_ids = {}
+        self.hero_ids = {}
+        rule_item_ids, rule_hero_ids = [], []
+        for items in rules_items:
+            rule_item_ids.append([self.item_ids.setdefault(item, len(self.item_ids)) for item in items])
+            rule_hero_ids.append([self.hero_ids.setdefault(item.split("=")[1], len(self.hero_ids))
+                                  for item in items if not item.startswith(STATUS_PREFIXES)])
+
+        # item_bits[item] is the bitset of the rules containing the item
+        contains = np.zeros((len(self.item_ids), self.n_rules), dtype=bool)
+        # rule_heroes[rule] is the bitset of the heroes named by the rule
+        heroes = np.zeros((self.n_rules, len(self.hero_ids)), dtype=bool)
+        for rule, (item_ids, hero_ids) in enumerate(zip(rule_item_ids, rule_hero_ids)):
+            contains[item_ids, rule] = True
+            heroes[rule, hero_ids] = True
+        self.item_bits = pack_bits(contains)
+        self.rule_heroes = pack_bits(heroes)
+
+        self.display = np.array([display_items(items) for items in rules_items], dtype=object)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild an index from the arrays returned by to_arrays."""
+        index = cls.__new__(cls)
+        index.item_bits = arrays["item_bits"]
+        index.rule_heroes = arrays["rule_heroes"]
+        index.n_rules = int(arrays["n_rules"])
+        index.item_ids = {item: i for i, item in enumerate(arrays["item_names"].tolist())}
+        index.hero_ids = {hero: i for i, hero in enumerate(arrays["hero_names"].tolist())}
+        index.display = arrays["display"].astype(object)
+        return index
+
+    def to_arrays(self):
+        """The index as a dict of plain arrays, e.g. for np.savez."""
+        return {
+            "item_bits": self.item_bits,
+            "rule_heroes": self.rule_heroes,
+            "n_rules": np.array(self.n_rules),
+            "item_names": np.array(list(self.item_ids), dtype=str),
+            "hero_names": np.array(list(self.hero_ids), dtype=str),
+            "display": self.display.astype(str),
+        }
+
+    @classmethod
+    def from_rule_strings(cls, rule_strings):
+        """Build the index from rule strings such as the "combined" column of the preprocessed rules."""
+        return cls([parse_items(rule_str) for rule_str in rule_strings])
+
+    def matching(self, required_items):
+        """
+        Find the rules containing every required item.
+
+        :param required_items: Items such as {"TANK=good", "RESULT=1"}.
+        :return: Boolean mask over the rules.
+        """
+        if any(item not in self.item_ids for item in required_items):
+            return np.zeros(self.n_rules, dtype=bool)
+        if not required_items:
+            return np.ones(self.n_rules, dtype=bool)
+        ids = [self.item_ids[item] for item in required_items]
+        return unpack_bits(np.bitwise_and.reduce(self.item_bits[ids], axis=0), self.n_rules)
+
+    def composition_bits(self, team_composition):
+        """The bitset of the known heroes of a team composition."""
+        present = np.zeros(len(self.hero_ids), dtype=bool)
+        present[[self.hero_ids[hero] for hero in team_composition if hero in self.hero_ids]] = True
+        return pack_bits(present)
+
+    def hero_overlap(self, team_composition):
+        """
+        Count the heroes of every rule that are part of the team composition.
+
+        :param team_composition: Hero names (without the label prefix).
+        :return: Integer array over the rules.
+        """
+        shared = np.bitwise_and(self.rule_heroes, self.composition_bits(team_composition))
+        return popcount(shared).sum(axis=1).astype(np.int64)
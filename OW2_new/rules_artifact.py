@@ -0,0 +1,190 @@
+"""Binary artifact of the preprocessed team rules and their compiled RuleIndex.
+
+Parsing team_rules.csv and normalising every rule takes a noticeable part of the handler's startup, so the
+result is stored as an .npz next to the CSV (plain arrays, no pickles) together with the size, mtime and SHA-1
+of the CSV it was built from. The loader reuses the artifact while the CSV is unchanged and rebuilds it
+otherwise. Build it ahead of deployment with:
+
+    python -m models.OW2_new.rules_artifact build --rules models/OW2_new/team_rules.csv
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from models.OW2_new.rule_index import RuleIndex
+
+ARTIFACT_VERSION = 1
+RULE_COLUMNS = ("lhs", "rhs", "support", "confidence", "coverage", "lift", "count", "combined")
+
+logger = logging.getLogger(__name__)
+
+
+def artifact_path_for(rules_path):
+    """The artifact path of a rules CSV: the same path with an .npz extension."""
+    return os.path.splitext(rules_path)[0] + ".npz"
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def normalise_rule_items(left_str, right_str):
+    """The sorted items of both sides of a rule."""
+    left_str = left_str.strip("{}")
+    right_str = right_str.strip("{}")
+    items = [x.strip() for x in left_str.split(",") if x.strip()]
+    items += [x.strip() for x in right_str.split(",") if x.strip()]
+    items.sort()
+    return items
+
+
+def preprocess_rules(df):
+    """
+    Combine the rules into single list and remove duplicates
+    """
+    # Create new columns for normalized LHS / RHS
+    df["combined"] = [normalise_rule_items(lhs, rhs) for lhs, rhs in zip(df["lhs"], df["rhs"])]
+
+    # remove duplicate combined
+    df.drop_duplicates(subset=["combined"], inplace=True)
+
+    def tuple_to_str(ls_):
+        # Rebuild as { item1, item2, ... }
+        if len(ls_) == 0:
+            return "{}"
+        return "{" + ", ".join(ls_) + "}"
+
+    df["combined"] = df["combined"].apply(lambda x: tuple_to_str(x))
+    return df
+
+
+def build_rules(rules_path):
+    """Read, preprocess and index the rules CSV. Return the preprocessed DataFrame and its RuleIndex."""
+    rules_df = preprocess_rules(pd.read_csv(rules_path))
+    return rules_df, RuleIndex.from_rule_strings(rules_df["combined"])
+
+
+def _source_info(rules_path):
+    stat = os.stat(rules_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": file_sha1(rules_path)}
+
+
+def save_rules_artifact(rules_df, rule_index, rules_path, artifact_path=None, source=None):
+    """
+    Write the preprocessed rules and their index to the artifact of rules_path.
+
+    :param source: The _source_info of the CSV, taken before it was read. Stat-ing it only now would record a
+        CSV modified while it was being preprocessed as the one the artifact was built from.
+    """
+    artifact_path = artifact_path or artifact_path_for(rules_path)
+    source = source or _source_info(rules_path)
+
+    arrays = {f"rules_{column}": rules_df[column].to_numpy(dtype=str if column in ("lhs", "rhs", "combined")
+                                                                    else None)
+              for column in RULE_COLUMNS}
+    arrays["rules_index"] = rules_df.index.to_numpy()
+    arrays.update({f"index_{name}": array for name, array in rule_index.to_arrays().items()})
+    arrays.update(version=np.array(ARTIFACT_VERSION), source_size=np.array(source["size"]),
+                  source_mtime_ns=np.array(source["mtime_ns"]), source_sha1=np.array(source["sha1"]))
+
+    # write next to the target and rename, so a concurrently starting worker never reads a partial file
+    directory = os.path.dirname(os.path.abspath(artifact_path))
+    f = tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False)
+    try:
+        with f:
+            np.savez(f, **arrays)
+        os.replace(f.name, artifact_path)
+    except BaseException:
+        # a failed write (disk full, target not writable, ...) must not leave the temporary file behind
+        os.unlink(f.name)
+        raise
+    return artifact_path
+
+
+def _artifact_is_current(artifact, rules_path):
+    if int(artifact["version"]) != ARTIFACT_VERSION:
+        return False
+    stat = os.stat(rules_path)
+    if stat.st_size != int(artifact["source_size"]):
+        return False
+    if stat.st_mtime_ns == int(artifact["source_mtime_ns"]):
+        return True
+    # touched or freshly checked out: only the content matters
+    return file_sha1(rules_path) == str(artifact["source_sha1"])
+
+
+def read_rules_artifact(rules_path, artifact_path=None):
+    """
+    Load the preprocessed rules and their index from the artifact of rules_path.
+
+    :return: The preprocessed DataFrame and its RuleIndex, or None if there is no artifact or it was built from
+        another version of the CSV.
+    """
+    artifact_path = artifact_path or artifact_path_for(rules_path)
+    if not os.path.exists(artifact_path):
+        return None
+
+    try:
+        with np.load(artifact_path, allow_pickle=False) as artifact:
+            if not _artifact_is_current(artifact, rules_path):
+                return None
+            rules_df = pd.DataFrame({column: artifact[f"rules_{column}"] for column in RULE_COLUMNS},
+                                    index=artifact["rules_index"])
+            rule_index = RuleIndex.from_arrays({name[len("index_"):]: artifact[name]
+                                                for name in artifact.files if name.startswith("index_")})
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Could not read the rules artifact %s: %s", artifact_path, e)
+        return None
+    return rules_df, rule_index
+
+
+def load_rules(rules_path, artifact_path=None):
+    """
+    Load the preprocessed rules and their index, from the artifact when it matches the CSV.
+
+    The artifact is rebuilt from the CSV when it is missing or stale. A failure to write it is only reported,
+    the rules are then used from the CSV.
+
+    :return: The preprocessed DataFrame and its RuleIndex.
+    """
+    loaded = read_rules_artifact(rules_path, artifact_path)
+    if loaded is not None:
+        return loaded
+
+    source = _source_info(rules_path)
+    rules_df, rule_index = build_rules(rules_path)
+    try:
+        save_rules_artifact(rules_df, rule_index, rules_path, artifact_path, source)
+    except OSError as e:
+        logger.warning("Could not write the rules artifact for %s: %s", rules_path, e)
+    return rules_df, rule_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary artifact of the team rules.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Rebuild the artifact from the rules CSV.")
+    build_parser.add_argument("--rules", default="models/OW2_new/team_rules.csv", help="Rules CSV.")
+    build_parser.add_argument("--output", default=None, help="Artifact path (default: next to the CSV).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "build":
+        source = _source_info(args.rules)
+        rules_df, rule_index = build_rules(args.rules)
+        path = save_rules_artifact(rules_df, rule_index, args.rules, args.output, source)
+        logger.info("Wrote %d rules to %s", len(rules_df), path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compact wire format of the team rules sent to the browser on page load.
+
+Instead of one JSON object per rule with the raw lhs/rhs strings, every distinct item ("TANK=good",
+"CHAR_1=Ashe", ...) is sent once and the two sides of the rules are flat arrays of item codes with offsets:
+
+    {"format": 1, "version": "...", "items": [...],
+     "lhs": [...], "lhs_offsets": [...], "rhs": [...], "rhs_offsets": [...],
+     "support": [...], "confidence": [...], "coverage": [...], "lift": [...], "count": [...]}
+
+The items of the lhs of rule i are items[lhs[lhs_offsets[i]:lhs_offsets[i + 1]]]. The payload is serialised
+once per rules file; its version is a hash of that serialisation, so browsers holding the same version can
+skip the download (decodeRulesPayload in the role component rebuilds the rule records).
+"""
+
+import hashlib
+import json
+
+from models.OW2_new.rule_index import parse_items
+
+PAYLOAD_FORMAT = 1
+NUMERIC_COLUMNS = ("support", "confidence", "coverage", "lift", "count")
+
+
+def _encode_side(rule_strings, item_ids):
+    codes, offsets = [], [0]
+    for rule_str in rule_strings:
+        codes.extend(item_ids[item] for item in parse_items(rule_str))
+        offsets.append(len(codes))
+    return codes, offsets
+
+
+def encode_rules_payload(rules_df, rule_index):
+    """
+    Serialise the preprocessed rules into the compact wire format.
+
+    :param rules_df: The preprocessed rules DataFrame.
+    :param rule_index: Its RuleIndex, whose item IDs are used as the item codes.
+    :return: Tuple of the version and the JSON string of the payload.
+    """
+    item_ids = dict(rule_index.item_ids)
+    for rule_str in list(rules_df["lhs"]) + list(rules_df["rhs"]):
+        for item in parse_items(rule_str):
+            item_ids.setdefault(item, len(item_ids))
+
+    lhs, lhs_offsets = _encode_side(rules_df["lhs"], item_ids)
+    rhs, rhs_offsets = _encode_side(rules_df["rhs"], item_ids)
+    payload = {
+        "format": PAYLOAD_FORMAT,
+        "items": list(item_ids),
+        "lhs": lhs, "lhs_offsets": lhs_offsets,
+        "rhs": rhs, "rhs_offsets": rhs_offsets,
+    }
+    payload.update({column: rules_df[column].tolist() for column in NUMERIC_COLUMNS})
+
+    body = json.dumps(payload, separators=(",", ":"))
+    version = hashlib.sha1(body.encode()).hexdigest()[:16]
+    # the version goes first so it can be read without parsing the whole payload
+    return version, '{"version":"%s",%s' % (version, body[1:])
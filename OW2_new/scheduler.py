@@ -0,0 +1,190 @@
+"""Latest-wins processing of screenshots off the Socket.IO event loop.
+
+Every session (a player's browser or capture client) has at most one screenshot waiting and one being
+processed. A screenshot submitted while another one of the same session is waiting replaces it, so a burst is
+coalesced into its newest screenshot instead of being worked through in order. Waiting sessions are served
+first come first served by a fixed number of workers, and submissions from new sessions are rejected once
+max_pending_sessions are waiting.
+
+Workers are created with ``threading``: under eventlet they are green threads that hand the CPU bound work
+(OCR, classifier, pipeline) to eventlet's native thread pool and emit the results on the event loop; without
+eventlet they are plain threads.
+
+The app's ``game_manager.process_screenshot`` can hand its screenshots to the predictor, which creates its
+scheduler on first use and emits the GAME_PREDICTION and GAME_DETAILS events once a screenshot is processed:
+
+    predictor.submit_screenshot(session_id, "screenshots/latest.png", events_handler, socketio)
+
+instead of calling get_stats_and_details, predict_probability and the events itself on the event loop. A scheduler
+can also be created directly:
+
+    scheduler = ScreenshotScheduler(UserPredictor(), UserEventsHandler(), socketio)
+    scheduler.submit(session_id, "screenshots/latest.png")
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from models import HandlerEvent
+from models.OW2_new import metrics
+from models.OW2_new.threading_utils import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenshotScheduler:
+    def __init__(self, predictor, events_handler=None, socket_object=None, workers=2, max_pending_sessions=64,
+                 on_result=None):
+        """
+        :param predictor: The UserPredictor used to process the screenshots.
+        :param events_handler: Handler receiving GAME_PREDICTION and GAME_DETAILS for every processed screenshot,
+            which emit update_chart and team_rules.
+        :param socket_object: Socket passed to the events handler.
+        :param workers: Number of screenshots processed concurrently.
+        :param max_pending_sessions: Number of sessions that may have a screenshot waiting; further sessions are
+            rejected until the queue drains.
+        :param on_result: Optional callback(session, result) called with the result of every screenshot, where
+            result is (stats, (time, team_composition, probability)) or None for unreadable screenshots.
+        """
+        self.predictor = predictor
+        self.events_handler = events_handler
+        self.socket_object = socket_object
+        self.max_pending_sessions = max_pending_sessions
+        self.on_result = on_result
+
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._pending = {}      # session -> (screenshot, submitted_at), at most one per session
+        self._ready = deque()   # sessions with a pending screenshot and nothing in flight, oldest first
+        self._in_flight = set()
+        self._closed = False
+
+        self.submitted = 0
+        self.processed = 0
+        self.superseded = 0
+        self.rejected = 0
+        self.failed = 0
+        self.queue_wait_seconds = 0.0
+        self.processing_seconds = 0.0
+
+        self._workers = [threading.Thread(target=self._work, name=f"screenshot-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+        metrics.register_gauge("scheduler", self.stats)
+
+    def submit(self, session, screenshot):
+        """
+        Queue a screenshot of a session, replacing the one still waiting for that session.
+
+        :param session: Session key, also passed to get_stats_and_details.
+        :param screenshot: Anything get_stats_and_details accepts (path, Frame, ...).
+        :return: False if the screenshot was rejected because too many sessions are waiting, True otherwise.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The scheduler is closed.")
+            self.submitted += 1
+
+            if session in self._pending:
+                # latest wins; the session keeps its place in the queue
+                self.superseded += 1
+                self._pending[session] = (screenshot, time.perf_counter())
+                return True
+
+            if len(self._pending) >= self.max_pending_sessions:
+                self.rejected += 1
+                return False
+
+            self._pending[session] = (screenshot, time.perf_counter())
+            if session not in self._in_flight:
+                self._ready.append(session)
+                self._work_available.notify()
+            return True
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._ready and not self._closed:
+                    self._work_available.wait()
+                if not self._ready:
+                    return
+                session = self._ready.popleft()
+                screenshot, submitted_at = self._pending.pop(session)
+                self._in_flight.add(session)
+
+            started_at = time.perf_counter()
+            try:
+                result = run_blocking(self.process, session, screenshot)
+                self.emit_result(session, result)
+            except Exception as e:
+                logger.error("Processing a screenshot of session %s failed: %s", session, e)
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.processed += 1
+            finally:
+                finished_at = time.perf_counter()
+                metrics.observe("scheduler_queue_wait", started_at - submitted_at)
+                metrics.observe("scheduler_processing", finished_at - started_at)
+                with self._lock:
+                    self.queue_wait_seconds += started_at - submitted_at
+                    self.processing_seconds += finished_at - started_at
+                    self._in_flight.discard(session)
+                    # a screenshot submitted while this one was processed is next in line for the session
+                    if session in self._pending:
+                        self._ready.append(session)
+                        self._work_available.notify()
+
+    def process(self, session, screenshot):
+        """
+        Extract the stats and details of a screenshot and predict the win probability. Runs off the event loop.
+
+        :return: (stats, (time, team_composition, probability)), or None if the screenshot could not be read.
+        """
+        result = self.predictor.get_stats_and_details(screenshot, session=session)
+        if result is None:
+            return None
+        stats, game_details = result
+        probability = self.predictor.predict_probability(stats, game_details)
+        time_in_minutes, team_composition = game_details
+        return stats, (time_in_minutes, team_composition, probability)
+
+    def emit_result(self, session, result):
+        """Pass a result to the events handler (update_chart, team_rules) and the on_result callback."""
+        if result is not None and self.events_handler is not None:
+            stats, (time_in_minutes, team_composition, probability) = result
+            if probability is not None:
+                self.events_handler.handle_event(self.socket_object, HandlerEvent.GAME_PREDICTION, probability)
+                self.events_handler.handle_event(self.socket_object, HandlerEvent.GAME_DETAILS, result)
+        if self.on_result is not None:
+            self.on_result(session, result)
+
+    def stats(self):
+        """Return the queue depth, in-flight screenshots and counters of the scheduler."""
+        with self._lock:
+            finished = self.processed + self.failed
+            return {
+                "queue_depth": len(self._pending),
+                "in_flight": len(self._in_flight),
+                "workers": len(self._workers),
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "superseded": self.superseded,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "avg_queue_wait_ms": 1000 * self.queue_wait_seconds / finished if finished else 0.0,
+                "avg_processing_ms": 1000 * self.processing_seconds / finished if finished else 0.0,
+            }
+
+    def close(self, wait=True, timeout=None):
+        """Stop accepting screenshots; the workers finish the waiting ones and exit."""
+        with self._lock:
+            self._closed = True
+            self._work_available.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join(timeout)
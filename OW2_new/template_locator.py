@@ -0,0 +1,171 @@
+"""Template matching used to locate the stats table on the scoreboard."""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import cv2
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_stats.png")
+
+# Screenshot height the template and all crop offsets were made for
+REFERENCE_HEIGHT = 1080
+
+TemplateMatch = namedtuple("TemplateMatch", ["top_left", "size", "scale", "score"])
+
+
+class TemplateLocator:
+    """Locate the stats template in scoreboard images.
+
+    The template is loaded once. The position of the last confident match is remembered per key (e.g.
+    session and image half) and image resolution, and the next search only covers a small window around
+    it. A search over the whole image, optionally over several scales or coarse-to-fine on an image
+    pyramid, is only done when there is no remembered position or the windowed match is not confident.
+    """
+
+    def __init__(self, template_path=TEMPLATE_PATH, search_margin=24, min_score=0.8, scales=(1.0,),
+                 use_pyramid=False, max_positions=64):
+        """
+        :param template_path: Path to the grayscale template image.
+        :param search_margin: Number of pixels around the last match searched before falling back.
+        :param min_score: Minimum TM_CCOEFF_NORMED score for a match to be trusted and remembered.
+        :param scales: Scale factors (relative to the resolution scale) tried during a full search.
+        :param use_pyramid: If True, full searches run on a half resolution pyramid level first and are
+            refined around the coarse match.
+        :param max_positions: Number of remembered match positions; the least recently used one is forgotten.
+        """
+        self.template_path = template_path
+        self.search_margin = search_margin
+        self.min_score = min_score
+        self.scales = tuple(scales)
+        self.use_pyramid = use_pyramid
+        self.max_positions = max_positions
+
+        self._template = None
+        self._scaled_templates = {}
+        self._last_matches = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.window_hits = 0
+        self.full_searches = 0
+
+    @property
+    def template(self):
+        """The template image, loaded from disk on first use."""
+        if self._template is None:
+            with self._lock:
+                if self._template is None:
+                    template = cv2.imread(self.template_path, cv2.IMREAD_GRAYSCALE)
+                    if template is None:
+                        raise ValueError(f"Unable to load template at path: {self.template_path}")
+                    self._template = template
+        return self._template
+
+    def get_template(self, scale):
+        """Return the template resized by the given scale (cached)."""
+        scale = round(scale, 3)
+        if scale == 1.0:
+            return self.template
+
+        template = self._scaled_templates.get(scale)
+        if template is None:
+            height, width = self.template.shape[:2]
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            template = cv2.resize(self.template, size, interpolation=cv2.INTER_AREA)
+            self._scaled_templates[scale] = template
+        return template
+
+    def locate(self, image, key=None, scale_hint=1.0):
+        """
+        Find the template in the given grayscale image.
+
+        :param image: Grayscale image as NumPy array.
+        :param key: Optional hashable under which the match position is remembered.
+        :param scale_hint: Expected scale of the template in the image (image height / reference height).
+        :return: A TemplateMatch with the top left corner (x, y), template size (width, height), scale and score.
+        """
+        memory_key = (key, image.shape[:2])
+        with self._lock:
+            last = self._last_matches.get(memory_key)
+        if last is not None:
+            match = self._search_window(image, *last)
+            if match is not None and match.score >= self.min_score:
+                with self._lock:
+                    self.window_hits += 1
+                    if memory_key in self._last_matches:
+                        self._last_matches.move_to_end(memory_key)
+                return match
+
+        match = self._full_search(image, scale_hint)
+        with self._lock:
+            self.full_searches += 1
+            if match.score >= self.min_score:
+                self._last_matches[memory_key] = (match.top_left, match.scale)
+                self._last_matches.move_to_end(memory_key)
+                while len(self._last_matches) > self.max_positions:
+                    self._last_matches.popitem(last=False)
+            else:
+                self._last_matches.pop(memory_key, None)
+        return match
+
+    def reset(self, key=None):
+        """Forget remembered match positions, either for one key or all of them."""
+        with self._lock:
+            if key is None:
+                self._last_matches.clear()
+            else:
+                for memory_key in [k for k in self._last_matches if k[0] == key]:
+                    self._last_matches.pop(memory_key, None)
+
+    @staticmethod
+    def _match(image, template):
+        result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        return max_val, max_loc
+
+    def _search_window(self, image, top_left, scale):
+        template = self.get_template(scale)
+        template_height, template_width = template.shape[:2]
+        x, y = top_left
+        x0 = max(x - self.search_margin, 0)
+        y0 = max(y - self.search_margin, 0)
+        x1 = min(x + template_width + self.search_margin, image.shape[1])
+        y1 = min(y + template_height + self.search_margin, image.shape[0])
+
+        window = image[y0:y1, x0:x1]
+        if window.shape[0] < template_height or window.shape[1] < template_width:
+            return None
+
+        score, (match_x, match_y) = self._match(window, template)
+        return TemplateMatch((x0 + match_x, y0 + match_y), (template_width, template_height), scale, score)
+
+    def _pyramid_search(self, image, template, scale):
+        small_template = cv2.pyrDown(template)
+        if min(small_template.shape[:2]) < 8:
+            return None
+        _, (x, y) = self._match(cv2.pyrDown(image), small_template)
+        return self._search_window(image, (x * 2, y * 2), scale)
+
+    def _full_search(self, image, scale_hint):
+        best = None
+        for factor in self.scales:
+            scale = scale_hint * factor
+            template = self.get_template(scale)
+            if template.shape[0] > image.shape[0] or template.shape[1] > image.shape[1]:
+                continue
+
+            match = self._pyramid_search(image, template, scale) if self.use_pyramid else None
+            if match is None:
+                score, top_left = self._match(image, template)
+                match = TemplateMatch(top_left, template.shape[1::-1], scale, score)
+
+            if best is None or match.score > best.score:
+                best = match
+
+        if best is None:
+            raise ValueError(f"Template is larger than the image: {image.shape}")
+        return best
+
+
+# shared locator used by image_utils.crop_image
+default_locator = TemplateLocator()
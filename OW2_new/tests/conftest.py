@@ -0,0 +1,41 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "sample_images")
+RULES_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "team_rules.csv")
+
+
+def sample_path(number):
+    """Path of sample_images/sample<number>.png; skips the test if the samples are not checked out."""
+    path = os.path.join(SAMPLE_DIR, f"sample{number}.png")
+    if not os.path.exists(path):
+        pytest.skip(f"{path} not found")
+    return path
+
+
+@pytest.fixture(scope="module")
+def handler(tmp_path_factory):
+    from models.OW2_new.events_handler import UserEventsHandler
+
+    directory = tmp_path_factory.mktemp("rules")
+    rules_path = str(directory / "team_rules.csv")
+    shutil.copy(RULES_CSV, rules_path)
+    return UserEventsHandler(rules_path=rules_path, timeline_dir=str(directory / "match_history"))
+
+
+@pytest.fixture(scope="module")
+def reference_rules():
+    """The rules deduplicated on their sorted items, as the handler did before the rule index."""
+    df = pd.read_csv(RULES_CSV)
+
+    def items(row):
+        return sorted(x.strip() for side in (row["lhs"], row["rhs"]) for x in side.strip("{}").split(",")
+                      if x.strip())
+
+    df["combined"] = df.apply(items, axis=1)
+    df = df[~df["combined"].apply(tuple).duplicated()].copy()
+    df["combined"] = df["combined"].apply(lambda ls_: "{" + ", ".join(ls_) + "}" if ls_ else "{}")
+    return df
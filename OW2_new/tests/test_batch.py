@@ -0,0 +1,71 @@
+import pytest
+
+from models.OW2_new import batch
+
+
+def make_row(path, error=None, kills=1):
+    row = dict.fromkeys(batch.COLUMNS)
+    row.update({"path": path, "error": error, "K_player0": kills})
+    return row
+
+
+class FakePredictor:
+    def __init__(self):
+        self.sessions = []
+
+    def get_stats_and_details(self, path, session=None):
+        self.sessions.append(session)
+        return [[1, 2, 3, 4, 5, 6]] * 10, (3.0, ["label_Ana"] * 5)
+
+    def predict_probability(self, stats, game_details):
+        return 0.5
+
+
+def test_every_screenshot_gets_its_own_session(monkeypatch):
+    predictor, resets = FakePredictor(), []
+    monkeypatch.setattr(batch, "_predictor", predictor)
+    monkeypatch.setattr(batch, "_reset_session", resets.append)
+
+    rows = [batch.process_image(path) for path in ("a.png", "b.png")]
+    assert predictor.sessions == ["a.png", "b.png"]
+    assert resets == ["a.png", "b.png"]
+    assert rows[0]["error"] is None and rows[0]["Damage_player9"] == 4 and rows[0]["probability"] == 0.5
+
+
+@pytest.mark.parametrize("extension", [".csv", ".parquet"])
+def test_resume_replaces_error_rows(tmp_path, extension):
+    if extension == ".parquet":
+        pytest.importorskip("pyarrow")
+    writer = batch.create_writer(str(tmp_path / f"results{extension}"))
+    writer.write([make_row("a.png"), make_row("b.png", error="ValueError: bad")])
+    writer.write([make_row("c.png", error="ValueError: bad")])
+    assert writer.processed_paths() == {"a.png"}
+
+    writer.drop_errors()
+    writer.write([make_row("b.png", kills=2), make_row("c.png", kills=3)])
+
+    if extension == ".csv":
+        import csv
+        with open(writer.path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = [row for part in writer._parts() for row in writer.pq.read_table(part).to_pylist()]
+    assert sorted(row["path"] for row in rows) == ["a.png", "b.png", "c.png"]
+    assert not any(row["error"] for row in rows)
+    assert writer.processed_paths() == {"a.png", "b.png", "c.png"}
+
+
+def test_workers_do_not_start_the_metrics_endpoint(monkeypatch):
+    from models.OW2_new import metrics
+
+    starts = []
+    monkeypatch.setattr(metrics, "start_from_environment", lambda: starts.append(True))
+    monkeypatch.setattr(batch, "_predictor", None)
+    monkeypatch.setattr(batch, "_reset_session", None)
+    monkeypatch.setenv("OW2_METRICS_PORT", "9100")
+
+    # keep the torch threads of the test process as they are
+    torch = pytest.importorskip("torch")
+    batch._init_worker(torch.get_num_threads())
+    assert batch._predictor is not None
+    assert starts == []
@@ -0,0 +1,57 @@
+import numpy as np
+
+from models.OW2_new import benchmark
+
+
+class FakeBenchmark(benchmark.Benchmark):
+    """A Benchmark over fixed outputs, without the model, pipeline and rules."""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.cases = [(sample, variant, None) for sample, variant in outputs]
+        self.resets = []
+
+    def _reset(self, session):
+        self.resets.append(session)
+
+    def output(self, encoded, session):
+        sample, variant = session.split("-")[-2:]
+        return self.outputs[(sample, variant)]
+
+
+def test_variants_are_compared_against_the_original():
+    stats = [[1, 2, 3, 4, 5, 6]] * 10
+    changed = [row[:] for row in stats]
+    changed[3][1] = 9
+    outputs = {
+        ("s1", "original"): {"stats": stats, "team_composition": ["label_Ana"]},
+        ("s1", "720p"): {"stats": changed, "team_composition": ["label_Ana"]},
+        ("s1", "jpeg"): {"stats": stats, "team_composition": ["label_Mercy"]},
+        ("s1", "noise"): {"stats": stats, "team_composition": ["label_Ana"]},
+    }
+    _, mismatches = FakeBenchmark(outputs).check_outputs()
+    assert mismatches == [
+        "s1 720p: stat [3][1] is 9 instead of 2",
+        "s1 jpeg: team composition ['label_Mercy'] differs from ['label_Ana']",
+    ]
+
+
+def test_make_variant_shapes():
+    image = np.zeros((1080, 1920, 3), np.uint8)
+    assert benchmark.make_variant(image, "original") is image
+    assert benchmark.make_variant(image, "720p").shape == (720, 1280, 3)
+    assert benchmark.make_variant(image, "1440p").shape == (1440, 2560, 3)
+    assert benchmark.make_variant(image, "noise").dtype == np.uint8
+
+
+def test_check_budgets():
+    results = {"decode": {"all": {"p50_ms": 10.0, "p95_ms": 30.0}}}
+    budgets = {"stages": {"decode": {"p95_ms": 20.0}, "stat_ocr": {"p95_ms": 5.0}}, "peak_rss_mb": 100}
+    violations = benchmark.check_budgets(results, {"stat_ocr": "boom"}, 150, budgets,
+                                         baseline={"stages": {"decode": {"all": {"p50_ms": 5.0}}}}, max_regression=0.2)
+    assert violations == [
+        "decode: p95_ms 30.00 exceeds the budget of 20.00",
+        "stat_ocr: failed (boom)",
+        "peak RSS 150 MB exceeds the budget of 100 MB",
+        "decode: p50 10.00 ms regressed from 5.00 ms (more than 20%)",
+    ]
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from models.OW2_new.cell_cache import CellCache
+
+
+@pytest.mark.parametrize("width", [40, 600])
+def test_changed_cells(width):
+    cache = CellCache(pixel_tolerance=32, max_changed_pixels=3)
+    batch = np.random.default_rng(0).integers(0, 256, (4, 20, width), dtype=np.uint8)
+    assert cache.changed_cells(batch).all()
+    cache.store(batch, ["1", "2", "3", "4"], np.ones(4, dtype=bool))
+
+    current = batch.copy()
+    # noise within the tolerance, in both directions
+    current[0] = np.clip(batch[0].astype(np.int16) + 30, 0, 255)
+    current[1] = np.clip(batch[1].astype(np.int16) - 30, 0, 255)
+    # up to max_changed_pixels pixels may differ, one more counts as a change
+    current[2, 0, -3:] = batch[2, 0, -3:] ^ 0x80
+    current[3, -1, -4:] = batch[3, -1, -4:] ^ 0x80
+    np.testing.assert_array_equal(cache.changed_cells(current), [False, False, False, True])
+
+
+def test_changed_cells_of_another_layout():
+    cache = CellCache()
+    batch = np.zeros((4, 20, 40), dtype=np.uint8)
+    cache.store(batch, [""] * 4, np.ones(4, dtype=bool))
+    assert cache.changed_cells(np.zeros((4, 20, 41), dtype=np.uint8)).all()
+    assert cache.stats() == {"hits": 0, "misses": 4, "hit_rate": 0.0}
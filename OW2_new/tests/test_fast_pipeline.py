@@ -0,0 +1,76 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from models.OW2_new.custom_transformers import (
+    CappingFeatureValues, DataPivoter, FeatureEngineer, FeatureResetter, FeatureScaler
+)
+from models.OW2_new.fast_pipeline import (
+    FastFeaturePipeline, check_parity, random_snapshots, stats_batch_to_dataframe
+)
+from models.OW2_new.predictor import build_fast_pipeline
+
+PIPELINE_PKL = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "prediction_pipeline.pkl")
+
+
+def feature_steps():
+    return [("scaler", FeatureScaler()), ("capper", CappingFeatureValues()), ("resetter", FeatureResetter()),
+            ("pivoter", DataPivoter()), ("engineer", FeatureEngineer())]
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    """A pipeline with the layout of prediction_pipeline.pkl, fitted on random snapshots."""
+    stats, times = random_snapshots(300, seed=1)
+    outcomes = np.random.default_rng(1).integers(0, 2, len(stats))
+    encoder = ColumnTransformer([("status", OneHotEncoder(handle_unknown="ignore"),
+                                  ["tank_status", "support_status"])],
+                                remainder=StandardScaler())
+    pipeline = Pipeline(feature_steps() + [("encoder", encoder), ("model", LogisticRegression(max_iter=2000))])
+    return pipeline.fit(stats_batch_to_dataframe(stats, times), outcomes)
+
+
+def test_features_match_the_pickled_steps(pipeline):
+    stats, times = random_snapshots(50, seed=2)
+    expected = stats_batch_to_dataframe(stats, times)
+    for _, step in pipeline.steps[:len(feature_steps())]:
+        expected = step.transform(expected)
+    actual = FastFeaturePipeline(pipeline).transform(stats, times)
+    pd.testing.assert_frame_equal(actual, expected[actual.columns], check_dtype=False)
+
+
+@pytest.mark.parametrize("seed", [0, 3, 4])
+def test_probabilities_match_the_pipeline(pipeline, seed):
+    assert check_parity(pipeline, *random_snapshots(64, seed=seed)) < 1e-9
+
+
+def test_capped_players_match_the_pipeline(pipeline):
+    # stats far above the per minute caps, and a snapshot early in the match
+    stats, times = random_snapshots(8, seed=5)
+    stats = stats * 50
+    times[0] = 0.25
+    assert check_parity(pipeline, stats, times) < 1e-9
+
+
+def test_unknown_pipelines_are_rejected(pipeline):
+    with pytest.raises(ValueError):
+        FastFeaturePipeline(Pipeline(pipeline.steps[1:]))
+    with pytest.raises(ValueError):
+        FastFeaturePipeline(Pipeline(feature_steps()))
+
+    steps = feature_steps() + pipeline.steps[len(feature_steps()):]
+    steps[2] = ("resetter", FeatureResetter(features_to_reset=["K"]))
+    assert build_fast_pipeline(Pipeline(steps)) is False
+
+
+def test_shipped_pipeline_is_at_parity():
+    if not os.path.exists(PIPELINE_PKL):
+        pytest.skip(f"{PIPELINE_PKL} not found")
+    assert build_fast_pipeline(joblib.load(PIPELINE_PKL)) is not False
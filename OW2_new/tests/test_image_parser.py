@@ -0,0 +1,109 @@
+import pytest
+
+from models.OW2_new import predictor
+from models.OW2_new.image_parser import ImageParser
+from models.OW2_new.image_utils import Frame
+from models.OW2_new.template_locator import default_locator
+from models.OW2_new.tests.conftest import sample_path
+
+
+@pytest.fixture
+def parser():
+    return ImageParser(ocr_backend="digits", timer_reader=False, max_sessions=2)
+
+
+def test_session_caches_are_bounded(parser):
+    for session in ("a", "b", "c"):
+        parser.get_cell_cache(session)
+        parser.get_portrait_cache(session)
+    assert list(parser.cell_caches) == ["b", "c"]
+    assert list(parser.portrait_caches) == ["b", "c"]
+
+    # using a session makes it the most recent one
+    parser.get_cell_cache("b")
+    parser.get_cell_cache("d")
+    assert list(parser.cell_caches) == ["b", "d"]
+
+
+def test_reset_session_forgets_cached_state(parser):
+    frame = Frame.load(sample_path(1), session="match")
+    parser.extract_text_from_stats(frame)
+    assert "match" in parser.cell_caches
+    assert any(key[0] == ("match", "top") for key in default_locator._last_matches)
+
+    parser.reset_session("match")
+    assert "match" not in parser.cell_caches
+    assert not any(key[0] in (("match", "top"), ("match", "bottom")) for key in default_locator._last_matches)
+
+
+def test_predictor_reset_does_not_load_the_classifier(monkeypatch):
+    monkeypatch.setattr(predictor, "_classifier", None)
+    predictor.reset_session("match")
+    assert predictor._classifier is None
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return [Frame.load(sample_path(number)) for number in (1, 2, 3)]
+
+
+@pytest.fixture(scope="module")
+def plain_stats(frames):
+    plain = ImageParser(ocr_backend="digits", timer_reader=False, incremental_ocr=False, presence_gate=False,
+                        zero_ink_level=None)
+    return [plain.extract_text_from_stats(frame) for frame in frames]
+
+
+def test_incremental_ocr_matches_plain_ocr(frames, plain_stats):
+    incremental = ImageParser(ocr_backend="digits", timer_reader=False, presence_gate=False, zero_ink_level=None)
+    for i in (0, 1, 1, 2, 0, 2, 2):
+        assert incremental.extract_text_from_stats(frames[i], session="match") == plain_stats[i]
+
+    cache = incremental.get_cell_cache("match")
+    # the repeated screenshots reuse every cell
+    assert cache.stats()["hits"] >= 2 * 60
+
+
+class CountingEngine:
+    """Wraps an OCR engine and counts the cells it is asked to recognise."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.cells = 0
+
+    def recognize_grid(self, cells, config=""):
+        self.cells += sum(len(row) for row in cells)
+        return self.engine.recognize_grid(cells, config)
+
+
+def test_presence_gate_matches_plain_ocr(frames, plain_stats):
+    gated = ImageParser(ocr_backend="digits", timer_reader=False, incremental_ocr=False)
+    assert gated.presence_gate
+    for frame, expected in zip(frames, plain_stats):
+        assert gated.extract_text_from_stats(frame) == expected
+
+
+def test_presence_gate_skips_empty_cells(frames, plain_stats):
+    gated = ImageParser(ocr_backend="digits", timer_reader=False, incremental_ocr=False, zero_ink_level=None)
+    gated.stats_ocr_engine = CountingEngine(gated.stats_ocr_engine)
+
+    # blank the last three players, as on an early-match or backfill screenshot
+    stat_images = [image.copy() for image in frames[1].stat_images]
+    for image in stat_images[7:]:
+        image[:] = 0
+    stats = gated.extract_text_from_stats(stat_images)
+
+    assert stats[:7] == plain_stats[1][:7]
+    assert stats[7:] == [[''] * 6] * 3
+    assert gated.stats_ocr_engine.cells == 7 * 6
+
+
+def test_dim_zeros_skip_ocr(frames, plain_stats):
+    parser = ImageParser(ocr_backend="digits", timer_reader=False, incremental_ocr=False)
+    parser.stats_ocr_engine = CountingEngine(parser.stats_ocr_engine)
+    for frame, expected in zip(frames, plain_stats):
+        assert parser.extract_text_from_stats(frame) == expected
+
+    # only the cells with a non-zero value are OCR'd
+    values = [text for stats in plain_stats for row in stats for text in row if text not in ('', '0')]
+    assert 0 < parser.stats_ocr_engine.cells == len(values)
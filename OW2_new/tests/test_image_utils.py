@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+import pytest
+
+from models.OW2_new.image_parser import ImageParser
+from models.OW2_new.image_utils import (PORTRAIT_WIDTH, RAW_FRAME_EXTENSION, Frame, as_frame, describe_image,
+                                        dim_cells, prepare_sub_images, process_image, raw_frame_shape)
+from models.OW2_new.tests.conftest import sample_path
+
+
+def to_int(stats):
+    # empty cells count as 0, as in predictor.convert_stats_to_int
+    return [[int(text) if text else 0 for text in row] for row in stats]
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return ImageParser(ocr_backend="digits", timer_reader=False, incremental_ocr=False)
+
+
+@pytest.mark.parametrize("number", [1, 2, 3])
+@pytest.mark.parametrize("height", [720, 900, 1440])
+def test_other_resolutions_read_the_same_stats(parser, number, height):
+    image = cv2.imread(sample_path(number))
+    interpolation = cv2.INTER_AREA if height < image.shape[0] else cv2.INTER_CUBIC
+    resized = cv2.resize(image, (height * 16 // 9, height), interpolation=interpolation)
+
+    frame = Frame(resized)
+    assert frame.original_shape == resized.shape
+    assert frame.shape == image.shape
+    stats = parser.extract_text_from_stats(frame.stat_images)
+    expected = parser.extract_text_from_stats(Frame(image).stat_images)
+    assert to_int(stats) == to_int(expected)
+    # dim zeros may vanish when resized, but never read as another digit
+    assert all(text == expected_text or (text == '' and expected_text == '0')
+               for row, expected_row in zip(stats, expected) for text, expected_text in zip(row, expected_row))
+
+
+def test_dim_cells():
+    batch = np.zeros((3, 10, 10), np.uint8)
+    batch[0, 2:8, 3:6] = 140    # a dim zero
+    batch[1, 2:8, 3:6] = 140
+    batch[1, 4, 4] = 250        # a bright digit with dim anti-aliased edges
+    assert dim_cells(batch).tolist() == [True, False, True]
+    assert dim_cells(batch, max_ink_level=100).tolist() == [False, False, True]
+
+
+def test_frame_views_share_memory():
+    frame = Frame.load(sample_path(1))
+    assert frame.original_shape == frame.shape == (1080, 1920, 3)
+    assert frame.gray is frame.gray and frame.processed is frame.processed
+    assert np.shares_memory(frame.header, frame.image)
+    assert frame.header.shape == (100, 630, 3)
+
+    assert frame.prepare() is frame
+    sub_images = frame.sub_images
+    assert len(sub_images) == 10
+    assert all(a is b for a, b in zip(sub_images, frame.prepare().sub_images))
+    for sub_image, portrait, stats in zip(sub_images, frame.portraits, frame.stat_images):
+        assert portrait.shape[1] == PORTRAIT_WIDTH
+        assert portrait.shape[1] + stats.shape[1] == sub_image.shape[1]
+        assert np.shares_memory(portrait, frame.processed) and np.shares_memory(stats, frame.processed)
+    assert [si.shape for si in sub_images] == [si.shape for si in prepare_sub_images(process_image(frame.gray))]
+
+
+def test_every_input_type_gives_the_same_crops(tmp_path):
+    path = sample_path(2)
+    image = cv2.imread(path)
+    raw_path = tmp_path / f"frame{RAW_FRAME_EXTENSION}"
+    image.tofile(raw_path)
+    with open(path, "rb") as f:
+        encoded = f.read()
+
+    expected = Frame(image).stat_images
+    for source in (path, image, encoded, bytearray(encoded), memoryview(encoded), str(raw_path)):
+        frame = as_frame(source, session="s")
+        assert frame.session == "s"
+        assert all(np.array_equal(a, b) for a, b in zip(frame.stat_images, expected)), describe_image(source)
+    assert isinstance(as_frame(str(raw_path)).image, np.memmap)
+    assert as_frame(frame) is frame
+
+
+def test_raw_frame_shape():
+    assert raw_frame_shape(1920 * 1080 * 3) == (1080, 1920, 3)
+    with pytest.raises(ValueError):
+        raw_frame_shape(1000)
+
+
+def test_unreadable_inputs_raise_value_error(tmp_path):
+    with pytest.raises(ValueError):
+        Frame.load(str(tmp_path / "missing.png"))
+    with pytest.raises(ValueError):
+        Frame.decode(b"not an image")
+    with pytest.raises(ValueError):
+        Frame(np.zeros((10, 10), np.uint8))
@@ -0,0 +1,98 @@
+import importlib.util
+
+import pytest
+import torch
+
+from models.OW2_new import inference_backends
+from models.OW2_new.inference_backends import (build_model, check_parity, export_model, load_eager_model, load_model,
+                                               portrait_batches)
+from models.OW2_new.tests.conftest import sample_path
+
+NUM_CLASSES = 43
+BACKBONE = "resnet18"
+
+
+@pytest.fixture(scope="module")
+def sample_paths():
+    return [sample_path(number) for number in (1, 2, 3)]
+
+
+@pytest.fixture(scope="module")
+def batches(sample_paths):
+    return portrait_batches(sample_paths)
+
+
+@pytest.fixture(scope="module")
+def state_dict_path(tmp_path_factory, batches):
+    """
+    A state dict whose predictions differ between the sample portraits, with clear margins.
+
+    There is no trained model in the repository, so the batch norm statistics of a seeded random backbone are
+    recalibrated on the portraits and the head is fitted to tell the 10 scoreboard rows apart.
+    """
+    torch.manual_seed(0)
+    model = build_model(NUM_CLASSES, BACKBONE)
+    inputs = torch.cat(batches)
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.momentum = None
+            module.reset_running_stats()
+    with torch.no_grad():
+        model.train()(inputs)
+    model.eval()
+
+    head, model.fc = model.fc, torch.nn.Identity()
+    with torch.no_grad():
+        features = model(inputs)
+    model.fc = head
+    labels = torch.arange(len(inputs)) % 10
+    optimizer = torch.optim.Adam(head.parameters(), lr=1e-2)
+    for _ in range(300):
+        optimizer.zero_grad()
+        torch.nn.functional.cross_entropy(head(features), labels).backward()
+        optimizer.step()
+    head.eval()
+
+    path = tmp_path_factory.mktemp("model") / "model.pth"
+    torch.save(model.state_dict(), path)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def reference(state_dict_path, batches):
+    reference = load_eager_model(state_dict_path, NUM_CLASSES, BACKBONE)
+    with torch.no_grad():
+        classes = torch.cat([reference(batch) for batch in batches]).argmax(1)
+    # the comparison means something only if the portraits are told apart
+    assert len(set(classes.tolist())) == 10
+    return reference
+
+
+def backend_available(backend):
+    if backend == "onnx":
+        return inference_backends.onnxruntime is not None and importlib.util.find_spec("onnx") is not None
+    if backend == "static_int8":
+        return "x86" in torch.backends.quantized.supported_engines
+    return True
+
+
+@pytest.mark.parametrize("backend", ["dynamic_int8", "static_int8", "torchscript", "onnx"])
+def test_backend_matches_eager_top1(backend, state_dict_path, reference, batches, sample_paths, tmp_path):
+    if not backend_available(backend):
+        pytest.skip(f"{backend} is not available")
+
+    if backend == "dynamic_int8":
+        model_path = state_dict_path
+    else:
+        model_path = str(tmp_path / ("model.onnx" if backend == "onnx" else "model.pt"))
+        export_model(state_dict_path, model_path, backend, NUM_CLASSES, BACKBONE, calibration_images=sample_paths)
+
+    candidate = load_model(model_path, NUM_CLASSES, backend, BACKBONE)
+    result = check_parity(reference, candidate, batches, repeats=1)
+    assert result["images"] == 30
+    assert result["top1_agreement"] == 1.0
+
+
+def test_unknown_backend_is_rejected(state_dict_path):
+    with pytest.raises(ValueError):
+        load_model(state_dict_path, NUM_CLASSES, backend="tensorrt")
@@ -0,0 +1,73 @@
+import threading
+
+import numpy as np
+
+from models.OW2_new.match_timeline import MatchTimeline, MatchTimelineStore
+
+
+def stats_at(minute):
+    return np.full((10, 6), minute, dtype=np.int32)
+
+
+def test_append_grows_and_keeps_time_order():
+    timeline = MatchTimeline(capacity=1)
+    for minute, probability in [(1.0, 0.4), (3.0, None), (2.0, 0.6), (3.0, 0.7), (0.5, 0.5)]:
+        timeline.append(stats_at(2 * minute), minute, probability, ["label_Ana", None, "label_Mercy"])
+
+    assert len(timeline) == 5
+    assert timeline.times.tolist() == [0.5, 1.0, 2.0, 3.0, 3.0]
+    assert (timeline.stats[:, 0, 0] == 2 * timeline.times).all()
+    assert timeline.between(1.0, 2.5)["time"].tolist() == [1.0, 2.0]
+    assert timeline.composition(0) == ["label_Ana", None, "label_Mercy", None, None]
+    # equal times keep their arrival order
+    assert timeline.chart_points() == ([0.5, 1.0, 2.0, 3.0], [0.5, 0.4, 0.6, 0.7])
+
+
+def test_trends():
+    timeline = MatchTimeline()
+    for minute in range(5):
+        timeline.append(stats_at(2 * minute), minute, 0.5 + 0.1 * minute)
+    assert np.allclose(timeline.trend(window_minutes=2.0), 2.0)
+    assert abs(timeline.probability_trend() - 0.1) < 1e-9
+
+
+def test_spill_and_load_round_trip(tmp_path):
+    store = MatchTimelineStore(str(tmp_path), capacity=2)
+    assert store.end_match() is None
+
+    for match, outcome in enumerate(["win", "loss"]):
+        for minute in range(3):
+            store.append(stats_at(10 * match + minute), minute, 0.5, ["label_Ana", f"label_{match}"])
+        record = store.end_match(outcome=outcome)
+        assert (record["match"], record["offset"], record["length"]) == (match, 3 * match, 3)
+
+    # a new store continues the numbering of the index on disk
+    reopened = MatchTimelineStore(str(tmp_path))
+    reopened.append(stats_at(0), 0.0)
+    assert reopened.end_match()["match"] == 2
+
+    matches = reopened.matches()
+    assert [match["outcome"] for match in matches] == ["win", "loss", None]
+    loaded = reopened.load_match(1)
+    assert isinstance(loaded.records, np.memmap)
+    assert loaded.times.tolist() == [0.0, 1.0, 2.0]
+    assert loaded.stats[2, 9, 5] == 12
+    assert loaded.composition() == ["label_Ana", "label_1", None, None, None]
+
+
+def test_no_snapshot_is_lost_when_a_match_ends_concurrently(tmp_path):
+    store = MatchTimelineStore(str(tmp_path))
+    n_snapshots = 2000
+
+    def append():
+        for i in range(n_snapshots):
+            store.append(stats_at(0), float(i))
+
+    thread = threading.Thread(target=append)
+    thread.start()
+    while thread.is_alive():
+        store.end_match()
+    thread.join()
+    store.end_match()
+
+    assert sum(match["length"] for match in store.matches()) == n_snapshots
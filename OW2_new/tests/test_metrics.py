@@ -0,0 +1,81 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from models.OW2_new.metrics import MetricsRegistry, start_metrics_server
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry(window=4)
+
+
+def test_timer_and_timed_record_durations(registry):
+    with registry.timer("decode"):
+        time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with registry.timer("decode"):
+            raise ValueError("unreadable")
+
+    @registry.timed("ocr")
+    def ocr(text):
+        return text
+
+    assert ocr("12") == "12"
+    stages = registry.snapshot()["stages"]
+    assert stages["decode"]["count"] == 2 and stages["ocr"]["count"] == 1
+    assert stages["decode"]["max_ms"] >= 10
+    assert ocr.__name__ == "ocr"
+
+
+def test_observe_keeps_totals_and_a_window_of_durations(registry):
+    for seconds in (1.0, 0.001, 0.002, 0.003, 0.004):
+        registry.observe("stage", seconds)
+    stage = registry.snapshot()["stages"]["stage"]
+    # the count and mean cover every duration, the percentiles the 4 most recent ones
+    assert stage["count"] == 5
+    assert stage["mean_ms"] == pytest.approx(1010 / 5)
+    assert stage["max_ms"] == pytest.approx(4)
+    assert stage["p50_ms"] == pytest.approx(2.5)
+    assert stage["p50_ms"] <= stage["p95_ms"] <= stage["p99_ms"] <= stage["max_ms"]
+
+
+def test_counters_and_gauges_are_in_the_snapshot(registry):
+    registry.increment("timer_fallbacks")
+    registry.increment("timer_fallbacks", 2)
+    registry.register_gauge("cache", lambda: {"hits": 3})
+    registry.register_gauge("broken", lambda: 1 / 0)
+
+    snapshot = registry.snapshot()
+    assert snapshot["counters"] == {"timer_fallbacks": 3}
+    assert snapshot["gauges"]["cache"] == {"hits": 3}
+    assert snapshot["gauges"]["broken"].startswith("error:")
+
+    registry.reset()
+    snapshot = registry.snapshot()
+    assert snapshot["stages"] == {} and snapshot["counters"] == {}
+    # gauges stay registered
+    assert snapshot["gauges"]["cache"] == {"hits": 3}
+
+
+def test_endpoint_serves_the_snapshot(registry):
+    registry.observe("decode", 0.002)
+    registry.increment("stat_cells_empty", 7)
+    server = start_metrics_server(0, registry=registry)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(url + "/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"] == "application/json"
+            served = json.loads(response.read())
+        assert served == json.loads(json.dumps(registry.snapshot()))
+        assert served["counters"] == {"stat_cells_empty": 7}
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,79 @@
+import shutil
+
+import numpy as np
+import pytest
+import tesserocr
+from PIL import Image
+
+from models.OW2_new.image_parser import TESSERACT_NUMERIC_CONFIG, ImageParser
+from models.OW2_new.image_utils import Frame
+from models.OW2_new.ocr_engine import (TesserocrEngine, TiledTesseractEngine, create_ocr_engine,
+                                       parse_tesseract_config, tessdata_path)
+from models.OW2_new.tests.conftest import sample_path
+
+requires_tesseract = pytest.mark.skipif(shutil.which("tesseract") is None, reason="tesseract is not installed")
+
+
+def test_parse_tesseract_config():
+    psm, oem, variables = parse_tesseract_config("--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789")
+    assert (psm, oem, variables) == (6, 3, {"tessedit_char_whitelist": "0123456789"})
+
+
+def test_tiled_image_places_every_cell_in_its_slot():
+    engine = TiledTesseractEngine(padding=4)
+    cells = [[np.full((10, 20), 1, np.uint8), np.full((8, 30), 2, np.uint8)],
+             [np.full((10, 20), 3, np.uint8), np.full((8, 30), 4, np.uint8)]]
+    tiled, col_edges, slot_height = engine.build_tiled_image(cells)
+
+    assert list(col_edges) == [0, 28, 66]
+    assert slot_height == 18
+    assert tiled.shape == (36, 66)
+    assert (tiled[4:14, 4:24] == 1).all()
+    assert (tiled[22:30, 32:62] == 4).all()
+    assert np.count_nonzero(tiled) == sum(cell.size for row in cells for cell in row)
+
+
+@requires_tesseract
+@pytest.mark.parametrize("number", [1, 2, 3])
+def test_tiled_matches_per_cell_tesseract(number):
+    frame = Frame.load(sample_path(number))
+    per_cell = ImageParser(ocr_backend="tesseract", timer_reader=False, incremental_ocr=False)
+    tiled = ImageParser(ocr_backend="tiled", timer_reader=False, incremental_ocr=False)
+    assert tiled.extract_text_from_stats(frame) == per_cell.extract_text_from_stats(frame)
+
+
+def file_route_text(api, cell, config, path):
+    """The text per-cell pytesseract returns for a cell: the PNG it writes, read by Tesseract like its CLI does."""
+    psm, _, variables = parse_tesseract_config(config)
+    Image.fromarray(cell).save(path)
+    api.SetPageSegMode(psm)
+    for key, value in variables.items():
+        api.SetVariable(key, value)
+    api.SetImageFile(str(path))
+    return api.GetUTF8Text()
+
+
+def test_auto_is_the_in_process_engine():
+    engine = create_ocr_engine("auto")
+    try:
+        assert isinstance(engine, TesserocrEngine)
+    finally:
+        engine.close()
+    assert isinstance(ImageParser(timer_reader=False).ocr_engine, TesserocrEngine)
+
+
+@pytest.mark.parametrize("number", [1, 2, 3])
+def test_tesserocr_matches_per_cell_tesseract(number, tmp_path):
+    frame = Frame.load(sample_path(number))
+    cells = [ImageParser.split_sections(image) for image in frame.stat_images]
+    engine = TesserocrEngine(max_workers=2)
+    try:
+        texts = engine.recognize_grid(cells, config=TESSERACT_NUMERIC_CONFIG)
+    finally:
+        engine.close()
+
+    with tesserocr.PyTessBaseAPI(path=tessdata_path(), lang="eng") as api:
+        expected = [[file_route_text(api, cell, TESSERACT_NUMERIC_CONFIG, tmp_path / "cell.png") for cell in row]
+                    for row in cells]
+    assert texts == expected
+    assert sum(text.strip() != "" for row in texts for text in row) > 0
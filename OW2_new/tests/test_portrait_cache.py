@@ -0,0 +1,45 @@
+import pytest
+
+from models.OW2_new.image_utils import Frame
+from models.OW2_new.portrait_cache import PortraitCache, portrait_hash
+from models.OW2_new.tests.conftest import sample_path
+
+
+@pytest.fixture(scope="module")
+def portraits():
+    return {number: Frame.load(sample_path(number)).portraits for number in (1, 2, 3)}
+
+
+@pytest.mark.parametrize("first, second", [((1, 1), (3, 1)), ((1, 1), (3, 4)), ((2, 1), (3, 4))])
+def test_different_portraits_miss(portraits, first, second):
+    cache = PortraitCache()
+    image = portraits[first[0]][first[1]]
+    cache.put(cache.hash(image), "first", 1.0, row=first[1])
+
+    other = portraits[second[0]][second[1]]
+    assert cache.get(cache.hash(other), row=first[1]) is None
+    assert cache.get(cache.hash(other), row=second[1]) is None
+
+
+@pytest.mark.parametrize("row", [1, 3, 4])
+def test_same_hero_hits_across_screenshots(portraits, row):
+    cache = PortraitCache()
+    cache.put(cache.hash(portraits[1][row]), "hero", 0.9, row=row)
+    assert cache.get(cache.hash(portraits[2][row]), row=row) == ("hero", 0.9)
+
+
+def test_rows_do_not_share_entries(portraits):
+    cache = PortraitCache()
+    image = portraits[1][3]
+    cache.put(cache.hash(image), "hero", 0.9, row=3)
+    assert cache.get(portrait_hash(image), row=4) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_eviction():
+    cache = PortraitCache(max_size=2)
+    for row in range(3):
+        cache.put(row, f"label{row}", 1.0, row=row)
+    assert len(cache) == 2
+    assert cache.get(0, row=0) is None
+    assert cache.get(2, row=2) == ("label2", 1.0)
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from models.OW2_new.image_parser import ImageParser
+from models.OW2_new.image_utils import PORTRAIT_WIDTH
+from models.OW2_new.portrait_writer import INDEX_FILENAME, PortraitWriter, get_portrait_writer
+
+
+def portraits(n, seed=0):
+    """Random portraits, far apart in dHash."""
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (62, PORTRAIT_WIDTH), dtype=np.uint8) for _ in range(n)]
+
+
+def stored_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".png"))
+
+
+def index_records(directory):
+    with open(os.path.join(directory, INDEX_FILENAME)) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def blocked_writes(monkeypatch):
+    """Make every portrait write wait until released, recording the thread it runs on."""
+    blocked = {"threads": [], "started": threading.Event(), "release": threading.Event()}
+    imwrite = cv2.imwrite
+
+    def blocking_imwrite(path, image):
+        blocked["threads"].append(threading.current_thread().name)
+        blocked["started"].set()
+        blocked["release"].wait(5)
+        return imwrite(path, image)
+
+    monkeypatch.setattr(cv2, "imwrite", blocking_imwrite)
+    yield blocked
+    blocked["release"].set()
+
+
+def test_save_image_writes_off_the_calling_thread(tmp_path, blocked_writes):
+    directory = str(tmp_path / "hidden")
+    portrait = portraits(1)[0]
+    # returns while the write is still blocked
+    assert ImageParser.save_image(portrait[10:50], _dir=directory, label="label_Hidden", confidence=0.42)
+    assert blocked_writes["started"].wait(5)
+    assert not os.path.exists(directory) or not stored_files(directory)
+
+    blocked_writes["release"].set()
+    writer = get_portrait_writer(directory)
+    assert writer.flush(timeout=5)
+    assert blocked_writes["threads"] == ["portrait-writer"]
+    assert len(stored_files(directory)) == 1
+    record, = index_records(directory)
+    assert (record["label"], record["confidence"]) == ("label_Hidden", 0.42)
+    writer.close()
+
+
+def test_close_flushes_the_queue(tmp_path):
+    directory = str(tmp_path)
+    writer = PortraitWriter(directory)
+    for portrait in portraits(10):
+        assert writer.submit(portrait, label="label_Ana")
+    writer.close()
+
+    assert writer.stats()["written"] == 10
+    assert len(stored_files(directory)) == 10
+    assert len(index_records(directory)) == 10
+    with pytest.raises(RuntimeError):
+        writer.submit(portraits(1)[0])
+
+
+def test_submitted_portrait_is_copied(tmp_path, blocked_writes):
+    writer = PortraitWriter(str(tmp_path))
+    first, second = portraits(2)
+    writer.submit(first)
+    assert blocked_writes["started"].wait(5)
+    frame = second.copy()
+    writer.submit(frame)
+    # the caller reuses its buffer before the writer gets to it
+    frame[:] = 0
+    blocked_writes["release"].set()
+    writer.close()
+
+    stored = [cv2.imread(os.path.join(str(tmp_path), name), cv2.IMREAD_GRAYSCALE)
+              for name in stored_files(str(tmp_path))]
+    assert any(np.array_equal(image, second) for image in stored)
+
+
+def test_full_queue_drops_portraits(tmp_path, blocked_writes):
+    writer = PortraitWriter(str(tmp_path), max_queue=1)
+    first, second, third = portraits(3)
+    assert writer.submit(first)
+    assert blocked_writes["started"].wait(5)
+    assert writer.submit(second)
+    assert not writer.submit(third)
+    blocked_writes["release"].set()
+    writer.close()
+    assert writer.stats()["dropped"] == 1 and writer.stats()["written"] == 2
+
+
+def test_duplicates_are_skipped_across_restarts(tmp_path):
+    directory = str(tmp_path)
+    portrait = portraits(1)[0]
+    writer = PortraitWriter(directory)
+    writer.submit(portrait)
+    writer.submit(portrait)
+    writer.close()
+    assert (writer.stats()["written"], writer.stats()["duplicates"]) == (1, 1)
+
+    # a new writer restores the stored hashes from the index
+    writer = PortraitWriter(directory)
+    writer.submit(portrait)
+    writer.close()
+    assert (writer.stats()["written"], writer.stats()["duplicates"]) == (0, 1)
+    assert len(stored_files(directory)) == 1
+
+
+def test_oldest_portraits_are_deleted(tmp_path):
+    directory = str(tmp_path)
+    writer = PortraitWriter(directory, max_files=4, low_water=0.5)
+    images = portraits(5)
+    for portrait in images:
+        writer.submit(portrait)
+    writer.close()
+
+    assert writer.stats()["deleted"] == 3
+    records = index_records(directory)
+    assert len(records) == 2
+    assert sorted(record["file"] for record in records) == stored_files(directory)
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from models.OW2_new import predictor
+from models.OW2_new.predictor import UserPredictor
+
+
+class FakeClassifier:
+    model = None
+
+
+class FakePipeline:
+    def __init__(self):
+        self.threads = []
+
+    def predict_proba(self, features):
+        self.threads.append(threading.current_thread().name)
+        return np.full((len(features), 2), 0.5)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Replace the classifier and pipeline loaders with fakes that record the thread they run on."""
+    loads = {"classifier": [], "pipeline": []}
+    pipeline = FakePipeline()
+
+    def get_classifier():
+        loads["classifier"].append(threading.current_thread().name)
+        return FakeClassifier()
+
+    def load_pipeline():
+        loads["pipeline"].append(threading.current_thread().name)
+        return pipeline
+
+    monkeypatch.setattr(predictor, "_classifier", None)
+    monkeypatch.setattr(predictor, "get_classifier", get_classifier)
+    monkeypatch.setattr(predictor, "load_pipeline", load_pipeline)
+    monkeypatch.setattr(predictor, "build_fast_pipeline", lambda pipeline: False)
+    return loads
+
+
+def test_import_does_not_load_torch():
+    code = "import sys, models.OW2_new.predictor; sys.exit('torch' in sys.modules)"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    assert subprocess.run([sys.executable, "-c", code], env=env).returncode == 0
+
+
+def test_no_warm_up_loads_nothing(loads):
+    user_predictor = UserPredictor(warm_up=False)
+    assert loads == {"classifier": [], "pipeline": []}
+    assert not user_predictor.is_ready
+
+    # the pipeline is loaded on first use, once
+    user_predictor.predict_probability_batch(np.zeros((2, 10, 6)), [1.0, 2.0])
+    user_predictor.predict_probability_batch(np.zeros((1, 10, 6)), [3.0])
+    assert loads == {"classifier": [], "pipeline": [threading.current_thread().name]}
+
+
+def test_warm_up_runs_in_the_background(loads):
+    user_predictor = UserPredictor()
+    assert user_predictor.ready.wait(5)
+    assert user_predictor.is_ready
+    assert loads == {"classifier": ["predictor-warm-up"], "pipeline": ["predictor-warm-up"]}
+
+
+def test_pipeline_is_loaded_once_by_concurrent_callers(loads):
+    user_predictor = UserPredictor(warm_up=False)
+    threads = [threading.Thread(target=lambda: user_predictor.loaded_pipeline) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads["pipeline"]) == 1
+
+
+def test_failed_warm_up_leaves_the_predictor_not_ready(loads, monkeypatch):
+    def failing_load():
+        raise FileNotFoundError("prediction_pipeline.pkl")
+
+    monkeypatch.setattr(predictor, "load_pipeline", failing_load)
+    user_predictor = UserPredictor(warm_up=False)
+    user_predictor.warm_up()
+    assert not user_predictor.is_ready
+
+
+def test_configure_classifier_drops_the_loaded_classifier(monkeypatch):
+    monkeypatch.setattr(predictor, "_classifier", FakeClassifier())
+    monkeypatch.setattr(predictor, "_classifier_options", {})
+    predictor.configure_classifier(ocr_backend="digits")
+    assert predictor._classifier is None
+    assert predictor._classifier_options == {"ocr_backend": "digits"}
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from models.OW2_new.digit_recognizer import DigitRecognizer
+from models.OW2_new.image_parser import ImageParser
+from models.OW2_new.image_utils import Frame
+from models.OW2_new.ocr_engine import create_ocr_engine
+from models.OW2_new.process_ocr import SharedCellBuffer
+from models.OW2_new.tests.conftest import sample_path
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_ocr_engine("process", worker_backend="digits", max_workers=2, min_cells_per_task=4)
+    yield engine
+    engine.close()
+
+
+def test_placed_cells_are_rebuilt_from_the_block():
+    frame = np.arange(60 * 80, dtype=np.uint8).reshape(60, 80)
+    cells = [frame[0:10, 5:25], frame[30:40, 50:80], frame[10:20, 0:80:2], np.ones((4, 6), np.float32)]
+    buffer = SharedCellBuffer(16)
+    try:
+        descriptors = buffer.place(cells)
+        for cell, (offset, shape, strides) in zip(cells, descriptors):
+            rebuilt = np.ndarray(shape, dtype=np.uint8, buffer=buffer.block.buf, offset=offset, strides=strides)
+            np.testing.assert_array_equal(rebuilt, cell.astype(np.uint8))
+            del rebuilt
+    finally:
+        buffer.close()
+
+
+@pytest.mark.parametrize("number", [1, 2, 3])
+def test_process_engine_matches_digits(engine, number):
+    frame = Frame.load(sample_path(number))
+    digits = ImageParser(ocr_backend="digits", timer_reader=False, incremental_ocr=False)
+    process = ImageParser(ocr_backend="digits", stats_ocr_backend=engine, timer_reader=False, incremental_ocr=False)
+    assert process.extract_text_from_stats(frame) == digits.extract_text_from_stats(frame)
+
+
+def test_process_engine_recognizes_copied_and_shared_cells(engine):
+    frame = Frame.load(sample_path(2))
+    # the stat sections are views of the processed frame; every other row is copied and placed cell by cell
+    cells = [[section if i % 2 else section.copy() for section in ImageParser.split_sections(image)]
+             for i, image in enumerate(frame.stat_images)]
+    assert engine.recognize_grid(cells) == DigitRecognizer().recognize_grid(cells)
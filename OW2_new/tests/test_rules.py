@@ -0,0 +1,107 @@
+import itertools
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from models.OW2_new.events_handler import UserEventsHandler
+from models.OW2_new.tests.conftest import RULES_CSV
+
+STATUSES = ("good", "average", "poor", "not enough data")
+COMPOSITIONS = (
+    ["label_Hazard", "label_Junkrat", "label_Torbjorn", "label_Juno", "label_Ana"],
+    ["label_Reinhardt", "label_Ashe", "label_Cassidy", "label_Mercy", "label_Moira"],
+    ["label_Nobody", "label_Noone", "label_Nothing", "label_Never", "label_None"],
+)
+
+
+def reference_rules_table(rules_df, team_composition, team_statuses, win_probability):
+    """The rules table built by filtering the rule strings with pandas, without the rule index."""
+    tank_status, dps_status, support_status = team_statuses
+    if "not enough data" in team_statuses:
+        outcome = 1
+        required = {"RESULT=1"}
+    else:
+        outcome = 1 if win_probability > 0.5 else 0
+        required = {f"TANK={tank_status}", f"DPS={dps_status}", f"SUP={support_status}", f"RESULT={outcome}"}
+    team_composition = ['_'.join(player.split('_')[1:]) for player in team_composition]
+
+    filtered = rules_df[rules_df["combined"].apply(
+        lambda combined: required.issubset(x.strip() for x in combined.strip("{}").split(",")))].copy()
+    if filtered.empty:
+        return None
+
+    def remove_statuses(combined):
+        cleaned = [item.strip().split("=")[1] for item in combined.strip("{}").split(",")
+                   if not item.strip().startswith(("TANK=", "DPS=", "SUP=", "RESULT="))]
+        return ", ".join(cleaned) if cleaned else "{}"
+
+    filtered["combined"] = filtered["combined"].apply(remove_statuses)
+    filtered["num_exist"] = filtered["combined"].apply(
+        lambda x: len([member for member in x.split(", ") if member in team_composition]))
+    filtered = filtered.sort_values(by=["num_exist", "lift"], ascending=False)
+    return filtered[filtered["num_exist"] > 0]
+
+
+@pytest.mark.parametrize("team_statuses", list(itertools.product(STATUSES, repeat=3)))
+def test_rules_table_matches_reference_filter(handler, reference_rules, team_statuses):
+    for team_composition, win_probability in itertools.product(COMPOSITIONS, (0.3, 0.7)):
+        table = handler.get_rules_table(team_composition, team_statuses, win_probability)
+        expected = reference_rules_table(reference_rules, team_composition, team_statuses, win_probability)
+
+        if expected is None:
+            assert table == {"table_html": "<p>No rules found for these statuses</p>"}
+            continue
+        rules = pd.DataFrame(table["rules"], columns=expected.columns)
+        assert rules["combined"].tolist() == expected["combined"].tolist()
+        assert rules["num_exist"].tolist() == expected["num_exist"].tolist()
+        assert rules["lift"].tolist() == expected["lift"].tolist()
+        if len(expected):
+            max_exist = expected["num_exist"].max()
+            assert f"({max_exist} player match)" in table["table_html"]
+
+
+@pytest.fixture
+def cached_handler(tmp_path):
+    """A handler with an empty rules table cache of two entries."""
+    rules_path = str(tmp_path / "team_rules.csv")
+    shutil.copy(RULES_CSV, rules_path)
+    return UserEventsHandler(rules_path=rules_path, rules_table_cache_size=2,
+                             timeline_dir=str(tmp_path / "match_history"))
+
+
+def test_rules_table_cache_ignores_composition_order(cached_handler):
+    statuses = ("good", "average", "poor")
+    table = cached_handler.get_rules_table(COMPOSITIONS[1], statuses, 0.7)
+    # the same outcome, whatever the probability, and the same heroes in any order
+    for team_composition in itertools.permutations(COMPOSITIONS[1]):
+        assert cached_handler.get_rules_table(list(team_composition), statuses, 0.9) is table
+    assert cached_handler.rules_table_cache_stats()["misses"] == 1
+    assert cached_handler.rules_table_cache_stats()["hits"] == 120
+
+    # the other outcome is another table
+    assert cached_handler.get_rules_table(COMPOSITIONS[1], statuses, 0.3) is not table
+    assert cached_handler.rules_table_cache_stats()["misses"] == 2
+
+    # without enough data the outcome is always 1
+    cached_handler.get_rules_table(COMPOSITIONS[1], ("good", "not enough data", "poor"), 0.3)
+    cached_handler.get_rules_table(COMPOSITIONS[1], ("good", "not enough data", "poor"), 0.7)
+    assert cached_handler.rules_table_cache_stats()["misses"] == 3
+
+
+def test_rules_table_cache_is_bounded_and_dropped_on_reload(cached_handler):
+    statuses = ("good", "good", "good")
+    for team_composition in COMPOSITIONS:
+        cached_handler.get_rules_table(team_composition, statuses, 0.7)
+    assert cached_handler.rules_table_cache_stats()["size"] == 2
+
+    # the least recently used table was evicted
+    cached_handler.get_rules_table(COMPOSITIONS[0], statuses, 0.7)
+    assert cached_handler.rules_table_cache_stats()["misses"] == 4
+
+    # a modified rules file is reloaded and the cached tables are dropped
+    os.utime(cached_handler.rules_path, (0, cached_handler.rules_mtime + 10))
+    cached_handler.get_rules_table(COMPOSITIONS[0], statuses, 0.7)
+    assert cached_handler.rules_table_cache_stats()["misses"] == 5
+    assert cached_handler.rules_table_cache_stats()["size"] == 1
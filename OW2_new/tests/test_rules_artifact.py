@@ -0,0 +1,61 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.OW2_new import rules_artifact
+from models.OW2_new.rules_artifact import artifact_path_for, build_rules, load_rules, read_rules_artifact
+from models.OW2_new.tests.conftest import RULES_CSV
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = str(tmp_path / "team_rules.csv")
+    shutil.copy(RULES_CSV, path)
+    return path
+
+
+def test_artifact_round_trip(rules_path):
+    assert read_rules_artifact(rules_path) is None
+    rules_df, rule_index = load_rules(rules_path)
+    assert os.path.exists(artifact_path_for(rules_path))
+
+    loaded_df, loaded_index = read_rules_artifact(rules_path)
+    pd.testing.assert_frame_equal(loaded_df, rules_df, check_dtype=False)
+    items = {"TANK=good", "RESULT=1"}
+    np.testing.assert_array_equal(loaded_index.matching(items), rule_index.matching(items))
+
+    # a touched CSV with the same content still matches; another content does not
+    os.utime(rules_path, (0, 0))
+    assert read_rules_artifact(rules_path) is not None
+    with open(rules_path, "a") as f:
+        f.write('"{DPS=good}","{RESULT=1}",0.1,0.6,0.2,1.5,10\n')
+    assert read_rules_artifact(rules_path) is None
+
+
+@pytest.mark.parametrize("failing", ["savez", "replace"])
+def test_failed_write_leaves_no_temporary_file(rules_path, monkeypatch, failing):
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(rules_artifact.np if failing == "savez" else rules_artifact.os, failing, fail)
+    rules_df, _ = load_rules(rules_path)
+    assert len(rules_df)
+    assert os.listdir(os.path.dirname(rules_path)) == ["team_rules.csv"]
+
+
+def test_csv_modified_during_the_build_is_not_recorded(rules_path, monkeypatch):
+    def build_then_modify(path):
+        built = build_rules(path)
+        # the CSV is replaced while the previous content is being preprocessed
+        with open(path, "a") as f:
+            f.write('"{DPS=good}","{RESULT=1}",0.1,0.6,0.2,1.5,10\n')
+        return built
+
+    monkeypatch.setattr(rules_artifact, "build_rules", build_then_modify)
+    load_rules(rules_path)
+    assert os.path.exists(artifact_path_for(rules_path))
+    # the artifact holds the previous content, so it is not current for the modified CSV
+    assert read_rules_artifact(rules_path) is None
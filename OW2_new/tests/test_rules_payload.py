@@ -0,0 +1,38 @@
+import json
+
+from models.OW2_new.rules_payload import NUMERIC_COLUMNS, PAYLOAD_FORMAT
+
+
+def decode_rules_payload(payload):
+    """The rule records rebuilt from the compact payload, as decodeRulesPayload does in the role component."""
+    def side(codes, offsets, i):
+        return [payload["items"][code] for code in codes[offsets[i]:offsets[i + 1]]]
+
+    records = []
+    for i in range(len(payload["lift"])):
+        lhs = side(payload["lhs"], payload["lhs_offsets"], i)
+        rhs = side(payload["rhs"], payload["rhs_offsets"], i)
+        record = {"lhs": "{" + ",".join(lhs) + "}", "rhs": "{" + ",".join(rhs) + "}"}
+        record.update({column: payload[column][i] for column in NUMERIC_COLUMNS})
+        record["combined"] = "{" + ", ".join(sorted(lhs + rhs)) + "}"
+        records.append(record)
+    return records
+
+
+def test_decoded_payload_matches_the_rule_records(handler, reference_rules):
+    version, body = handler.rules_payload()
+    payload = json.loads(body)
+    assert payload["format"] == PAYLOAD_FORMAT
+    assert payload["version"] == version
+
+    # the records the page load event sent before the compact payload
+    expected = reference_rules.to_dict(orient="records")
+    assert decode_rules_payload(payload) == expected
+
+
+def test_payload_version_is_stable_across_reloads(handler):
+    version, body = handler.rules_payload()
+    assert handler.rules_payload() == (version, body)
+
+    handler.load_rules()
+    assert handler.rules_payload() == (version, body)
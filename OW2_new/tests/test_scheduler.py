@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+from models import HandlerEvent
+from models.OW2_new.scheduler import ScreenshotScheduler
+
+
+class BlockingPredictor:
+    """Records the screenshots it processes; the first one blocks until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.processed = []
+
+    def get_stats_and_details(self, screenshot, session=None):
+        self.started.set()
+        self.release.wait(5)
+        if screenshot == "broken":
+            raise ValueError("broken screenshot")
+        self.processed.append((session, screenshot))
+        return [[0] * 6] * 10, (1.5, ["label_Ana"] * 5)
+
+    def predict_probability(self, stats, game_details):
+        return 0.25
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.events = []
+
+    def handle_event(self, socket_object, event_name, payload):
+        self.events.append((socket_object, event_name, payload))
+
+
+@pytest.fixture
+def scheduler():
+    predictor, handler = BlockingPredictor(), RecordingHandler()
+    scheduler = ScreenshotScheduler(predictor, handler, socket_object="socket", workers=1, max_pending_sessions=2)
+    yield scheduler
+    predictor.release.set()
+    scheduler.close(timeout=5)
+
+
+def test_latest_screenshot_of_a_session_wins(scheduler):
+    predictor = scheduler.predictor
+    assert scheduler.submit("s1", "first")
+    assert predictor.started.wait(5)
+
+    # the worker is busy with "first"; the next two of s1 coalesce into the newest
+    assert scheduler.submit("s1", "second")
+    assert scheduler.submit("s1", "third")
+    assert scheduler.submit("s2", "other")
+    predictor.release.set()
+    scheduler.close(timeout=5)
+
+    assert predictor.processed == [("s1", "first"), ("s2", "other"), ("s1", "third")]
+    stats = scheduler.stats()
+    assert (stats["submitted"], stats["processed"], stats["superseded"], stats["rejected"]) == (4, 3, 1, 0)
+    assert stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+
+def test_new_sessions_are_rejected_when_the_queue_is_full(scheduler):
+    predictor = scheduler.predictor
+    scheduler.submit("s1", "first")
+    assert predictor.started.wait(5)
+
+    assert scheduler.submit("s2", "a")
+    assert scheduler.submit("s3", "b")
+    assert not scheduler.submit("s4", "c")
+    # sessions already waiting are still replaced
+    assert scheduler.submit("s2", "d")
+    predictor.release.set()
+    scheduler.close(timeout=5)
+
+    assert [screenshot for _, screenshot in predictor.processed] == ["first", "d", "b"]
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_results_are_emitted_as_events(scheduler):
+    results = []
+    scheduler.on_result = lambda session, result: results.append((session, result))
+    scheduler.predictor.release.set()
+    scheduler.submit("s1", "first")
+    scheduler.submit("s2", "broken")
+    scheduler.close(timeout=5)
+
+    stats = [[0] * 6] * 10
+    details = (stats, (1.5, ["label_Ana"] * 5, 0.25))
+    assert scheduler.events_handler.events == [
+        ("socket", HandlerEvent.GAME_PREDICTION, 0.25),
+        ("socket", HandlerEvent.GAME_DETAILS, details),
+    ]
+    assert results == [("s1", details)]
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_closed_scheduler_rejects_submissions(scheduler):
+    scheduler.close(timeout=5)
+    with pytest.raises(RuntimeError):
+        scheduler.submit("s1", "late")
+
+
+def test_predictor_submits_to_its_scheduler():
+    from models.OW2_new.predictor import UserPredictor
+
+    blocking, handler = BlockingPredictor(), RecordingHandler()
+    user_predictor = UserPredictor(warm_up=False, start_metrics=False)
+    user_predictor.get_stats_and_details = blocking.get_stats_and_details
+    user_predictor.predict_probability = blocking.predict_probability
+
+    scheduler = user_predictor.screenshot_scheduler(handler, "socket", workers=1, max_pending_sessions=1)
+    try:
+        assert user_predictor.submit_screenshot("s1", "first")
+        assert blocking.started.wait(5)
+        # a burst of s1 collapses into its newest screenshot; s2 is rejected while s1 waits
+        for screenshot in ("second", "third", "fourth"):
+            assert user_predictor.submit_screenshot("s1", screenshot)
+        assert not user_predictor.submit_screenshot("s2", "other")
+        assert user_predictor.screenshot_scheduler() is scheduler
+    finally:
+        blocking.release.set()
+        scheduler.close(timeout=5)
+
+    assert blocking.processed == [("s1", "first"), ("s1", "fourth")]
+    assert [event for _, event, _ in handler.events] == [HandlerEvent.GAME_PREDICTION, HandlerEvent.GAME_DETAILS] * 2
+    assert scheduler.stats()["rejected"] == 1
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from models.OW2_new.image_utils import Frame, split_image
+from models.OW2_new.template_locator import TemplateLocator
+from models.OW2_new.tests.conftest import sample_path
+
+
+@pytest.fixture(scope="module")
+def top_half():
+    return split_image(Frame.load(sample_path(1)).processed)[0]
+
+
+def shifted(image, dx, dy):
+    """The image moved by (dx, dy) pixels, padded with background."""
+    moved = np.zeros_like(image)
+    moved[dy:, dx:] = image[:image.shape[0] - dy, :image.shape[1] - dx]
+    return moved
+
+
+def test_window_search_after_first_match(top_half):
+    locator = TemplateLocator()
+    first = locator.locate(top_half, key="s")
+    assert first.score >= locator.min_score
+    assert (locator.full_searches, locator.window_hits) == (1, 0)
+
+    # a small move stays inside the search window
+    second = locator.locate(shifted(top_half, 5, 3), key="s")
+    assert (locator.full_searches, locator.window_hits) == (1, 1)
+    assert second.top_left == (first.top_left[0] + 5, first.top_left[1] + 3)
+
+
+def test_full_search_when_the_table_moved_out_of_the_window(top_half):
+    locator = TemplateLocator(search_margin=8)
+    first = locator.locate(top_half, key="s")
+    moved = locator.locate(shifted(top_half, 60, 0), key="s")
+    assert (locator.full_searches, locator.window_hits) == (2, 0)
+    assert moved.top_left == (first.top_left[0] + 60, first.top_left[1])
+    assert moved.top_left == locator.locate(shifted(top_half, 60, 0), key="s").top_left
+    assert locator.window_hits == 1
+
+
+def test_unconfident_matches_are_not_remembered(top_half):
+    locator = TemplateLocator()
+    locator.locate(top_half, key="s")
+    blank = np.zeros_like(top_half)
+    assert locator.locate(blank, key="s").score < locator.min_score
+    assert locator.full_searches == 2
+    locator.locate(top_half, key="s")
+    assert (locator.full_searches, locator.window_hits) == (3, 0)
+
+
+def test_positions_are_per_key_and_bounded(top_half):
+    locator = TemplateLocator(max_positions=2)
+    for key in ("a", "b", "c"):
+        locator.locate(top_half, key=key)
+    assert [memory_key[0] for memory_key in locator._last_matches] == ["b", "c"]
+
+    locator.reset("b")
+    locator.locate(top_half, key="b")
+    locator.locate(top_half, key="c")
+    assert (locator.full_searches, locator.window_hits) == (4, 1)
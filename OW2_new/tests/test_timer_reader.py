@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+import pytest
+
+from models.OW2_new import metrics, predictor
+from models.OW2_new.image_parser import ImageParser
+from models.OW2_new.image_utils import Frame
+from models.OW2_new.ocr_engine import OCREngine, TesserocrEngine
+from models.OW2_new.predictor import UserPredictor, header_time_minutes
+from models.OW2_new.tests.conftest import sample_path
+from models.OW2_new.timer_reader import TimerReader, reading_minutes
+
+HEADER_OCR_CONFIG = r'--oem 3 --psm 6'
+
+
+@pytest.fixture(scope="module")
+def header_ocr():
+    engine = TesserocrEngine(max_workers=1)
+    yield engine
+    engine.close()
+
+
+@pytest.mark.parametrize("number", [1, 2, 3])
+def test_timer_matches_header_ocr(header_ocr, number):
+    header = Frame.load(sample_path(number)).header
+    expected = header_time_minutes(header_ocr.image_to_string(header, config=HEADER_OCR_CONFIG))
+    assert expected is not None
+
+    reading = TimerReader().read(header)
+    assert reading is not None and reading.source == "timer"
+    assert reading_minutes(reading) == pytest.approx(expected)
+
+
+def test_timer_region_is_remembered_per_key():
+    reader = TimerReader()
+    header = Frame.load(sample_path(3)).header
+    first = reader.read(header, key="match")
+    assert reader.read(header, key="match") == first
+    assert (reader.full_searches, reader.region_hits) == (1, 1)
+
+    # the timer moved: the remembered region misses and the header is searched again
+    moved = np.zeros_like(header)
+    moved[:, 40:] = header[:, :-40]
+    assert reader.read(moved, key="match").elapsed == first.elapsed
+    assert reader.full_searches == 2
+
+    reader.reset("match")
+    reader.read(header, key="match")
+    assert reader.full_searches == 3
+
+
+def test_no_reading_without_a_timer():
+    reader = TimerReader()
+    header = Frame.load(sample_path(1)).header
+    assert reader.read(np.zeros_like(header)) is None
+    # the same header without its colors: the timer is not located
+    gray = cv2.cvtColor(cv2.cvtColor(header, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+    assert reader.read(gray) is None
+    # only the minutes of the timer are not a time
+    top, bottom, left, right = reader.locate(header)
+    assert reader.read_region(header[top:bottom, left:left + (right - left) // 4]) is None
+
+
+def test_header_time_minutes():
+    assert header_time_minutes("CONTROL - COMPETITIVE | LIJIANG TOWER\nTIME: 6:17\n") == pytest.approx(6 + 17 / 60)
+    assert header_time_minutes("TIME: 45") == pytest.approx(0.75)
+    assert header_time_minutes("CONTROL - COMPETITIVE") is None
+    assert header_time_minutes("TIME: ?") is None
+
+
+class NoReading:
+    def read(self, header, key=None):
+        return None
+
+    def reset(self, key=None):
+        pass
+
+
+class HeaderText(OCREngine):
+    """Answers every header OCR call with a fixed text."""
+
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def image_to_string(self, image, config=""):
+        self.calls += 1
+        return self.text
+
+
+@pytest.mark.parametrize("timer_reader", [None, NoReading()])
+def test_header_ocr_is_the_fallback(monkeypatch, timer_reader):
+    header_text = HeaderText("CONTROL - COMPETITIVE | LIJIANG TOWER\nTIME: 6:17\n")
+    classifier = ImageParser(ocr_backend=header_text, stats_ocr_backend="digits", timer_reader=timer_reader)
+    monkeypatch.setattr(predictor, "_classifier", classifier)
+    fallbacks = metrics.snapshot()["counters"].get("timer_fallbacks", 0)
+
+    stats, (time_in_minutes, _) = UserPredictor(warm_up=False).get_stats_and_details(sample_path(3))
+    assert time_in_minutes == pytest.approx(6 + 17 / 60)
+    assert header_text.calls == 1
+    assert metrics.snapshot()["counters"]["timer_fallbacks"] == fallbacks + 1
+    assert len(stats) == 10
+
+
+def test_timer_reading_skips_header_ocr(monkeypatch):
+    header_text = HeaderText("TIME: 0:01")
+    classifier = ImageParser(ocr_backend=header_text, stats_ocr_backend="digits")
+    monkeypatch.setattr(predictor, "_classifier", classifier)
+
+    _, (time_in_minutes, _) = UserPredictor(warm_up=False).get_stats_and_details(sample_path(3))
+    assert time_in_minutes == pytest.approx(6 + 17 / 60)
+    assert header_text.calls == 0
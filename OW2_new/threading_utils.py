@@ -0,0 +1,44 @@
+"""Helpers for running work on real OS threads inside the eventlet based app."""
+
+import threading
+
+
+def native_threading():
+    """
+    Return the OS threading module, even if eventlet monkey patched ``threading`` into green threads.
+
+    CPU bound work (model loading, inference, OCR) on a green thread blocks the Socket.IO event loop until it
+    finishes, so background work and the locks it shares must come from the original module.
+    """
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return threading
+    if patcher.is_monkey_patched("thread"):
+        return patcher.original("threading")
+    return threading
+
+
+def start_daemon_thread(target, name=None, args=()):
+    """Start target on a native daemon thread and return the thread."""
+    thread = native_threading().Thread(target=target, name=name, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def eventlet_patched():
+    """True if eventlet monkey patched threading, i.e. threading.Thread creates green threads."""
+    return native_threading() is not threading
+
+
+def run_blocking(func, *args, **kwargs):
+    """
+    Run a CPU bound call without blocking the event loop.
+
+    Under eventlet the call runs in eventlet's native thread pool (tpool) while the calling green thread yields;
+    otherwise it simply runs on the calling thread.
+    """
+    if eventlet_patched():
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
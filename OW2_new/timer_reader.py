@@ -0,0 +1,189 @@
+"""Reader of the match timer ("TIME: 6:17") on the scoreboard header.
+
+The timer value is the only orange text of the header, so it is located with an HSV color mask instead of
+OCR of the whole header. Its bounding box is remembered per key (session) and header size, and later
+screenshots only mask that small region. The glyphs are split with column projections; the colon is the
+narrow glyph made of two dots, and the digits are classified by the DigitRecognizer (the timer uses the
+scoreboard font). The reading is only returned when it is a valid M:SS time and every digit matched
+confidently; otherwise callers fall back to header OCR.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+import cv2
+import numpy as np
+
+# HSV range (OpenCV hue is 0-180) of the orange timer text
+TIMER_HSV_LOWER = (5, 100, 120)
+TIMER_HSV_UPPER = (25, 255, 255)
+
+TimerReading = namedtuple("TimerReading", ["elapsed", "confidence", "source"])
+
+
+def reading_minutes(reading):
+    """The elapsed time of a TimerReading in minutes, as the pipeline uses it."""
+    return reading.elapsed.total_seconds() / 60.0
+
+
+class TimerReader:
+    """Read the match timer from header crops with a color mask and digit templates."""
+
+    def __init__(self, recognizer=None, min_confidence=0.6, min_pixels=40, margin=4, max_glyph_gap=0,
+                 max_regions=64):
+        """
+        :param recognizer: DigitRecognizer classifying the digits. Created with the default templates if not given.
+        :param min_confidence: Readings whose weakest digit scores below this are rejected.
+        :param min_pixels: Minimum number of orange pixels of a timer.
+        :param margin: Pixels around the located timer included in the remembered region; the region also
+            leaves room on the right for two more digits (9:59 -> 10:00).
+        :param max_glyph_gap: Column runs separated by at most this many empty columns are one glyph.
+        :param max_regions: Number of remembered timer regions; the least recently used one is forgotten.
+        """
+        if recognizer is None:
+            from models.OW2_new.digit_recognizer import DigitRecognizer
+            recognizer = DigitRecognizer()
+        self.recognizer = recognizer
+        self.min_confidence = min_confidence
+        self.min_pixels = min_pixels
+        self.margin = margin
+        self.max_glyph_gap = max_glyph_gap
+        self.max_regions = max_regions
+
+        self._regions = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.region_hits = 0
+        self.full_searches = 0
+
+    @staticmethod
+    def timer_mask(image):
+        """Binary mask (uint8, 255 = ink) of the orange pixels of a BGR image."""
+        return cv2.inRange(cv2.cvtColor(image, cv2.COLOR_BGR2HSV), TIMER_HSV_LOWER, TIMER_HSV_UPPER)
+
+    def locate(self, header):
+        """
+        Find the timer in a whole header crop.
+
+        :param header: BGR header image.
+        :return: The region (top, bottom, left, right) around the timer, or None if there is no orange text.
+        """
+        ys, xs = np.nonzero(self.timer_mask(header))
+        if len(ys) < self.min_pixels:
+            return None
+        height = ys.max() - ys.min() + 1
+        top = max(int(ys.min()) - self.margin, 0)
+        bottom = min(int(ys.max()) + 1 + self.margin, header.shape[0])
+        left = max(int(xs.min()) - self.margin, 0)
+        # digits are about as wide as 0.7 of their height
+        right = min(int(xs.max()) + 1 + self.margin + int(1.5 * height), header.shape[1])
+        return top, bottom, left, right
+
+    def segment(self, mask):
+        """
+        Split a timer mask into glyphs.
+
+        :param mask: Binary mask of the timer region.
+        :return: List of (kind, crop) in reading order, kind being "digit" or "colon".
+        """
+        ink = mask > 0
+        columns = np.pad(ink.any(axis=0), 1).astype(np.int8)
+        edges = np.diff(columns)
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+        runs = []
+        for left, right in zip(starts, ends):
+            if runs and left - runs[-1][1] <= self.max_glyph_gap:
+                runs[-1] = (runs[-1][0], right)
+            else:
+                runs.append((left, right))
+        if not runs:
+            return []
+
+        widths = np.array([right - left for left, right in runs])
+        glyphs = []
+        for (left, right), width in zip(runs, widths):
+            rows = ink[:, left:right].any(axis=1)
+            filled = np.flatnonzero(rows)
+            crop = mask[filled[0]:filled[-1] + 1, left:right]
+            # the colon is narrow and made of two dots, i.e. its rows have a gap
+            gap = not rows[filled[0]:filled[-1] + 1].all()
+            kind = "colon" if gap and width <= 0.6 * widths.max() else "digit"
+            glyphs.append((kind, crop))
+        return glyphs
+
+    def read_region(self, region_image):
+        """
+        Read the timer in a BGR image containing only it (plus background).
+
+        :return: A TimerReading, or None if the glyphs are not a confident M:SS time.
+        """
+        glyphs = self.segment(self.timer_mask(region_image))
+        kinds = [kind for kind, _ in glyphs]
+        if kinds.count("colon") != 1:
+            return None
+        colon = kinds.index("colon")
+        # M:SS up to MMM:SS
+        if not 1 <= colon <= 3 or len(glyphs) - colon - 1 != 2:
+            return None
+
+        digit_crops = [crop for kind, crop in glyphs if kind == "digit"]
+        segmented, owners = self.recognizer.segment(digit_crops)
+        if len(owners) != len(digit_crops) or not np.array_equal(owners, np.arange(len(digit_crops))):
+            return None
+        digits, scores = self.recognizer.classify(segmented)
+
+        minutes = int("".join(str(d) for d in digits[:colon]))
+        seconds = int("".join(str(d) for d in digits[colon:]))
+        confidence = float(scores.min())
+        if seconds >= 60 or confidence < self.min_confidence:
+            return None
+        return TimerReading(timedelta(minutes=minutes, seconds=seconds), confidence, "timer")
+
+    def read(self, header, key=None):
+        """
+        Read the match timer of a header crop.
+
+        :param header: BGR header image (Frame.header).
+        :param key: Optional key (e.g. session) under which the timer region is remembered.
+        :return: A TimerReading, or None if no confident reading was found.
+        """
+        memory_key = (key, header.shape)
+        with self._lock:
+            region = self._regions.get(memory_key)
+
+        if region is not None:
+            top, bottom, left, right = region
+            reading = self.read_region(header[top:bottom, left:right])
+            if reading is not None:
+                with self._lock:
+                    self.region_hits += 1
+                    if memory_key in self._regions:
+                        self._regions.move_to_end(memory_key)
+                return reading
+
+        # no remembered region, or the timer moved
+        with self._lock:
+            self.full_searches += 1
+        region = self.locate(header)
+        if region is None:
+            return None
+        top, bottom, left, right = region
+        reading = self.read_region(header[top:bottom, left:right])
+        if reading is not None:
+            with self._lock:
+                self._regions[memory_key] = region
+                self._regions.move_to_end(memory_key)
+                while len(self._regions) > self.max_regions:
+                    self._regions.popitem(last=False)
+        return reading
+
+    def reset(self, key=None):
+        """Forget remembered timer regions, either for one key or all of them."""
+        with self._lock:
+            if key is None:
+                self._regions.clear()
+            else:
+                for memory_key in [k for k in self._regions if k[0] == key]:
+                    self._regions.pop(memory_key, None)